@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Threshold alert rules engine
+- Rules (above / below a threshold, or change within a time window) are compiled
+  once into device, room+kind and kind indexes
+- Each device's applicable rules are resolved on its first reading and cached,
+  so a reading is checked only against the rules that match it
+- Per (rule, device) state machines: a condition must hold for the rule's
+  duration before the alert fires, and it resolves only once the value crosses
+  the clear level (hysteresis)
+- Fired / resolved events go to listeners (SSE, MQTT) and a bounded event log
+
+Rules come from ALERT_RULES_FILE (JSON list) or DEFAULT_RULES. Rule fields:
+id, condition (above | below | change), threshold, optional kind / room / device,
+clear (defaults to threshold), for (seconds the condition must hold),
+window (seconds, change rules), severity and description.
+"""
+
+import os
+import json
+import threading
+from collections import deque
+
+from pipeline import Sink
+from structured_log import get_logger
+
+# Alert configuration - can be overridden by environment variables
+ALERT_CONFIG = {
+    'rules_file': os.getenv('ALERT_RULES_FILE'),
+    'history': int(os.getenv('ALERT_HISTORY', '500')),  # fired / resolved events kept in memory
+    'mqtt': os.getenv('ALERT_MQTT', 'false').lower() == 'true'
+}
+
+log = get_logger('Alerts')
+
+CONDITIONS = ('above', 'below', 'change')
+SEVERITIES = ('info', 'warning', 'critical')
+
+DEFAULT_RULES = [
+    {'id': 'co2-high', 'kind': 'co2', 'condition': 'above', 'threshold': 1000, 'clear': 950, 'for': 300,
+     'severity': 'warning', 'description': 'CO2 above 1000 ppm for 5 minutes'},
+    {'id': 'temperature-swing', 'kind': 'temperature', 'condition': 'change', 'threshold': 5.0, 'clear': 3.0,
+     'window': 600, 'severity': 'info', 'description': 'Temperature changed by more than 5°C within 10 minutes'}
+]
+
+
+class AlertRule:
+    """One compiled rule"""
+
+    __slots__ = ('index', 'id', 'condition', 'threshold', 'clear', 'duration', 'window',
+                 'kind', 'room_id', 'device_id', 'severity', 'description')
+
+    def __init__(self, index, spec):
+        self.index = index
+        self.id = str(spec.get('id') or f'rule-{index + 1}')
+        self.condition = spec.get('condition', 'above')
+        if self.condition not in CONDITIONS:
+            raise ValueError(f"Rule '{self.id}': condition must be one of {', '.join(CONDITIONS)}")
+        if spec.get('threshold') is None:
+            raise ValueError(f"Rule '{self.id}': threshold is required")
+        self.threshold = float(spec['threshold'])
+        self.clear = float(spec['clear']) if spec.get('clear') is not None else self.threshold
+        self.duration = float(spec.get('for', 0))
+        self.window = float(spec.get('window', 600))
+        self.kind = spec.get('kind')
+        self.room_id = spec.get('room')
+        self.device_id = spec.get('device')
+        self.severity = spec.get('severity', 'warning')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule '{self.id}': severity must be one of {', '.join(SEVERITIES)}")
+        self.description = spec.get('description', '')
+
+    def matches(self, kind, room_id):
+        return (self.kind is None or self.kind == kind) and (self.room_id is None or self.room_id == room_id)
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'condition': self.condition, 'threshold': self.threshold, 'clear': self.clear,
+            'for': self.duration, 'window': self.window if self.condition == 'change' else None,
+            'kind': self.kind, 'room': self.room_id, 'device': self.device_id,
+            'severity': self.severity, 'description': self.description
+        }
+
+
+def load_rules(path=None):
+    """Rule specs from a JSON file (a list, or {"rules": [...]}), else DEFAULT_RULES"""
+    path = path or ALERT_CONFIG['rules_file']
+    if not path:
+        return DEFAULT_RULES
+    with open(path, 'r', encoding='utf-8') as f:
+        specs = json.load(f)
+    return specs['rules'] if isinstance(specs, dict) else specs
+
+
+class _RuleState:
+    """Per (rule, device) state machine"""
+
+    __slots__ = ('active', 'pending_since', 'started_at', 'maxima', 'minima')
+
+    def __init__(self):
+        self.active = False
+        self.pending_since = None  # epoch seconds the condition started holding
+        self.started_at = None  # ISO time the alert fired
+        self.maxima = None  # change rules: monotonic deques of (ts, value) over the window
+        self.minima = None
+
+
+class AlertEngine:
+    """Evaluates compiled rules against readings and keeps active alerts"""
+
+    def __init__(self, rules=None, history=None):
+        self.rules = [AlertRule(index, spec) for index, spec in enumerate(load_rules() if rules is None else rules)]
+        ids = [rule.id for rule in self.rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError('Alert rule ids must be unique')
+
+        # Indexes: device id, (room id, kind) and kind (None = any); resolved per device on first sight
+        self._by_device = {}
+        self._by_room = {}
+        self._by_kind = {}
+        for rule in self.rules:
+            if rule.device_id:
+                self._by_device.setdefault(rule.device_id, []).append(rule)
+            elif rule.room_id:
+                self._by_room.setdefault((rule.room_id, rule.kind), []).append(rule)
+            else:
+                self._by_kind.setdefault(rule.kind, []).append(rule)
+        self._device_rules = {}  # (device_id, kind, room_id) -> tuple of rules
+
+        self._states = {}  # (rule index, device_id) -> _RuleState
+        self.active = {}  # (rule id, device_id) -> fired event
+        self.events = deque(maxlen=history or ALERT_CONFIG['history'])
+        self.event_seq = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        self.evaluations = 0
+        self.fired_count = 0
+        self.resolved_count = 0
+
+    def add_listener(self, callback):
+        """Call callback(event) for every fired / resolved event"""
+        self._listeners.append(callback)
+
+    def rules_for(self, device_id, kind, room_id):
+        """Rules that apply to one device (compiled once per device)"""
+        key = (device_id, kind, room_id)
+        rules = self._device_rules.get(key)
+        if rules is None:
+            candidates = (self._by_device.get(device_id, []) + self._by_room.get((room_id, kind), [])
+                          + self._by_room.get((room_id, None), []) + self._by_kind.get(kind, [])
+                          + self._by_kind.get(None, []))
+            rules = self._device_rules[key] = tuple(
+                sorted((rule for rule in candidates if rule.matches(kind, room_id)), key=lambda rule: rule.index))
+        return rules
+
+    def _metric(self, rule, state, value, ts):
+        """(value the rule compares, triggered, cleared)"""
+        if rule.condition == 'above':
+            return value, value > rule.threshold, value <= rule.clear
+        if rule.condition == 'below':
+            return value, value < rule.threshold, value >= rule.clear
+        # change: spread between the highest and lowest value within the window
+        if state.maxima is None:
+            state.maxima, state.minima = deque(), deque()
+        cutoff = ts - rule.window
+        for queue, keep in ((state.maxima, value.__lt__), (state.minima, value.__gt__)):
+            while queue and not keep(queue[-1][1]):
+                queue.pop()
+            queue.append((ts, value))
+            while queue[0][0] < cutoff:
+                queue.popleft()
+        change = state.maxima[0][1] - state.minima[0][1]
+        return change, change > rule.threshold, change <= rule.clear
+
+    def _event(self, kind, rule, device, value, metric, iso, started_at):
+        self.event_seq += 1
+        return {
+            'seq': self.event_seq,
+            'event': kind,
+            'rule_id': rule.id,
+            'severity': rule.severity,
+            'condition': rule.condition,
+            'threshold': rule.threshold,
+            'device_id': device.device_id,
+            'kind': device.kind,
+            'room_id': device.room_id,
+            'value': value,
+            'metric': round(metric, 4),
+            'started_at': started_at,
+            'timestamp': iso,
+            'description': rule.description
+        }
+
+    def evaluate(self, batch):
+        """Check every reading against its rules; returns the events produced"""
+        ts = batch.timestamp.timestamp()
+        iso = batch.iso_timestamp
+        produced = []
+        with self._lock:
+            for reading in batch.readings:
+                device = reading.device
+                rules = self.rules_for(device.device_id, device.kind, device.room_id)
+                if not rules:
+                    continue
+                value = float(reading.value)
+                for rule in rules:
+                    self.evaluations += 1
+                    key = (rule.index, device.device_id)
+                    state = self._states.get(key)
+                    if state is None:
+                        state = self._states[key] = _RuleState()
+                    metric, triggered, cleared = self._metric(rule, state, value, ts)
+                    if not state.active:
+                        if not triggered:
+                            state.pending_since = None
+                            continue
+                        if state.pending_since is None:
+                            state.pending_since = ts
+                        if ts - state.pending_since >= rule.duration:
+                            state.active = True
+                            state.started_at = iso
+                            event = self._event('fired', rule, device, reading.value, metric, iso, iso)
+                            self.active[(rule.id, device.device_id)] = event
+                            self.fired_count += 1
+                            produced.append(event)
+                    elif cleared:
+                        state.active = False
+                        state.pending_since = None
+                        event = self._event('resolved', rule, device, reading.value, metric, iso, state.started_at)
+                        self.active.pop((rule.id, device.device_id), None)
+                        self.resolved_count += 1
+                        produced.append(event)
+            self.events.extend(produced)
+        for event in produced:
+            for callback in self._listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    log.error('alerts.listener_error', "Listener error: {error}", error=e)
+        return produced
+
+    def snapshot(self, since=None, severity=None, kind=None, room_id=None):
+        """Active alerts and logged events (after seq `since`), optionally filtered"""
+        def wanted(event):
+            return ((severity is None or event['severity'] == severity) and (kind is None or event['kind'] == kind)
+                    and (room_id is None or event['room_id'] == room_id))
+        with self._lock:
+            return {
+                'active': [event for event in self.active.values() if wanted(event)],
+                'events': [event for event in self.events if (since is None or event['seq'] > since) and wanted(event)],
+                'last_seq': self.event_seq
+            }
+
+    def events_since(self, seq):
+        """(current sequence, events after seq) for forwarding to other processes"""
+        with self._lock:
+            return self.event_seq, [event for event in self.events if event['seq'] > seq]
+
+    def get_stats(self):
+        return {
+            'rules': len(self.rules),
+            'devices_indexed': len(self._device_rules),
+            'states': len(self._states),
+            'evaluations': self.evaluations,
+            'active': len(self.active),
+            'fired': self.fired_count,
+            'resolved': self.resolved_count
+        }
+
+
+class AlertSink(Sink):
+    """Runs the AlertEngine on every batch"""
+
+    def __init__(self, engine, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+
+    def write(self, batch):
+        self.engine.evaluate(batch)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(self.engine.get_stats())
+        return stats
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact binary encodings for history series (content negotiation on the history endpoints)
+- msgpack (Accept: application/msgpack): the response fields plus a 'series' list;
+  every series carries 't' (epoch milliseconds) and 'v' arrays, needs the msgpack package
+- raw (Accept: application/vnd.digitaltwin.columns): little-endian columns that
+  decode with one np.frombuffer call per array:
+
+    magic b'DTCF' | uint16 version (1) | uint16 reserved | uint32 header length
+    header: UTF-8 JSON (response fields, series metadata with 'count'),
+            zero-padded so the columns start on an 8-byte boundary
+    per series, in header order: int64[count] t (epoch ms), float64[count] v (NaN = missing)
+
+Series are in ascending time order in both formats.
+"""
+
+import sys
+import math
+import struct
+from array import array
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+import json_codec
+
+FORMATS = ('json', 'msgpack', 'raw')
+MIMETYPES = {
+    'msgpack': 'application/msgpack',
+    'raw': 'application/vnd.digitaltwin.columns'
+}
+# Accept header values -> format
+ACCEPT = {
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    MIMETYPES['raw']: 'raw'
+}
+
+RAW_MAGIC = b'DTCF'
+RAW_VERSION = 1
+_RAW_PREAMBLE = struct.Struct('<4sHHI')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def available(fmt):
+    return fmt != 'msgpack' or MSGPACK_AVAILABLE
+
+
+def epoch_ms(timestamps):
+    """Epoch milliseconds for datetimes (naive ones are local time, like the stored history)"""
+    return [round(timestamp.timestamp() * 1000) for timestamp in timestamps]
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if _BIG_ENDIAN:
+        column.byteswap()
+    return column.tobytes()
+
+
+def pack_msgpack(document):
+    """msgpack body for a response document whose series hold 't' / 'v' lists"""
+    return msgpack.packb(document, use_bin_type=True, default=json_codec.default)
+
+
+def pack_raw(document):
+    """Raw columnar body; the series arrays move out of the JSON header into the columns"""
+    header = dict(document)
+    series = header.pop('series')
+    header['series'] = [{key: value for key, value in item.items() if key not in ('t', 'v')} for item in series]
+    header_bytes = json_codec.dumpb(header)
+    header_bytes += b'\0' * (-(_RAW_PREAMBLE.size + len(header_bytes)) % 8)
+
+    parts = [_RAW_PREAMBLE.pack(RAW_MAGIC, RAW_VERSION, 0, len(header_bytes)), header_bytes]
+    for item in series:
+        values = item['v']
+        if None in values:
+            values = [math.nan if value is None else value for value in values]
+        parts.append(_column('q', item['t']))
+        parts.append(_column('d', values))
+    return b''.join(parts)
+
+
+def encode(fmt, document):
+    """(body, mimetype) for 'msgpack' or 'raw'"""
+    if fmt == 'msgpack':
+        return pack_msgpack(document), MIMETYPES['msgpack']
+    return pack_raw(document), MIMETYPES['raw']
@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os
+import time
+import functools
+import threading
 import mysql.connector
 from mysql.connector import Error
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import event, create_engine, insert, select, update, func, cast, case, literal, literal_column, null, Column, Integer, String, Float, DateTime, Boolean, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-import json
+from sqlalchemy.orm import sessionmaker, aliased
+from datetime import datetime, timedelta
+import json_codec
+from query_cache import QueryCache, QueryScope
+from metrics import Counter, Histogram
+from profiling import SlowQueryLog
+from structured_log import get_logger
 
 # Database configuration - can be overridden by environment variables
 DB_CONFIG = {
@@ -23,6 +30,8 @@ DB_CONFIG = {
 # Use SQLite for local testing if MySQL is not available
 USE_SQLITE = os.getenv('USE_SQLITE', 'false').lower() == 'true'
 
+log = get_logger('DB')
+
 Base = declarative_base()
 
 # Separate tables for each sensor type - matching actual database structure
@@ -113,25 +122,101 @@ class SensorData(Base):
     def __repr__(self):
         return f"<SensorData(device_id='{self.device_id}', kind='{self.kind}', value={self.value}, timestamp='{self.timestamp}')>"
 
+# Hourly / daily energy buckets maintained by the energy accumulator (energy.py)
+class EnergyCheckpoint(Base):
+    __tablename__ = 'energy_checkpoints'
+    __table_args__ = (UniqueConstraint('period', 'bucket_start', 'scope', 'scope_id', 'kind', name='uq_energy_bucket'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scope = Column(String(10), nullable=False)  # device, room or kind
+    scope_id = Column(String(50), nullable=False, index=True)
+    kind = Column(String(20), nullable=False)
+    period = Column(String(5), nullable=False)  # hour or day
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    energy_wh = Column(Float, nullable=False, default=0.0)  # energy within the bucket
+    cumulative_wh = Column(Float, nullable=False, default=0.0)  # running total at the bucket's last update
+    updated_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<EnergyCheckpoint(scope='{self.scope}', scope_id='{self.scope_id}', period='{self.period}', bucket_start='{self.bucket_start}', energy_wh={self.energy_wh})>"
+
+# Sensor kind -> (table class, column holding the charted value)
+KIND_TABLES = {
+    'temperature': (TemperatureData, 'temperature_c'),
+    'humidity': (HumidityData, 'humidity_percent'),
+    'co2': (CO2Data, 'co2_ppm'),
+    'light': (LightData, 'power_watts'),
+    'solar': (SolarData, 'power_watts')
+}
+
+AGGREGATE_GROUPS = ('device', 'room', 'kind')
+AGGREGATE_FUNCTIONS = ('avg', 'min', 'max', 'count', 'sum', 'twa')  # twa: time-weighted average
+
+# Query timing from SQLAlchemy engine events, labelled with the DatabaseManager method that ran it
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Database statement execution time', labels=('operation',))
+DB_QUERY_ERRORS = Counter('db_query_errors_total', 'Database statements that raised', labels=('operation',))
+_current_operation = threading.local()
+slow_queries = SlowQueryLog()  # statements slower than SLOW_QUERY_MS, served by /api/debug-slow-queries
+
+def _operation(method):
+    """Label the statements a DatabaseManager method executes with its name (outermost call wins)"""
+    name = method.__name__
+    
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if getattr(_current_operation, 'name', None) is not None:
+            return method(*args, **kwargs)
+        _current_operation.name = name
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _current_operation.name = None
+    return wrapper
+
+def _install_query_metrics(engine):
+    """Time every statement executed through the engine (metrics and the slow-query log)"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_started'].pop()
+        operation = getattr(_current_operation, 'name', None) or 'other'
+        DB_QUERY_SECONDS.labels(operation).observe(duration)
+        if duration >= slow_queries.threshold:
+            slow_queries.record(statement, parameters, duration, cursor.rowcount, operation, executemany)
+    
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+        DB_QUERY_ERRORS.labels(getattr(_current_operation, 'name', None) or 'other').inc()
+
 class DatabaseManager:
     def __init__(self):
         self.engine = None
         self.Session = None
+        self.query_cache = QueryCache()  # read results, invalidated by the save methods below
         self.connect()
     
+    @_operation
     def connect(self):
         """Create database connection and session"""
         try:
             if USE_SQLITE:
                 # Use SQLite for local testing
                 connection_string = "sqlite:///sensor_data.db"
-                print("[DB] Using SQLite for local testing")
+                log.info('db.sqlite', "Using SQLite for local testing")
             else:
                 # Create SQLAlchemy engine for MySQL
                 connection_string = f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
-                print(f"[DB] Connecting to MySQL: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+                log.info('db.connecting', "Connecting to MySQL: {host}:{port}/{database}",
+                         host=DB_CONFIG['host'], port=DB_CONFIG['port'], database=DB_CONFIG['database'])
             
             self.engine = create_engine(connection_string, echo=False)
+            _install_query_metrics(self.engine)
             
             # Create session factory
             self.Session = sessionmaker(bind=self.engine)
@@ -140,116 +225,183 @@ class DatabaseManager:
             Base.metadata.create_all(self.engine)
             
             if USE_SQLITE:
-                print(f"[DB] Connected to SQLite database: sensor_data.db")
+                log.info('db.connected', "Connected to SQLite database: sensor_data.db")
             else:
-                print(f"[DB] Connected to MySQL database: {DB_CONFIG['database']}")
+                log.info('db.connected', "Connected to MySQL database: {database}", database=DB_CONFIG['database'])
             
         except Exception as e:
-            print(f"[DB] Error connecting to database: {e}")
+            log.error('db.connect_failed', "Error connecting to database: {error}", error=e)
             if not USE_SQLITE:
-                print("[DB] Falling back to SQLite for local testing...")
+                log.warning('db.fallback', "Falling back to SQLite for local testing...")
                 self._fallback_to_sqlite()
             else:
                 raise
     
+    @_operation
     def _fallback_to_sqlite(self):
         """Fallback to SQLite if MySQL connection fails"""
         try:
             connection_string = "sqlite:///sensor_data.db"
             self.engine = create_engine(connection_string, echo=False)
+            _install_query_metrics(self.engine)
             self.Session = sessionmaker(bind=self.engine)
             Base.metadata.create_all(self.engine)
-            print(f"[DB] Fallback: Connected to SQLite database: sensor_data.db")
+            log.info('db.connected', "Fallback: Connected to SQLite database: sensor_data.db")
         except Exception as e:
-            print(f"[DB] Fallback to SQLite also failed: {e}")
+            log.error('db.connect_failed', "Fallback to SQLite also failed: {error}", error=e)
             raise
     
     def get_session(self):
         """Get a new database session"""
         return self.Session()
     
+    def _sensor_row(self, data_dict):
+        """Map a sensor data dict to its table class and column values"""
+        # Parse timestamp
+        timestamp = datetime.fromtimestamp(data_dict.get('ts', 0) / 1000)
+        
+        # Get sensor type
+        kind = data_dict.get('kind', '').lower()
+        device_id = data_dict.get('deviceId', '')
+        raw_data = json_codec.dumps(data_dict)
+        
+        # Pick appropriate sensor table based on type
+        if kind == 'temperature':
+            return TemperatureData, {
+                'device_id': device_id,
+                'room_id': data_dict.get('roomId'),
+                'temperature_c': data_dict.get('value'),  # Use actual column name
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+        elif kind == 'humidity':
+            return HumidityData, {
+                'device_id': device_id,
+                'room_id': data_dict.get('roomId'),
+                'humidity_percent': data_dict.get('value'),  # Use actual column name
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+        elif kind == 'co2':
+            return CO2Data, {
+                'device_id': device_id,
+                'room_id': data_dict.get('roomId'),
+                'co2_ppm': int(data_dict.get('value', 0)) if data_dict.get('value') is not None else None,  # Use actual column name
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+        elif kind == 'light':
+            return LightData, {
+                'device_id': device_id,
+                'room_id': data_dict.get('roomId'),
+                'is_on': data_dict.get('on'),  # Use actual column name
+                'power_watts': data_dict.get('powerW'),  # Use actual column name
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+        elif kind == 'solar':
+            return SolarData, {
+                'device_id': device_id,
+                'power_watts': data_dict.get('powerW'),  # Use actual column name
+                'voltage_volts': data_dict.get('voltage'),  # Use actual column name
+                'current_amps': data_dict.get('current'),  # Use actual column name
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+        else:
+            # Fallback to legacy table for unknown sensor types
+            return SensorData, {
+                'device_id': device_id,
+                'kind': data_dict.get('kind', ''),
+                'room_id': data_dict.get('roomId'),
+                'value': data_dict.get('value'),
+                'unit': data_dict.get('unit'),
+                'power_w': data_dict.get('powerW'),
+                'voltage': data_dict.get('voltage'),
+                'current': data_dict.get('current'),
+                'on_status': data_dict.get('on'),
+                'timestamp': timestamp,
+                'raw_data': raw_data
+            }
+    
+    @_operation
     def save_sensor_data(self, data_dict):
         """Save sensor data to appropriate table based on sensor type"""
         session = self.get_session()
         try:
-            # Parse timestamp
-            timestamp = datetime.fromtimestamp(data_dict.get('ts', 0) / 1000)
-            
-            # Get sensor type
             kind = data_dict.get('kind', '').lower()
-            
-            # Create appropriate sensor data record based on type
-            if kind == 'temperature':
-                sensor_data = TemperatureData(
-                    device_id=data_dict.get('deviceId', ''),
-                    room_id=data_dict.get('roomId'),
-                    temperature_c=data_dict.get('value'),  # Use actual column name
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
-            elif kind == 'humidity':
-                sensor_data = HumidityData(
-                    device_id=data_dict.get('deviceId', ''),
-                    room_id=data_dict.get('roomId'),
-                    humidity_percent=data_dict.get('value'),  # Use actual column name
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
-            elif kind == 'co2':
-                sensor_data = CO2Data(
-                    device_id=data_dict.get('deviceId', ''),
-                    room_id=data_dict.get('roomId'),
-                    co2_ppm=int(data_dict.get('value', 0)) if data_dict.get('value') is not None else None,  # Use actual column name
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
-            elif kind == 'light':
-                sensor_data = LightData(
-                    device_id=data_dict.get('deviceId', ''),
-                    room_id=data_dict.get('roomId'),
-                    is_on=data_dict.get('on'),  # Use actual column name
-                    power_watts=data_dict.get('powerW'),  # Use actual column name
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
-            elif kind == 'solar':
-                sensor_data = SolarData(
-                    device_id=data_dict.get('deviceId', ''),
-                    power_watts=data_dict.get('powerW'),  # Use actual column name
-                    voltage_volts=data_dict.get('voltage'),  # Use actual column name
-                    current_amps=data_dict.get('current'),  # Use actual column name
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
-            else:
-                # Fallback to legacy table for unknown sensor types
-                sensor_data = SensorData(
-                    device_id=data_dict.get('deviceId', ''),
-                    kind=data_dict.get('kind', ''),
-                    room_id=data_dict.get('roomId'),
-                    value=data_dict.get('value'),
-                    unit=data_dict.get('unit'),
-                    power_w=data_dict.get('powerW'),
-                    voltage=data_dict.get('voltage'),
-                    current=data_dict.get('current'),
-                    on_status=data_dict.get('on'),
-                    timestamp=timestamp,
-                    raw_data=json.dumps(data_dict)
-                )
+            table_class, values = self._sensor_row(data_dict)
+            sensor_data = table_class(**values)
             
             session.add(sensor_data)
             session.commit()
-            print(f"[DB] Saved {kind} data for device {sensor_data.device_id} to {sensor_data.__tablename__}")
+            self.query_cache.invalidate(self._write_scopes({table_class: [values]}))
+            log.debug('db.row_saved', "Saved {kind} data for device {device_id} to {table}",
+                      kind=kind, device_id=sensor_data.device_id, table=sensor_data.__tablename__)
             return True
             
         except Exception as e:
             session.rollback()
-            print(f"[DB] Error saving sensor data: {e}")
+            log.error('db.save_failed', "Error saving sensor data: {error}", error=e)
             return False
         finally:
             session.close()
     
+    @_operation
+    def save_sensor_data_batch(self, data_dicts):
+        """Save many sensor data dicts with one multi-row INSERT per table, returns rows saved"""
+        if not data_dicts:
+            return 0
+        
+        # Group rows by target table
+        grouped = {}
+        for data_dict in data_dicts:
+            table_class, values = self._sensor_row(data_dict)
+            grouped.setdefault(table_class, []).append(values)
+        
+        session = self.get_session()
+        try:
+            for table_class, rows in grouped.items():
+                session.execute(insert(table_class), rows)
+            session.commit()
+            self.query_cache.invalidate(self._write_scopes(grouped))
+            return len(data_dicts)
+            
+        except Exception as e:
+            session.rollback()
+            log.error('db.save_failed', "Error saving sensor data batch ({rows} rows): {error}", rows=len(data_dicts), error=e)
+            return 0
+        finally:
+            session.close()
+    
+    def _write_scopes(self, grouped):
+        """Query cache scopes (table, devices, rooms, time range) of committed rows per table"""
+        scopes = []
+        for table_class, rows in grouped.items():
+            timestamps = [row['timestamp'] for row in rows]
+            scopes.append(QueryScope(
+                tables=(table_class.__tablename__,),
+                device_ids={row['device_id'] for row in rows},
+                room_ids={row['room_id'] for row in rows if row.get('room_id')},
+                start=min(timestamps),
+                end=max(timestamps)
+            ))
+        return scopes
+    
+    def _table_names(self, kinds):
+        """Table names read for sensor kinds (unknown kinds live in the legacy table)"""
+        return {KIND_TABLES.get(kind.lower(), (SensorData, None))[0].__tablename__ for kind in kinds}
+    
+    @_operation
     def get_recent_data(self, device_id=None, kind=None, limit=100):
+        """Get recent sensor data from appropriate table (cached until a matching write)"""
+        scope = QueryScope(tables=self._table_names([kind]) if kind else None,
+                           device_ids=(device_id,) if device_id else None)
+        return self.query_cache.get_or_load(('recent', kind and kind.lower(), device_id, limit),
+                                            lambda: self._query_recent_data(device_id, kind, limit),
+                                            scope, cacheable=bool)
+    
+    def _query_recent_data(self, device_id=None, kind=None, limit=100):
         """Get recent sensor data from appropriate table"""
         session = self.get_session()
         try:
@@ -282,11 +434,327 @@ class DatabaseManager:
             return results
             
         except Exception as e:
-            print(f"[DB] Error retrieving data: {e}")
+            log.error('db.query_failed', "Error retrieving data: {error}", error=e)
             return []
         finally:
             session.close()
     
+    @_operation
+    def get_history_batch(self, devices, hours=24, start=None, end=None, limit_per_device=1000):
+        """Time series for many (kind, device_id) pairs with one query per table
+        
+        Returns {(kind, device_id): {'timestamps': [...], 'values': [...], 'room_id': ...}}
+        with points in ascending time order, keeping the latest limit_per_device points.
+        Results are cached; windows given as hours before now are keyed by their length.
+        """
+        devices = [(kind.lower(), device_id) for kind, device_id in devices]
+        if start is None and end is None:
+            key = ('history', frozenset(devices), 'hours', hours, limit_per_device)
+            scope_start, scope_end = datetime.now() - timedelta(hours=hours), None
+        else:
+            key = ('history', frozenset(devices), start, end, limit_per_device)
+            scope_start, scope_end = start, end
+        scope = QueryScope(tables=self._table_names(kind for kind, _ in devices),
+                           device_ids={device_id for _, device_id in devices}, start=scope_start, end=scope_end)
+        return self.query_cache.get_or_load(
+            key, lambda: self._query_history_batch(devices, hours, start, end, limit_per_device), scope)
+    
+    def _query_history_batch(self, devices, hours=24, start=None, end=None, limit_per_device=1000):
+        """Uncached get_history_batch"""
+        end = end or datetime.now()
+        start = start or end - timedelta(hours=hours)
+        
+        # Group requested devices by the table that stores them (unknown kinds share the legacy table)
+        grouped = {}
+        for kind, device_id in devices:
+            kind = kind.lower()
+            table_kind = kind if kind in KIND_TABLES else None
+            grouped.setdefault(table_kind, set()).add(device_id)
+        
+        series = {(kind.lower(), device_id): {'timestamps': [], 'values': [], 'room_id': None}
+                  for kind, device_id in devices}
+        session = self.get_session()
+        try:
+            for table_kind, device_ids in grouped.items():
+                table_class, column = KIND_TABLES.get(table_kind, (SensorData, 'value'))
+                room_column = getattr(table_class, 'room_id', None)
+                columns = [table_class.device_id, table_class.timestamp, getattr(table_class, column)]
+                if room_column is not None:
+                    columns.append(room_column)
+                if table_class is SensorData:
+                    columns.append(SensorData.kind)
+                conditions = [table_class.timestamp >= start, table_class.timestamp <= end]
+                
+                # Newest limit_per_device rows of each device: ranked in SQL, or one LIMIT query
+                # per device (newest first) on servers without window functions
+                newest_first = not self._window_functions()
+                if not newest_first:
+                    rank = func.row_number().over(partition_by=table_class.device_id,
+                                                  order_by=table_class.timestamp.desc()).label('row_rank')
+                    ranked = select(*columns, rank).where(
+                        table_class.device_id.in_(sorted(device_ids)), *conditions).subquery()
+                    queries = [select(*[c for c in ranked.c if c.name != 'row_rank']).where(
+                        ranked.c.row_rank <= limit_per_device).order_by(ranked.c.device_id, ranked.c.timestamp)]
+                else:
+                    queries = [select(*columns).where(table_class.device_id == device_id, *conditions)
+                               .order_by(table_class.timestamp.desc()).limit(limit_per_device)
+                               for device_id in sorted(device_ids)]
+                
+                for query in queries:
+                    rows = session.execute(query).all()
+                    if newest_first:
+                        rows.reverse()
+                    for row in rows:
+                        kind = table_kind or row[-1].lower()
+                        entry = series.get((kind, row[0]))
+                        if entry is None:
+                            continue
+                        entry['timestamps'].append(row[1])
+                        entry['values'].append(row[2])
+                        if room_column is not None:
+                            entry['room_id'] = row[3]
+            return series
+            
+        except Exception as e:
+            log.error('db.query_failed', "Error retrieving history batch: {error}", error=e)
+            return None
+        finally:
+            session.close()
+    
+    def _window_functions(self):
+        """Whether the server supports window functions (MySQL 8+, MariaDB 10.2+, SQLite 3.25+)"""
+        dialect = self.engine.dialect
+        version = dialect.server_version_info or ()
+        if dialect.name == 'sqlite':
+            return version >= (3, 25)
+        if getattr(dialect, 'is_mariadb', False):
+            return version >= (10, 2)
+        return version >= (8, 0)
+    
+    def _epoch_seconds(self, column):
+        """SQL expression: seconds between 1970-01-01 and a naive DATETIME column"""
+        if self.engine.dialect.name == 'sqlite':
+            return cast(func.strftime('%s', column), Integer)
+        return func.timestampdiff(literal_column('SECOND'), '1970-01-01', column)
+    
+    def _bucket_start(self, epoch, bucket_seconds):
+        """SQL expression: start (epoch seconds) of the fixed-width bucket holding epoch"""
+        return (epoch // bucket_seconds) * bucket_seconds
+    
+    @_operation
+    def aggregate_sensor_data(self, kinds=None, group_by=('kind',), bucket_seconds=3600, aggregates=('avg',),
+                              start=None, end=None, device_ids=None, room_ids=None, max_gap_seconds=900):
+        """Grouped statistics computed by the database (one GROUP BY query per sensor table)
+        
+        group_by: any of device, room, kind (kind is always added when several kinds are selected).
+        bucket_seconds: time bucket width, 0 for one bucket over the whole window.
+        aggregates: avg, min, max, count, sum and twa, the time-weighted average where each sample
+        counts for the time until the device's next sample (capped at max_gap_seconds); it uses
+        LEAD() on servers with window functions (MySQL 8+) and a slower correlated subquery otherwise.
+        Returns columnar results {'bucket': [...], <group>: [...], <aggregate>: [...]}; raises
+        ValueError for unknown groups, aggregates or kinds and returns None on database errors.
+        Windows that ended in the past are cached until a write lands in them.
+        """
+        args = (kinds, group_by, bucket_seconds, aggregates, start, end, device_ids, room_ids, max_gap_seconds)
+        if end is None or end >= datetime.now():
+            return self._query_aggregate(*args)  # still filling up: every call sees new rows
+        key = ('aggregate',) + tuple(tuple(arg) if isinstance(arg, (list, tuple, set)) else arg for arg in args)
+        scope = QueryScope(tables=self._table_names(kinds or KIND_TABLES), device_ids=device_ids,
+                           room_ids=room_ids, start=start, end=end)
+        return self.query_cache.get_or_load(key, lambda: self._query_aggregate(*args), scope)
+    
+    def _query_aggregate(self, kinds=None, group_by=('kind',), bucket_seconds=3600, aggregates=('avg',),
+                         start=None, end=None, device_ids=None, room_ids=None, max_gap_seconds=900):
+        """Uncached aggregate_sensor_data"""
+        kinds = [kind.lower() for kind in (kinds or KIND_TABLES)]
+        group_by = list(dict.fromkeys(group_by))
+        aggregates = list(dict.fromkeys(aggregates))
+        for kind in kinds:
+            if kind not in KIND_TABLES:
+                raise ValueError(f"unknown kind '{kind}'")
+        for group in group_by:
+            if group not in AGGREGATE_GROUPS:
+                raise ValueError(f"unknown group '{group}' (expected {', '.join(AGGREGATE_GROUPS)})")
+        for aggregate in aggregates:
+            if aggregate not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"unknown aggregate '{aggregate}' (expected {', '.join(AGGREGATE_FUNCTIONS)})")
+        if len(kinds) > 1 and 'kind' not in group_by:
+            group_by.insert(0, 'kind')  # values in different units are never combined
+        
+        end = end or datetime.now()
+        start = start or end - timedelta(hours=24)
+        rows = []
+        session = self.get_session()
+        try:
+            for kind in kinds:
+                table_class, column = KIND_TABLES[kind]
+                room_column = getattr(table_class, 'room_id', None)
+                conditions = [table_class.timestamp >= start, table_class.timestamp < end]
+                if device_ids:
+                    conditions.append(table_class.device_id.in_(list(device_ids)))
+                if room_ids:
+                    if room_column is None:
+                        continue
+                    conditions.append(room_column.in_(list(room_ids)))
+                
+                # Per-sample source rows: epoch seconds, value, and the device's next sample time for twa
+                epoch = self._epoch_seconds(table_class.timestamp)
+                source_columns = [
+                    table_class.device_id.label('device_id'),
+                    (room_column if room_column is not None else null()).label('room_id'),
+                    epoch.label('t'),
+                    getattr(table_class, column).label('v')
+                ]
+                if 'twa' in aggregates:
+                    if self._window_functions():
+                        t_next = func.lead(epoch).over(partition_by=table_class.device_id,
+                                                       order_by=table_class.timestamp)
+                    else:
+                        # No LEAD() before MySQL 8: correlated lookup of the device's next sample
+                        following = aliased(table_class)
+                        t_next = self._epoch_seconds(select(func.min(following.timestamp)).where(
+                            following.device_id == table_class.device_id,
+                            following.timestamp > table_class.timestamp,
+                            following.timestamp < end
+                        ).scalar_subquery())
+                    source_columns.append(t_next.label('t_next'))
+                source = select(*source_columns).where(*conditions).subquery()
+                
+                keys = []
+                if bucket_seconds:
+                    keys.append(self._bucket_start(source.c.t, int(bucket_seconds)).label('bucket'))
+                if 'device' in group_by:
+                    keys.append(source.c.device_id.label('device'))
+                if 'room' in group_by:
+                    keys.append(source.c.room_id.label('room'))
+                
+                columns = list(keys)
+                if 'kind' in group_by:
+                    columns.append(literal(kind).label('kind'))
+                for aggregate in aggregates:
+                    if aggregate == 'twa':
+                        gap = source.c.t_next - source.c.t
+                        weight = case((gap > max_gap_seconds, max_gap_seconds), else_=gap)
+                        weighted = func.sum(source.c.v * weight) / func.nullif(func.sum(weight), 0)
+                        columns.append(func.coalesce(weighted, func.avg(source.c.v)).label('twa'))
+                    else:
+                        columns.append(getattr(func, aggregate)(source.c.v).label(aggregate))
+                
+                query = select(*columns).select_from(source)
+                if keys:
+                    query = query.group_by(*keys)
+                rows.extend(row._mapping for row in session.execute(query))
+            
+        except Exception as e:
+            log.error('db.query_failed', "Error aggregating sensor data: {error}", error=e)
+            return None
+        finally:
+            session.close()
+        
+        # Columnar output ordered by bucket, then group keys
+        names = (['bucket'] if bucket_seconds else []) + [group for group in AGGREGATE_GROUPS if group in group_by]
+        rows.sort(key=lambda row: tuple('' if row[name] is None else row[name] for name in names))
+        epoch_start = datetime(1970, 1, 1)
+        result = {name: [] for name in names + aggregates}
+        for row in rows:
+            for name in names:
+                value = row[name]
+                if name == 'bucket':
+                    value = (epoch_start + timedelta(seconds=int(value))).isoformat()
+                result[name].append(value)
+            for aggregate in aggregates:
+                value = row[aggregate]
+                if value is not None and aggregate != 'count':
+                    value = round(float(value), 4)
+                result[aggregate].append(value)
+        return result
+    
+    @_operation
+    def save_energy_checkpoints(self, checkpoints):
+        """Insert or update energy buckets (dicts with the EnergyCheckpoint columns), returns rows written"""
+        if not checkpoints:
+            return 0
+        
+        session = self.get_session()
+        try:
+            # Ids of buckets that already exist, looked up with one query
+            starts = {checkpoint['bucket_start'] for checkpoint in checkpoints}
+            existing = {}
+            query = select(EnergyCheckpoint.id, EnergyCheckpoint.period, EnergyCheckpoint.bucket_start,
+                           EnergyCheckpoint.scope, EnergyCheckpoint.scope_id, EnergyCheckpoint.kind
+                           ).where(EnergyCheckpoint.bucket_start.in_(list(starts)))
+            for row in session.execute(query):
+                existing[tuple(row[1:])] = row[0]
+            
+            updates, inserts = [], []
+            for checkpoint in checkpoints:
+                key = (checkpoint['period'], checkpoint['bucket_start'], checkpoint['scope'],
+                       checkpoint['scope_id'], checkpoint['kind'])
+                if key in existing:
+                    updates.append({'id': existing[key], 'energy_wh': checkpoint['energy_wh'],
+                                    'cumulative_wh': checkpoint['cumulative_wh'],
+                                    'updated_at': checkpoint['updated_at']})
+                else:
+                    inserts.append(checkpoint)
+            if updates:
+                session.execute(update(EnergyCheckpoint), updates)
+            if inserts:
+                session.execute(insert(EnergyCheckpoint), inserts)
+            session.commit()
+            return len(checkpoints)
+            
+        except Exception as e:
+            session.rollback()
+            log.error('db.save_failed', "Error saving energy checkpoints: {error}", error=e)
+            return 0
+        finally:
+            session.close()
+    
+    @_operation
+    def get_energy_checkpoints(self, period, start, end, scope=None, scope_ids=None, kinds=None):
+        """Energy buckets with bucket_start in [start, end), ordered by series and time"""
+        session = self.get_session()
+        try:
+            conditions = [EnergyCheckpoint.period == period]
+            if start is not None:
+                conditions.append(EnergyCheckpoint.bucket_start >= start)
+            if end is not None:
+                conditions.append(EnergyCheckpoint.bucket_start < end)
+            if scope:
+                conditions.append(EnergyCheckpoint.scope == scope)
+            if scope_ids:
+                conditions.append(EnergyCheckpoint.scope_id.in_(list(scope_ids)))
+            if kinds:
+                conditions.append(EnergyCheckpoint.kind.in_(list(kinds)))
+            query = select(EnergyCheckpoint.scope, EnergyCheckpoint.scope_id, EnergyCheckpoint.kind,
+                           EnergyCheckpoint.bucket_start, EnergyCheckpoint.energy_wh, EnergyCheckpoint.cumulative_wh
+                           ).where(*conditions).order_by(EnergyCheckpoint.scope, EnergyCheckpoint.scope_id,
+                                                         EnergyCheckpoint.kind, EnergyCheckpoint.bucket_start)
+            return [tuple(row) for row in session.execute(query)]
+            
+        except Exception as e:
+            log.error('db.query_failed', "Error retrieving energy checkpoints: {error}", error=e)
+            return None
+        finally:
+            session.close()
+    
+    @_operation
+    def get_energy_totals(self):
+        """Latest running total (Wh) per (scope, scope_id, kind), to resume the accumulator"""
+        session = self.get_session()
+        try:
+            query = select(EnergyCheckpoint.scope, EnergyCheckpoint.scope_id, EnergyCheckpoint.kind,
+                           func.max(EnergyCheckpoint.cumulative_wh)
+                           ).where(EnergyCheckpoint.period == 'hour').group_by(
+                               EnergyCheckpoint.scope, EnergyCheckpoint.scope_id, EnergyCheckpoint.kind)
+            return {(row[0], row[1], row[2]): row[3] or 0.0 for row in session.execute(query)}
+            
+        except Exception as e:
+            log.error('db.query_failed', "Error retrieving energy totals: {error}", error=e)
+            return {}
+        finally:
+            session.close()
+    
     def _get_recent_data_from_all_tables(self, device_id=None, limit=100):
         """Get recent data from all sensor tables"""
         session = self.get_session()
@@ -307,17 +775,25 @@ class DatabaseManager:
             return all_results[:limit]
             
         except Exception as e:
-            print(f"[DB] Error retrieving data from all tables: {e}")
+            log.error('db.query_failed', "Error retrieving data from all tables: {error}", error=e)
             return []
         finally:
             session.close()
     
+    @_operation
     def get_room_data(self, room_id, limit=50):
+        """Get data for a specific room from all sensor tables (cached until a matching write)"""
+        return self.query_cache.get_or_load(('room', room_id, limit),
+                                            lambda: self._query_room_data(room_id, limit),
+                                            QueryScope(room_ids=(room_id,)), cacheable=bool)
+    
+    def _query_room_data(self, room_id, limit=50):
         """Get data for a specific room from all sensor tables"""
         session = self.get_session()
         try:
             all_results = []
-            tables = [TemperatureData, HumidityData, CO2Data, LightData, SolarData, SensorData]
+            # Solar readings have no room column (querying SolarData.room_id raised AttributeError)
+            tables = [TemperatureData, HumidityData, CO2Data, LightData, SensorData]
             
             for table_class in tables:
                 results = session.query(table_class).filter(
@@ -330,11 +806,12 @@ class DatabaseManager:
             return all_results[:limit]
             
         except Exception as e:
-            print(f"[DB] Error retrieving room data: {e}")
+            log.error('db.query_failed', "Error retrieving room data: {error}", error=e)
             return []
         finally:
             session.close()
     
+    @_operation
     def get_table_statistics(self):
         """Get statistics from all sensor tables"""
         session = self.get_session()
@@ -364,11 +841,12 @@ class DatabaseManager:
             return stats
             
         except Exception as e:
-            print(f"[DB] Error getting table statistics: {e}")
+            log.error('db.query_failed', "Error getting table statistics: {error}", error=e)
             return {}
         finally:
             session.close()
     
+    @_operation
     def test_connection(self):
         """Test database connection"""
         try:
@@ -376,10 +854,10 @@ class DatabaseManager:
             session = self.get_session()
             session.execute(text("SELECT 1"))
             session.close()
-            print("[DB] Connection test successful")
+            log.info('db.connection_test', "Connection test successful")
             return True
         except Exception as e:
-            print(f"[DB] Connection test failed: {e}")
+            log.error('db.connection_test', "Connection test failed: {error}", error=e)
             return False
 
 # Global database manager instance
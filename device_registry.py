@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Device registry
+- One record per device (id, kind, room, last seen), seeded from the topology
+  and updated incrementally as readings arrive
+- Secondary indexes by kind and by room, plus a last-seen ordering (least
+  recently seen first) so staleness queries stop at the first fresh device
+- Filtered, paginated queries touch only the matching index entries
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from pipeline import Sink
+
+
+class DeviceRegistry:
+    """Device records with kind / room indexes and a last-seen order"""
+
+    def __init__(self, topology=None):
+        self._records = {}  # device_id -> record dict (served as-is, replaced on update)
+        self._by_kind = {}  # kind -> {device_id: None}, registration order
+        self._by_room = {}  # room_id -> {device_id: None}, registration order
+        self._last_seen = OrderedDict()  # device_id -> epoch seconds (0 = never), oldest first
+        self._lock = threading.Lock()
+        self.update_count = 0
+        if topology is not None:
+            for device in topology.devices:
+                self._register(device.device_id, device.kind, device.room_id)
+
+    def _register(self, device_id, kind, room_id):
+        self._records[device_id] = {'device_id': device_id, 'kind': kind, 'room_id': room_id, 'last_seen': None}
+        self._by_kind.setdefault(kind, {})[device_id] = None
+        if room_id is not None:
+            self._by_room.setdefault(room_id, {})[device_id] = None
+        self._last_seen[device_id] = 0.0
+
+    def _unindex(self, record):
+        self._by_kind.get(record['kind'], {}).pop(record['device_id'], None)
+        if record['room_id'] is not None:
+            self._by_room.get(record['room_id'], {}).pop(record['device_id'], None)
+
+    def _seen(self, device_id, kind, room_id, iso, seen_at):
+        record = self._records.get(device_id)
+        if record is None or record['kind'] != kind or record['room_id'] != room_id:
+            if record is not None:
+                self._unindex(record)  # device moved (e.g. re-announced over MQTT with another room)
+            self._register(device_id, kind, room_id)
+        self._records[device_id] = {'device_id': device_id, 'kind': kind, 'room_id': room_id, 'last_seen': iso}
+        self._last_seen[device_id] = seen_at
+        self._last_seen.move_to_end(device_id)
+
+    def update(self, batch):
+        """Record every device in a ReadingBatch as seen at the batch time"""
+        iso = batch.iso_timestamp
+        seen_at = batch.timestamp.timestamp()
+        with self._lock:
+            for reading in batch.readings:
+                device = reading.device
+                self._seen(device.device_id, device.kind, device.room_id, iso, seen_at)
+            self.update_count += 1
+
+    def sync(self, devices):
+        """Record devices from a latest-value dict whose timestamp changed (web workers)"""
+        with self._lock:
+            for device_id, data in devices.items():
+                record = self._records.get(device_id)
+                iso = data.get('timestamp')
+                if record is not None and record['last_seen'] == iso:
+                    continue
+                seen_at = datetime.fromisoformat(iso).timestamp() if iso else 0.0
+                self._seen(device_id, data.get('kind'), data.get('room_id'), iso, seen_at)
+            self.update_count += 1
+
+    def get(self, device_id):
+        return self._records.get(device_id)
+
+    def query(self, kind=None, room_id=None, stale_seconds=None, device_ids=None, offset=0, limit=None):
+        """(total matching, records of the requested page)
+
+        Filters combine: kind and room use their indexes, stale_seconds walks the last-seen
+        order from the least recently seen device (never-seen devices first) and
+        device_ids restricts to a set. Without stale_seconds, records keep registration order.
+        """
+        with self._lock:
+            if stale_seconds is not None:
+                cutoff = time.time() - stale_seconds
+                candidates = []
+                for device_id, seen_at in self._last_seen.items():
+                    if seen_at >= cutoff:
+                        break
+                    candidates.append(device_id)
+                indexes = [index for index in ((self._by_kind.get(kind, {}) if kind else None),
+                                               (self._by_room.get(room_id, {}) if room_id else None))
+                           if index is not None]
+            else:
+                # Walk the smallest index, test membership in the others
+                indexes = []
+                if kind:
+                    indexes.append(self._by_kind.get(kind, {}))
+                if room_id:
+                    indexes.append(self._by_room.get(room_id, {}))
+                indexes.sort(key=len)
+                candidates = indexes.pop(0) if indexes else self._records
+            if device_ids is not None:
+                indexes.append(device_ids)
+
+            total = 0
+            page = []
+            stop = offset + limit if limit is not None else None
+            for device_id in candidates:
+                if any(device_id not in index for index in indexes):
+                    continue
+                if total >= offset and (stop is None or total < stop):
+                    page.append(self._records[device_id])
+                total += 1
+            return total, page
+
+    def __len__(self):
+        return len(self._records)
+
+    def get_stats(self):
+        return {
+            'devices': len(self._records),
+            'kinds': len(self._by_kind),
+            'rooms': len(self._by_room),
+            'updates': self.update_count
+        }
+
+
+class RegistrySink(Sink):
+    """Marks devices as seen in a DeviceRegistry"""
+
+    def __init__(self, registry, **kwargs):
+        super().__init__(**kwargs)
+        self.registry = registry
+
+    def write(self, batch):
+        self.registry.update(batch)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(self.registry.get_stats())
+        return stats
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time-series downsampling for history responses
+- LTTB (Largest-Triangle-Three-Buckets): keeps the visually significant point per bucket
+- Min/max buckets: keeps the lowest and highest point per bucket (peaks never disappear)
+Both return the indices of the points to keep, so callers can project any columns.
+Without numpy both fall back to evenly spaced points (see effective_method).
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+METHODS = ('lttb', 'minmax')
+MAX_POINTS = 10000
+
+
+def effective_method(method):
+    """Method downsample_indices really applies: 'even' spacing when numpy is missing"""
+    return method if NUMPY_AVAILABLE else 'even'
+
+
+def lttb_indices(x, y, points):
+    """Indices selected by Largest-Triangle-Three-Buckets (x ascending)"""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    # Bucket edges over the interior points; first and last points are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    ends = np.maximum(ends, starts + 1)
+
+    # Average point of every bucket (the "next bucket" term), via cumulative sums
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    avg_x = (cum_x[ends] - cum_x[starts]) / counts
+    avg_y = (cum_y[ends] - cum_y[starts]) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = starts[bucket], ends[bucket]
+        bx = x[start:end]
+        by = y[start:end]
+        # Twice the triangle area (previous selected point, candidate, next bucket average)
+        areas = np.abs((x[previous] - avg_x[bucket]) * (by - y[previous])
+                       - (x[previous] - bx) * (avg_y[bucket] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(x, y, points):
+    """Indices of the first / last point and the minimum and maximum of (points - 2) / 2
+    equal-time buckets (x ascending); never more than points indices"""
+    n = len(x)
+    buckets = max(1, (points - 2) // 2)
+    if points >= n:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket_ids = np.minimum(np.arange(n) * buckets // n, buckets - 1)
+    else:
+        bucket_ids = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    # x is ascending, so every bucket is a contiguous run: reduce each run to its min and max
+    starts = np.flatnonzero(np.diff(bucket_ids, prepend=-1))
+    counts = np.diff(np.append(starts, n))
+    keep = []
+    for reduce in (np.minimum, np.maximum):
+        extremes = np.repeat(reduce.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == extremes)
+        # First hit per bucket
+        _, first = np.unique(bucket_ids[hits], return_index=True)
+        keep.append(hits[first])
+    selected = np.unique(np.concatenate(keep + [np.array([0, n - 1])]))
+    if len(selected) > points:
+        # points == 3: keep both ends and the interior extreme furthest from the mean
+        interior = selected[(selected != 0) & (selected != n - 1)]
+        interior = interior[np.argsort(-np.abs(y[interior] - y.mean()))[:points - 2]]
+        selected = np.unique(np.concatenate(([0, n - 1], interior)))
+    return selected
+
+
+def downsample_indices(timestamps, values, points=None, resolution=None, method='lttb'):
+    """Indices (ascending time) of the points to keep
+
+    timestamps are datetimes or epoch seconds in ascending order; values may contain None
+    (those points are dropped). points caps the number of points returned; resolution is the
+    bucket width in seconds and is converted into a point count over the series' time span.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}' (expected one of {METHODS})")
+    valid = [i for i, value in enumerate(values) if value is not None]
+    if not valid:
+        return []
+    seconds = [timestamps[i].timestamp() if hasattr(timestamps[i], 'timestamp') else float(timestamps[i])
+               for i in valid]
+
+    if resolution:
+        buckets = int((seconds[-1] - seconds[0]) / resolution) + 1
+        wanted = buckets * 2 + 2 if method == 'minmax' else buckets
+        points = min(points, wanted) if points else wanted
+    if not points or points >= len(valid):
+        return valid
+    points = min(int(points), MAX_POINTS)
+    if points <= 2:
+        return [valid[0], valid[-1]][:points]  # first point, or first and last
+
+    if not NUMPY_AVAILABLE:
+        # Without numpy: points - 1 evenly spaced points plus the last one
+        step = (len(valid) - 1) / (points - 1)
+        return [valid[int(i * step)] for i in range(points - 1)] + [valid[-1]]
+
+    x = np.asarray(seconds, dtype=np.float64)
+    y = np.asarray([float(values[i]) for i in valid], dtype=np.float64)
+    if method == 'lttb':
+        selected = lttb_indices(x, y, points)
+    else:
+        selected = minmax_indices(x, y, points)
+    valid = np.asarray(valid, dtype=np.int64)
+    return valid[selected].tolist()
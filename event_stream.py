@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Server-Sent Events broadcaster
+- One serialization per event, shared by every subscriber
+- Bounded event history so reconnecting clients resume from Last-Event-ID
+- Event ids are stream positions '<epoch>-<store version>-<alert sequence>' taken
+  from the process that runs the pipeline, so every web worker gives an event the
+  same id and a client can resume on any worker; the epoch changes when that
+  process restarts and its counters start over
+- Clients that are new, too far behind or from another epoch get one 'snapshot'
+  event with the full state
+- Idle connections get a heartbeat comment every few seconds
+- Every open stream holds one server thread, so max_subscribers caps them per
+  process and leaves threads for the rest of the API
+"""
+
+import threading
+from collections import deque
+
+from json_codec import dumps
+
+
+def format_event_id(epoch, position):
+    return f'{epoch}-{position[0]}-{position[1]}'
+
+
+def parse_event_id(text):
+    """(epoch, (store version, alert sequence)) from an event id, or None"""
+    try:
+        epoch, version, alert_seq = text.rsplit('-', 2)
+        return epoch, (int(version), int(alert_seq))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _covers(cursor, position):
+    """True if a client at `cursor` has already seen the event at `position`"""
+    return position[0] <= cursor[0] and position[1] <= cursor[1]
+
+
+class EventBroadcaster:
+    """Fan-out of pre-serialized SSE events to any number of streaming responses"""
+
+    def __init__(self, history=256, heartbeat=15, retry_ms=3000, epoch='0', max_subscribers=0):
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self.max_subscribers = max_subscribers  # 0 = unlimited
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)  # (position, SSE bytes); positions never decrease
+        self.epoch = epoch
+        self._position = (0, 0)  # (store version, alert sequence) after the latest event
+        self._floor = (0, 0)  # position of the newest event that fell out of the history
+        self._state = {}  # device_id -> dict form, the picture a snapshot describes
+        self._state_timestamp = None
+        self._snapshot = None  # (cursor, bytes) cached until the next event
+        self.subscribers = 0
+        self.rejected_count = 0
+        self.published_count = 0
+        self.snapshot_count = 0
+
+    @staticmethod
+    def _format(event_id, event_type, data_json):
+        return f"id: {event_id}\nevent: {event_type}\ndata: {data_json}\n\n".encode('utf-8')
+
+    def set_epoch(self, epoch):
+        """Start over when the pipeline process restarted; subscribers resync with a snapshot"""
+        with self._cond:
+            if epoch == self.epoch:
+                return
+            self.epoch = epoch
+            self._events.clear()
+            self._position = self._floor = (0, 0)
+            self._state = {}
+            self._state_timestamp = None
+            self._snapshot = None
+            self._cond.notify_all()
+
+    def publish(self, event_type, data, version=None, alert_seq=None, state_update=None, timestamp=None):
+        """Serialize an event once and wake every subscriber
+
+        version / alert_seq advance the stream position; omitted ones keep their value.
+        """
+        data_json = dumps(data)
+        with self._cond:
+            current_version, current_alert = self._position
+            position = (current_version if version is None else max(version, current_version),
+                        current_alert if alert_seq is None else max(alert_seq, current_alert))
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0][0]
+            self._events.append((position, self._format(format_event_id(self.epoch, position), event_type, data_json)))
+            self._position = position
+            if state_update:
+                self._state.update(state_update)
+            if timestamp:
+                self._state_timestamp = timestamp
+            self._snapshot = None
+            self.published_count += 1
+            self._cond.notify_all()
+
+    def publish_delta(self, version, timestamp, changed):
+        """Publish the devices changed up to store `version` and fold them into the snapshot state"""
+        self.publish('delta', {'timestamp': timestamp, 'devices': changed}, version=version,
+                     state_update=changed, timestamp=timestamp)
+
+    def publish_alert(self, event):
+        """Publish a fired / resolved alert event (its seq orders it)"""
+        self.publish('alert', event, alert_seq=event['seq'])
+
+    def _cursor(self):
+        return self.epoch, self._position
+
+    def _snapshot_event(self):
+        """Full-state event at the current position (caller holds the lock)"""
+        cursor = self._cursor()
+        if self._snapshot is None or self._snapshot[0] != cursor:
+            data_json = dumps({'timestamp': self._state_timestamp, 'devices': self._state})
+            self._snapshot = (cursor, self._format(format_event_id(*cursor), 'snapshot', data_json))
+        self.snapshot_count += 1
+        return self._snapshot
+
+    def _pending(self, cursor):
+        """Events the cursor has not seen, or None if they cannot come from the history (caller holds the lock)"""
+        epoch, position = cursor
+        if epoch != self.epoch or not _covers(self._position, position) or not _covers(position, self._floor):
+            # Another epoch, a cursor ahead of this worker, or events already dropped from the history
+            return None
+        pending = []
+        for event_position, event in reversed(self._events):
+            if _covers(position, event_position):
+                break  # positions never decrease, so every older event is covered too
+            pending.append(event)
+        pending.reverse()
+        return pending
+
+    def stream(self, last_event_id=None):
+        """Subscription (iterator of SSE bytes) for one subscriber (last_event_id as sent by
+        the client), or None when max_subscribers streams are already open"""
+        with self._cond:
+            if self.max_subscribers and self.subscribers >= self.max_subscribers:
+                self.rejected_count += 1
+                return None
+            self.subscribers += 1
+            cursor = parse_event_id(last_event_id)
+            first = [f"retry: {self.retry_ms}\n\n".encode('utf-8')]
+            pending = self._pending(cursor) if cursor else None
+            if pending is None:
+                cursor, snapshot = self._snapshot_event()
+                first.append(snapshot)
+            else:
+                first.extend(pending)
+                cursor = self._cursor()
+        return Subscription(self, self._run(cursor, first))
+
+    def _run(self, cursor, first):
+        yield b''.join(first)
+        while True:
+            with self._cond:
+                if cursor == self._cursor():
+                    self._cond.wait(self.heartbeat)
+                pending = self._pending(cursor)
+                if pending is None:
+                    # Subscriber fell behind the history or the epoch changed: resync with a snapshot
+                    cursor, snapshot = self._snapshot_event()
+                    pending = [snapshot]
+                else:
+                    cursor = self._cursor()
+            if pending:
+                yield b''.join(pending)
+            else:
+                yield b': heartbeat\n\n'
+
+    def _release(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def get_stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'max_subscribers': self.max_subscribers,
+            'rejected': self.rejected_count,
+            'last_event_id': format_event_id(self.epoch, self._position),
+            'events_published': self.published_count,
+            'snapshots_sent': self.snapshot_count,
+            'history_size': len(self._events),
+            'devices': len(self._state)
+        }
+
+
+class Subscription:
+    """One subscriber's SSE byte stream; close() frees its slot in the broadcaster
+
+    The slot is taken in EventBroadcaster.stream(), before the response starts, so it is
+    also given back when the stream is closed or garbage-collected without ever being iterated.
+    """
+
+    def __init__(self, broadcaster, events):
+        self._broadcaster = broadcaster
+        self._events = events
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._events.close()
+        self._broadcaster._release()
+
+    def __del__(self):
+        self.close()
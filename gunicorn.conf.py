@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration for multi-worker serving
+The master starts one state owner process (simulator, pipeline, database
+scheduler) and N stateless web workers that serve the API from its shared
+memory state. The owner is restarted if it exits; the control socket uses a
+random key generated per run. Run with:
+    gunicorn -c gunicorn.conf.py render_dashboard_no_socketio:app
+"""
+
+import os
+import sys
+import time
+import secrets
+import threading
+import subprocess
+
+# Every process started from here uses the shared-memory state backend
+os.environ['STATE_BACKEND'] = 'shm'
+os.environ.setdefault('STATE_ROLE', 'worker')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', str(os.cpu_count() or 1)))
+# Threads per worker; /api/stream keeps one thread busy per connected client, so each worker
+# accepts at most GUNICORN_THREADS - SSE_RESERVED_THREADS streams (SSE_MAX_CLIENTS overrides)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+# Restart delay after the owner exits, doubled while it keeps failing quickly
+OWNER_RESTART_DELAY = 1.0
+OWNER_RESTART_MAX_DELAY = 60.0
+OWNER_STABLE_SECONDS = 60.0
+
+_owner = None
+_stopping = threading.Event()
+
+
+def _start_owner(server):
+    global _owner
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, STATE_ROLE='owner')
+    _owner = subprocess.Popen([sys.executable, os.path.join(app_dir, 'render_dashboard_no_socketio.py')],
+                              cwd=app_dir, env=env)
+    server.log.info("State owner started (pid %s)", _owner.pid)
+
+
+def _supervise(server):
+    """Restart the state owner whenever it exits; workers re-attach to its new segment"""
+    delay = OWNER_RESTART_DELAY
+    started = time.monotonic()
+    while not _stopping.wait(1.0):
+        code = _owner.poll()
+        if code is None:
+            continue
+        if time.monotonic() - started >= OWNER_STABLE_SECONDS:
+            delay = OWNER_RESTART_DELAY
+        server.log.error("State owner exited with code %s, restarting in %.0f s", code, delay)
+        if _stopping.wait(delay):
+            break
+        _start_owner(server)
+        started = time.monotonic()
+        delay = min(delay * 2, OWNER_RESTART_MAX_DELAY)
+
+
+def on_starting(server):
+    """Start the state owner (and its supervisor) before any web worker is forked"""
+    # Owner and workers inherit the key; it never leaves this process tree
+    os.environ.setdefault('STATE_AUTHKEY', secrets.token_hex(32))
+    _start_owner(server)
+    threading.Thread(target=_supervise, args=(server,), name='owner-supervisor', daemon=True).start()
+
+
+def on_exit(server):
+    """Stop the state owner with the master"""
+    _stopping.set()
+    if _owner and _owner.poll() is None:
+        _owner.terminate()
+        try:
+            _owner.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _owner.kill()
+        server.log.info("State owner stopped")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory recent history
+- One fixed-capacity ring buffer per device: two preallocated float arrays
+  (epoch seconds, value), filled by the pipeline as readings arrive
+- History windows that start after a device's oldest buffered point are
+  answered from the buffers; only older windows need the database
+- Values follow the database history columns (power in watts for light/solar)
+
+There is one writer (the HistorySink thread) and lock-free readers. A reader
+notes the append count before and after copying; slots the writer reused in
+between (plus the one it may be writing) are dropped from the copy.
+"""
+
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+from pipeline import Sink
+
+# Recent history configuration - can be overridden by environment variables
+HISTORY_CONFIG = {
+    'capacity': int(os.getenv('HISTORY_BUFFER_SIZE', '1440'))  # points per device (2 hours at 5 s ticks)
+}
+
+
+def history_value(reading):
+    """Value as stored in the database history tables"""
+    power = reading.power_watts()
+    return power if power is not None else reading.value
+
+
+class DeviceRing:
+    """Fixed-capacity ring of (epoch seconds, value) points in ascending time order"""
+
+    __slots__ = ('capacity', 'timestamps', 'values', 'count', 'latest')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.count = 0  # total points ever appended
+        self.latest = float('-inf')
+
+    def append(self, timestamp, value):
+        """Store one point; False (point dropped) when it is older than the newest one,
+        since window() bisects the timestamps and needs them ascending"""
+        if timestamp < self.latest:
+            return False
+        self.latest = timestamp
+        slot = self.count % self.capacity
+        self.timestamps[slot] = timestamp
+        self.values[slot] = value
+        self.count += 1
+        return True
+
+    def _segments(self, count):
+        """Physical (start, stop) ranges holding the buffered points, oldest first"""
+        if count <= self.capacity:
+            return ((0, count),)
+        head = count % self.capacity
+        return ((head, self.capacity), (0, head))
+
+    def oldest(self):
+        """Epoch seconds of the oldest buffered point, or None when empty"""
+        count = self.count
+        if not count:
+            return None
+        return self.timestamps[0 if count <= self.capacity else count % self.capacity]
+
+    def window(self, start, end, limit=None):
+        """(timestamps, values, covered_from) with start <= t <= end, ascending, newest `limit` points
+
+        covered_from is the epoch second from which the ring holds every point (None when
+        empty); anything earlier has to come from the database.
+        """
+        count = self.count
+        timestamps, values = self.timestamps, self.values
+        ranges = []
+        for low, high in self._segments(count):
+            first = bisect_left(timestamps, start, low, high)
+            last = bisect_right(timestamps, end, first, high)
+            if first < last:
+                ranges.append((first, last))
+        if limit is not None:
+            ranges = _newest(ranges, limit)
+        picked_times = array('d')
+        picked_values = array('d')
+        for first, last in ranges:
+            picked_times.extend(timestamps[first:last])
+            picked_values.extend(values[first:last])
+
+        # Slots reused while copying (plus the one being written) held the oldest points: drop them
+        reused = self.count + 1 - max(count - self.capacity, 0) - self.capacity
+        if reused > 0 and ranges:
+            oldest_slot = count % self.capacity if count > self.capacity else 0
+            stale = reused - (ranges[0][0] - oldest_slot) % self.capacity
+            if stale > 0:
+                del picked_times[:stale]
+                del picked_values[:stale]
+        covered_from = self.oldest()
+        if covered_from is not None and picked_times and picked_times[0] < covered_from:
+            older = bisect_left(picked_times, covered_from)
+            del picked_times[:older]
+            del picked_values[:older]
+        return picked_times.tolist(), picked_values.tolist(), covered_from
+
+
+def _newest(ranges, limit):
+    """Trim (start, stop) ranges, oldest first, to their newest `limit` points"""
+    trimmed = []
+    for first, last in reversed(ranges):
+        if limit <= 0:
+            break
+        first = max(first, last - limit)
+        limit -= last - first
+        trimmed.append((first, last))
+    return trimmed[::-1]
+
+
+class RecentHistory:
+    """Ring buffers for every device seen by the pipeline"""
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or HISTORY_CONFIG['capacity']
+        self._rings = {}  # (kind, device_id) -> DeviceRing
+        self.append_count = 0
+        self.out_of_order_count = 0
+
+    def append(self, kind, device_id, timestamp, value):
+        ring = self._rings.get((kind, device_id))
+        if ring is None:
+            ring = self._rings[(kind, device_id)] = DeviceRing(self.capacity)
+        if ring.append(timestamp, value):
+            self.append_count += 1
+        else:
+            self.out_of_order_count += 1
+
+    def window(self, kind, device_id, start, end, limit=None):
+        """(timestamps, values, covered_from) for one device (see DeviceRing.window)"""
+        ring = self._rings.get((kind, device_id))
+        if ring is None:
+            return [], [], None
+        return ring.window(start, end, limit)
+
+    def windows(self, pairs, start, end, limit=None):
+        """{(kind, device_id): (timestamps, values, covered_from)} for many devices"""
+        return {pair: self.window(pair[0], pair[1], start, end, limit) for pair in pairs}
+
+    def get_stats(self):
+        return {
+            'devices': len(self._rings),
+            'capacity': self.capacity,
+            'appends': self.append_count,
+            'out_of_order': self.out_of_order_count,
+            'bytes': len(self._rings) * self.capacity * 16
+        }
+
+
+class HistorySink(Sink):
+    """Appends every reading to the RecentHistory ring buffers"""
+
+    def __init__(self, history, **kwargs):
+        super().__init__(**kwargs)
+        self.history = history
+
+    def write(self, batch):
+        timestamp = batch.timestamp.timestamp()
+        append = self.history.append
+        for reading in batch.readings:
+            value = history_value(reading)
+            if value is None:
+                continue
+            device = reading.device
+            append(device.kind, device.device_id, timestamp, float(value))
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(self.history.get_stats())
+        return stats
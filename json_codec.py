@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON encoding for API responses, SSE events, MQTT messages and stored payloads
+- Uses orjson when it is installed and the stdlib json module otherwise
+  (JSON_ENCODER=stdlib forces the fallback)
+- Both encoders write compact UTF-8 JSON and serialize datetime / date values
+  as ISO 8601 strings and NumPy scalars / arrays as plain numbers, so callers
+  can pass datetimes through instead of calling isoformat() per record
+"""
+
+import os
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# JSON configuration - can be overridden by environment variables
+JSON_CONFIG = {
+    'encoder': os.getenv('JSON_ENCODER', 'auto').lower()  # auto | orjson | stdlib
+}
+
+USE_ORJSON = ORJSON_AVAILABLE and JSON_CONFIG['encoder'] != 'stdlib'
+ENCODER = 'orjson' if USE_ORJSON else 'stdlib'
+
+_SEPARATORS = (',', ':')
+
+
+def default(obj):
+    """Values neither encoder handles natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if NUMPY_AVAILABLE:
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if USE_ORJSON:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumpb(obj):
+        """Compact JSON as UTF-8 bytes"""
+        return orjson.dumps(obj, default=default, option=_OPTIONS)
+
+    def dumps(obj):
+        """Compact JSON as str"""
+        return orjson.dumps(obj, default=default, option=_OPTIONS).decode('utf-8')
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(separators=_SEPARATORS, ensure_ascii=False, default=default)
+
+    def dumpb(obj):
+        """Compact JSON as UTF-8 bytes"""
+        return _encoder.encode(obj).encode('utf-8')
+
+    def dumps(obj):
+        """Compact JSON as str"""
+        return _encoder.encode(obj)
+
+    def loads(data):
+        return json.loads(data)
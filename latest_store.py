@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latest-value store
+Keeps the most recent reading per device as an immutable snapshot. The writer
+(the pipeline's LatestValueSink thread) builds the next snapshot from the
+previous one and publishes it with a single reference assignment; readers
+grab the current snapshot without locks and always see one complete tick.
+
+Versioning: the store version increases with every applied batch, and each
+device remembers the version at which its value last changed. A short log of
+per-version changes lets "changed since v" skip unchanged devices.
+"""
+
+import threading
+
+# Number of versions kept in the change log for ?since= queries
+CHANGE_LOG_SIZE = 256
+
+
+class StoreSnapshot:
+    """One immutable view of the store; never modified after publication"""
+
+    __slots__ = ('version', 'devices', 'readings', 'device_versions', 'changes')
+
+    def __init__(self, version=0, devices=None, readings=None, device_versions=None, changes=()):
+        self.version = version
+        self.devices = devices if devices is not None else {}  # device_id -> dict form
+        self.readings = readings if readings is not None else {}  # device_id -> (Reading, ISO timestamp)
+        self.device_versions = device_versions if device_versions is not None else {}
+        self.changes = changes  # ((version, changed device ids), ...), oldest first
+
+    def shareable(self):
+        """Copy without Reading objects, for publishing to other processes"""
+        return StoreSnapshot(self.version, self.devices, None, self.device_versions, self.changes)
+
+    def changes_since(self, since):
+        """Devices whose value changed after version `since` (all devices if it is unknown)"""
+        if since is None or since <= 0 or since > self.version:
+            return self.devices
+        changes = self.changes
+        if not changes or changes[0][0] > since + 1:
+            # Older than the change log: compare per-device versions
+            return {device_id: data for device_id, data in self.devices.items()
+                    if self.device_versions[device_id] > since}
+        changed = {}
+        devices = self.devices
+        for version, device_ids in reversed(changes):
+            if version <= since:
+                break
+            for device_id in device_ids:
+                if device_id not in changed:
+                    changed[device_id] = devices[device_id]
+        return changed
+
+
+class LatestValueStore:
+    """Latest reading per device, fed by the pipeline"""
+
+    def __init__(self):
+        self._snapshot = StoreSnapshot()
+        self._write_lock = threading.Lock()  # serializes writers only; readers never lock
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback() after every update (e.g. to rebuild cached responses)"""
+        self._listeners.append(callback)
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def update(self, batch):
+        """Apply one batch of readings and publish the next snapshot"""
+        iso = batch.iso_timestamp
+        with self._write_lock:
+            current = self._snapshot
+            version = current.version + 1
+            devices = dict(current.devices)
+            readings = dict(current.readings)
+            device_versions = dict(current.device_versions)
+            changed = []
+            for reading in batch.readings:
+                device_id = reading.device.device_id
+                previous = readings.get(device_id)
+                if (previous is None or previous[0].value != reading.value
+                        or previous[0].major_change != reading.major_change):
+                    device_versions[device_id] = version
+                    changed.append(device_id)
+                readings[device_id] = (reading, iso)
+                devices[device_id] = reading.to_dict(iso)
+            changes = current.changes[-(CHANGE_LOG_SIZE - 1):] + ((version, tuple(changed)),)
+            self._snapshot = StoreSnapshot(version, devices, readings, device_versions, changes)
+        for callback in self._listeners:
+            callback()
+
+    def install(self, snapshot):
+        """Publish a snapshot built elsewhere (e.g. received from the owner process)"""
+        with self._write_lock:
+            self._snapshot = snapshot
+        for callback in self._listeners:
+            callback()
+
+    def current(self):
+        """The current immutable snapshot"""
+        return self._snapshot
+
+    def as_dict(self):
+        """Device id -> dict form; callers must treat the result as read-only"""
+        return self._snapshot.devices
+
+    def snapshot(self):
+        """(version, device dict) from the same tick"""
+        snapshot = self._snapshot
+        return snapshot.version, snapshot.devices
+
+    def changes_since(self, since):
+        """(version, devices whose value changed after version `since`)"""
+        snapshot = self._snapshot
+        return snapshot.version, snapshot.changes_since(since)
+
+    def get(self, device_id):
+        """Dict form for one device, or None"""
+        return self._snapshot.devices.get(device_id)
+
+    def __len__(self):
+        return len(self._snapshot.devices)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics without external dependencies
+- Counter, Gauge and Histogram with label sets; a labelled child is created once
+  (under the metric lock) and afterwards updated with its own uncontended lock
+- CallbackMetric reads values only at scrape time (queue depths, component counters)
+- render() produces the Prometheus text exposition format (version 0.0.4)
+Metric objects are defined at module level where they are used and register
+themselves with REGISTRY.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+from structured_log import get_logger
+
+log = get_logger('Metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """All metrics of one process"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def collect(self, extra_labels=None):
+        """[(name, type, help, [(sample name, labels, value)])] for every metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                log.error('metrics.collect_failed', "Collecting {metric} failed: {error}", metric=metric.name, error=e)
+                continue
+            if extra_labels:
+                samples = [(name, dict(extra_labels, **labels), value) for name, labels, value in samples]
+            families.append((metric.name, metric.kind, metric.help, samples))
+        return families
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(*family_lists):
+    """Prometheus text format for one or more collect() results (same names are merged)"""
+    merged = {}
+    for families in family_lists:
+        for name, kind, help_text, samples in families:
+            if name in merged:
+                merged[name][2].extend(samples)
+            else:
+                merged[name] = (kind, help_text, list(samples))
+    lines = []
+    for name, (kind, help_text, samples) in merged.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}  # label values -> child
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """Child for one set of label values (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_dict(self, values):
+        return dict(zip(self.label_names, values))
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield self.name, self._label_dict(values), child.value
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket (not cumulative), last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = self._label_dict(values)
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', dict(labels, le=_format_value(float(bound))), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class CallbackMetric(_Metric):
+    """Metric read at scrape time: callback() yields (label values, value) pairs"""
+
+    def __init__(self, name, help_text, kind, callback, labels=(), registry=REGISTRY):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, help_text, labels, registry)
+
+    def samples(self):
+        for values, value in self.callback():
+            yield self.name, self._label_dict(values), value
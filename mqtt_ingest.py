@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT Ingestion Service
+- Subscribes to sensor topics (building/demo/# by default)
+- Parses, validates and normalizes payloads on a worker pool into the save_sensor_data schema
+- Writes through batched multi-row inserts (DatabaseManager.save_sensor_data_batch)
+- Bounded queues apply backpressure: when the writer falls behind, the MQTT network
+  thread blocks, stops reading the socket, and the broker holds back delivery
+- Reports sustained messages/s
+
+Local test:
+    mosquitto -c mosquitto/mosquitto.conf
+    python mqtt_ingest.py
+    python mqtt_publisher.py
+"""
+
+import os
+import math
+import time
+import queue
+import threading
+from collections import deque
+
+try:
+    import paho.mqtt.client as mqtt
+    MQTT_AVAILABLE = True
+except ImportError:
+    MQTT_AVAILABLE = False
+
+from structured_log import get_logger
+from json_codec import loads
+
+log = get_logger('MQTT Ingest')
+
+# Ingestion configuration - can be overridden by environment variables
+INGEST_CONFIG = {
+    'host': os.getenv('MQTT_BROKER', 'localhost'),
+    'port': int(os.getenv('MQTT_PORT', '1883')),
+    'topic': os.getenv('MQTT_TOPIC', 'building/demo/#'),
+    # Subscribed topics that carry no readings (the alert events published by the dashboard)
+    'ignore_topics': os.getenv('INGEST_IGNORE_TOPICS', 'building/demo/alerts/#'),
+    'qos': int(os.getenv('MQTT_QOS', '0')),
+    'client_id': os.getenv('INGEST_CLIENT_ID', 'sensor-ingest'),
+    'workers': int(os.getenv('INGEST_WORKERS', '4')),
+    'queue_size': int(os.getenv('INGEST_QUEUE_SIZE', '20000')),
+    'batch_size': int(os.getenv('INGEST_BATCH_SIZE', '1000')),
+    'flush_interval': float(os.getenv('INGEST_FLUSH_INTERVAL', '1.0')),
+    'rate_window': int(os.getenv('MQTT_RATE_WINDOW', '60'))  # seconds behind recent_messages_per_second
+}
+
+NUMERIC_FIELDS = ('value', 'powerW', 'voltage', 'current')
+
+_STOP = object()
+
+
+def _to_float(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError("boolean is not a measurement")
+    value = float(value)
+    if not math.isfinite(value):
+        # NaN / Infinity parse as JSON but would fail the whole database batch
+        raise ValueError("measurement is not a finite number")
+    return value
+
+
+def normalize_message(message, topic=None):
+    """Validate one message and map it to the save_sensor_data field schema
+
+    Returns the normalized dict, or raises ValueError if the message is invalid.
+    Topics of the form <prefix>/<kind>/<device_id> fill in a missing kind / deviceId.
+    """
+    if not isinstance(message, dict):
+        raise ValueError("payload is not a JSON object")
+
+    device_id = message.get('deviceId') or message.get('device_id')
+    kind = message.get('kind')
+    if topic and (not device_id or not kind):
+        parts = topic.split('/')
+        if len(parts) >= 2:
+            kind = kind or parts[-2]
+            device_id = device_id or parts[-1]
+
+    if not device_id or not isinstance(device_id, str):
+        raise ValueError("missing deviceId")
+    if not kind or not isinstance(kind, str):
+        raise ValueError("missing kind")
+    kind = kind.lower()
+
+    ts = message.get('ts')
+    if ts is None or isinstance(ts, bool):
+        raise ValueError("missing ts")
+    ts = _to_float(ts)
+    if ts < 1e11:
+        ts *= 1000  # seconds -> milliseconds
+
+    normalized = {
+        'deviceId': device_id,
+        'kind': kind,
+        'roomId': message.get('roomId') or message.get('room_id'),
+        'unit': message.get('unit'),
+        'ts': int(ts)
+    }
+    for field in NUMERIC_FIELDS:
+        if field in message:
+            normalized[field] = _to_float(message[field])
+
+    if normalized.get('value') is None and normalized.get('powerW') is None:
+        raise ValueError("missing value")
+    if kind == 'solar' and normalized.get('powerW') is None:
+        normalized['powerW'] = normalized['value']
+    if 'on' in message:
+        normalized['on'] = bool(message['on'])
+
+    return normalized
+
+
+def parse_payload(topic, payload):
+    """Decode one MQTT payload (single reading or batched room/tick message)"""
+    data = loads(payload)
+    if isinstance(data, dict) and isinstance(data.get('readings'), list):
+        ts = data.get('ts')
+        messages = []
+        for message in data['readings']:
+            if isinstance(message, dict) and ts is not None:
+                message.setdefault('ts', ts)
+            messages.append(message)
+        return messages
+    return [data]
+
+
+class MQTTIngestService:
+    """Subscribes to sensor topics and writes readings to the database in batches"""
+
+    def __init__(self, db_manager, host=None, port=None, topic=None, qos=None, workers=None,
+                 queue_size=None, batch_size=None, flush_interval=None, client_id=None, writer=None):
+        if not MQTT_AVAILABLE:
+            raise ImportError("paho-mqtt is required for the MQTT ingestion service")
+
+        self.db_manager = db_manager
+        # Batch writer: rows -> number saved (defaults to the database; the pipeline passes its own)
+        self.write_rows = writer or db_manager.save_sensor_data_batch
+        self.host = host or INGEST_CONFIG['host']
+        self.port = port or INGEST_CONFIG['port']
+        self.topic = topic or INGEST_CONFIG['topic']
+        self.ignore_topics = [item.strip() for item in INGEST_CONFIG['ignore_topics'].split(',') if item.strip()]
+        self.qos = INGEST_CONFIG['qos'] if qos is None else qos
+        self.worker_count = workers or INGEST_CONFIG['workers']
+        self.batch_size = batch_size or INGEST_CONFIG['batch_size']
+        self.flush_interval = flush_interval or INGEST_CONFIG['flush_interval']
+        queue_size = queue_size or INGEST_CONFIG['queue_size']
+
+        # Bounded queues: network thread -> parse workers -> batch writer
+        self.raw_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        self.running = False
+        self.connected = False
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.received_count = 0
+        self.ignored_count = 0
+        self.invalid_count = 0
+        self.written_count = 0
+        self.write_error_count = 0
+        self.batch_count = 0
+        self.backpressure_waits = 0
+        self.started_at = None
+        # (time, written before that flush) at most once per second, covering the rate window
+        self.rate_window = INGEST_CONFIG['rate_window']
+        self._rate_samples = deque(maxlen=self.rate_window + 1)
+
+        client_id = client_id or INGEST_CONFIG['client_id']
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            self.client = mqtt.Client(client_id=client_id)
+        # Limit unacknowledged QoS 1/2 deliveries so the broker holds back when we block
+        self.client.max_inflight_messages_set(100)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        self.connected = (rc == 0)
+        if self.connected:
+            client.subscribe(self.topic, qos=self.qos)
+            log.info('ingest.connected', "Connected to {host}:{port}, subscribed to {topic}", host=self.host, port=self.port, topic=self.topic)
+        else:
+            log.error('ingest.connect_refused', "Connection refused: {rc}", rc=rc)
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected = False
+        log.warning('ingest.disconnected', "Disconnected")
+
+    def _on_message(self, client, userdata, msg):
+        # Runs on the paho network thread: blocking here is the backpressure
+        self.received_count += 1
+        if any(mqtt.topic_matches_sub(pattern, msg.topic) for pattern in self.ignore_topics):
+            self.ignored_count += 1
+            return
+        item = (msg.topic, msg.payload)
+        try:
+            self.raw_queue.put_nowait(item)
+        except queue.Full:
+            self.backpressure_waits += 1
+            while self.running:
+                try:
+                    self.raw_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+    def _worker(self):
+        """Parse and normalize raw payloads"""
+        while True:
+            item = self.raw_queue.get()
+            if item is _STOP:
+                break
+            topic, payload = item
+            try:
+                messages = parse_payload(topic, payload)
+            except Exception:
+                with self._lock:
+                    self.invalid_count += 1
+                continue
+            for message in messages:
+                try:
+                    normalized = normalize_message(message, topic)
+                except (ValueError, TypeError):
+                    with self._lock:
+                        self.invalid_count += 1
+                    continue
+                self.write_queue.put(normalized)
+
+    def _writer(self):
+        """Drain normalized readings into batched inserts"""
+        pending = []
+        deadline = time.time() + self.flush_interval
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.time())
+            try:
+                item = self.write_queue.get(timeout=timeout)
+                if item is _STOP:
+                    stopping = True
+                else:
+                    pending.append(item)
+            except queue.Empty:
+                pass
+
+            if pending and (stopping or len(pending) >= self.batch_size or time.time() >= deadline):
+                self._flush(pending)
+                pending = []
+            if time.time() >= deadline:
+                deadline = time.time() + self.flush_interval
+
+    def _flush(self, rows):
+        saved = self.write_rows(rows)
+        self.batch_count += 1
+        if saved:
+            now = time.time()
+            with self._lock:
+                if not self._rate_samples or now - self._rate_samples[-1][0] >= 1:
+                    self._rate_samples.append((now, self.written_count))
+            self.written_count += saved
+        else:
+            self.write_error_count += len(rows)
+
+    def start(self):
+        """Start workers, writer and the MQTT network loop"""
+        self.running = True
+        self.started_at = time.time()
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker, name=f'ingest-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._writer_thread = threading.Thread(target=self._writer, name='ingest-writer', daemon=True)
+        self._writer_thread.start()
+
+        self.client.connect_async(self.host, self.port, keepalive=60)
+        self.client.loop_start()
+        log.info('ingest.started', "Started with {workers} workers, batch size {batch_size}",
+                 workers=self.worker_count, batch_size=self.batch_size)
+
+    def stop(self):
+        """Stop receiving, drain the queues and flush the last batch"""
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.running = False
+        for _ in self._threads:
+            self.raw_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self.write_queue.put(_STOP)
+        self._writer_thread.join()
+        log.info('ingest.stopped', "Stopped - written: {written}, invalid: {invalid}, write errors: {write_errors}",
+                 written=self.written_count, invalid=self.invalid_count, write_errors=self.write_error_count)
+
+    def get_stats(self):
+        """Ingestion throughput and queue statistics"""
+        now = time.time()
+        window_start = now - self.rate_window
+        with self._lock:
+            written = self.written_count
+            recent = next((written - count for sample_time, count in self._rate_samples if sample_time >= window_start), 0)
+        elapsed = now - self.started_at if self.started_at else 0
+        window = min(self.rate_window, elapsed)
+        return {
+            'connected': self.connected,
+            'topic': self.topic,
+            'received': self.received_count,
+            'ignored': self.ignored_count,
+            'invalid': self.invalid_count,
+            'written': written,
+            'write_errors': self.write_error_count,
+            'batches': self.batch_count,
+            'backpressure_waits': self.backpressure_waits,
+            'raw_queue_depth': self.raw_queue.qsize(),
+            'write_queue_depth': self.write_queue.qsize(),
+            'messages_per_second': round(written / elapsed, 1) if elapsed > 0 else 0,
+            'recent_messages_per_second': round(recent / window, 1) if window > 0 else 0
+        }
+
+
+def main():
+    """Run the ingestion service until interrupted"""
+    from database import DatabaseManager
+
+    print("=" * 60)
+    print("📥 MQTT Ingestion Service")
+    print("=" * 60)
+
+    service = MQTTIngestService(DatabaseManager())
+    service.start()
+    report_interval = float(os.getenv('INGEST_REPORT_INTERVAL', '10'))
+
+    try:
+        while True:
+            time.sleep(report_interval)
+            print(f"[MQTT Ingest] {service.get_stats()}")
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping ingestion...")
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT Publisher Sink for the simulator
+- Publishes each tick's readings to a broker (local mosquitto by default)
+- Batch modes: one message per device, per room or per tick
+- Publishing is pipelined: paho's network thread drains the queue while the simulator keeps running
+- Tracks publish throughput and latency (publish call -> broker ack / socket write)
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+try:
+    import paho.mqtt.client as mqtt
+    MQTT_AVAILABLE = True
+except ImportError:
+    MQTT_AVAILABLE = False
+
+from structured_log import get_logger
+from json_codec import dumpb
+
+log = get_logger('MQTT Publisher')
+
+# MQTT configuration - can be overridden by environment variables
+MQTT_CONFIG = {
+    'host': os.getenv('MQTT_BROKER', 'localhost'),
+    'port': int(os.getenv('MQTT_PORT', '1883')),
+    'qos': int(os.getenv('MQTT_QOS', '0')),
+    'topic_prefix': os.getenv('MQTT_TOPIC_PREFIX', 'building/demo'),
+    'batch_mode': os.getenv('MQTT_BATCH_MODE', 'device'),  # device, room or tick
+    'max_inflight': int(os.getenv('MQTT_MAX_INFLIGHT', '1000')),
+    'max_queued': int(os.getenv('MQTT_MAX_QUEUED', '100000')),
+    'client_id': os.getenv('MQTT_CLIENT_ID', 'sensor-simulator'),
+    'rate_window': int(os.getenv('MQTT_RATE_WINDOW', '60'))  # seconds behind recent_messages_per_second
+}
+
+# Topic layout per batch mode
+TOPIC_TEMPLATES = {
+    'device': os.getenv('MQTT_DEVICE_TOPIC', '{prefix}/{kind}/{device_id}'),
+    'room': os.getenv('MQTT_ROOM_TOPIC', '{prefix}/rooms/{room_id}'),
+    'tick': os.getenv('MQTT_TICK_TOPIC', '{prefix}/ticks'),
+    'alert': os.getenv('MQTT_ALERT_TOPIC', '{prefix}/alerts/{rule_id}/{device_id}')
+}
+
+BATCH_MODES = ('device', 'room', 'tick')
+
+
+class MQTTPublisher:
+    """Publishes ReadingBatch ticks to an MQTT broker"""
+
+    def __init__(self, host=None, port=None, qos=None, topic_prefix=None, batch_mode=None,
+                 max_inflight=None, max_queued=None, client_id=None):
+        if not MQTT_AVAILABLE:
+            raise ImportError("paho-mqtt is required for the MQTT publisher")
+
+        self.host = host or MQTT_CONFIG['host']
+        self.port = port or MQTT_CONFIG['port']
+        self.qos = MQTT_CONFIG['qos'] if qos is None else qos
+        self.topic_prefix = topic_prefix or MQTT_CONFIG['topic_prefix']
+        self.batch_mode = batch_mode or MQTT_CONFIG['batch_mode']
+        if self.batch_mode not in BATCH_MODES:
+            raise ValueError(f"Unknown MQTT batch mode '{self.batch_mode}' (expected one of {BATCH_MODES})")
+
+        # Topic strings are formatted once per device / room and reused
+        self._topics = {}
+
+        # Publish statistics
+        self.connected = False
+        self.published_count = 0
+        self.acked_count = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+        self.started_at = None
+        self._pending = {}  # mid -> publish time
+        self._latencies = deque(maxlen=10000)
+        self._lock = threading.RLock()
+        # (time, published before that publish) at most once per second, covering the rate window
+        self.rate_window = MQTT_CONFIG['rate_window']
+        self._rate_samples = deque(maxlen=self.rate_window + 1)
+
+        client_id = client_id or MQTT_CONFIG['client_id']
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            self.client = mqtt.Client(client_id=client_id)
+        self.client.max_inflight_messages_set(max_inflight or MQTT_CONFIG['max_inflight'])
+        self._max_pending = max_queued or MQTT_CONFIG['max_queued']
+        self.client.max_queued_messages_set(self._max_pending)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        self.connected = (rc == 0)
+        if self.connected:
+            log.info('mqtt.connected', "Connected to {host}:{port}", host=self.host, port=self.port)
+        else:
+            log.error('mqtt.connect_refused', "Connection refused: {rc}", rc=rc)
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected = False
+        log.warning('mqtt.disconnected', "Disconnected")
+
+    def _on_publish(self, client, userdata, mid, *args):
+        now = time.time()
+        with self._lock:
+            sent_at = self._pending.pop(mid, None)
+            self.acked_count += 1
+            if sent_at is not None:
+                self._latencies.append(now - sent_at)
+
+    def connect(self):
+        """Connect and start the background network loop"""
+        self.client.connect_async(self.host, self.port, keepalive=60)
+        self.client.loop_start()
+        self.started_at = time.time()
+        log.info('mqtt.publishing', "Publishing to {host}:{port} (qos={qos}, mode={mode})",
+                 host=self.host, port=self.port, qos=self.qos, mode=self.batch_mode)
+
+    def disconnect(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        log.info('mqtt.stopped', "Stopped - published: {published}, errors: {errors}",
+                 published=self.published_count, errors=self.error_count)
+
+    def _topic(self, mode, key, **fields):
+        topic = self._topics.get((mode, key))
+        if topic is None:
+            topic = TOPIC_TEMPLATES[mode].format(prefix=self.topic_prefix, **fields)
+            self._topics[(mode, key)] = topic
+        return topic
+
+    def _publish(self, topic, payload):
+        with self._lock:
+            info = self.client.publish(topic, payload, qos=self.qos)
+            # QoS 0 messages are dropped while disconnected, QoS 1/2 stay queued in the client
+            if info.rc != mqtt.MQTT_ERR_SUCCESS and not (info.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0):
+                self.error_count += 1
+                return
+            # Messages dropped by the client never report back; keep the latency map bounded
+            if len(self._pending) >= self._max_pending:
+                self._pending.clear()
+            now = time.time()
+            self._pending[info.mid] = now
+            if not self._rate_samples or now - self._rate_samples[-1][0] >= 1:
+                self._rate_samples.append((now, self.published_count))
+            self.published_count += 1
+            self.bytes_sent += len(payload)
+
+    def publish_batch(self, batch):
+        """Publish one simulator tick according to the batch mode"""
+        ts_ms = batch.ts_ms
+
+        if self.batch_mode == 'device':
+            for reading in batch.readings:
+                device = reading.device
+                topic = self._topic('device', device.device_id, kind=device.kind, device_id=device.device_id, room_id=device.room_id)
+                self._publish(topic, dumpb(reading.to_message(ts_ms)))
+
+        elif self.batch_mode == 'room':
+            rooms = {}
+            for reading in batch.readings:
+                rooms.setdefault(reading.device.room_id, []).append(reading.to_message(ts_ms))
+            for room_id, messages in rooms.items():
+                topic = self._topic('room', room_id, room_id=room_id)
+                self._publish(topic, dumpb({'roomId': room_id, 'ts': ts_ms, 'readings': messages}))
+
+        else:
+            messages = [reading.to_message(ts_ms) for reading in batch.readings]
+            self._publish(self._topic('tick', None), dumpb({'ts': ts_ms, 'readings': messages}))
+
+    def publish_alert(self, event):
+        """Publish one fired / resolved alert event (see alerts.AlertEngine)"""
+        topic = self._topic('alert', (event['rule_id'], event['device_id']),
+                            rule_id=event['rule_id'], device_id=event['device_id'], room_id=event['room_id'])
+        self._publish(topic, dumpb(event))
+
+    def get_stats(self):
+        """Publish throughput and latency statistics"""
+        now = time.time()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            published = self.published_count
+            acked = self.acked_count
+            pending = len(self._pending)
+            window_start = now - self.rate_window
+            recent = next((published - count for sample_time, count in self._rate_samples if sample_time >= window_start), 0)
+
+        elapsed = now - self.started_at if self.started_at else 0
+        window = min(self.rate_window, elapsed)
+        stats = {
+            'connected': self.connected,
+            'host': self.host,
+            'port': self.port,
+            'qos': self.qos,
+            'batch_mode': self.batch_mode,
+            'published': published,
+            'acked': acked,
+            'pending': pending,
+            'errors': self.error_count,
+            'bytes_sent': self.bytes_sent,
+            'messages_per_second': round(published / elapsed, 1) if elapsed > 0 else 0,
+            'recent_messages_per_second': round(recent / window, 1) if window > 0 else 0
+        }
+        if latencies:
+            stats['latency_ms'] = {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 3),
+                'p50': round(latencies[len(latencies) // 2] * 1000, 3),
+                'p99': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3)
+            }
+        return stats
+
+
+def main():
+    """Publish synthetic ticks for the configured topology as fast as possible"""
+    import random
+    from datetime import datetime
+    from readings import ReadingBatch
+    from topology import load_topology
+
+    print("=" * 60)
+    print("📡 MQTT Publisher Throughput Test")
+    print("=" * 60)
+
+    topology = load_topology()
+    publisher = MQTTPublisher()
+    publisher.connect()
+    time.sleep(1)
+
+    duration = float(os.getenv('MQTT_TEST_SECONDS', '10'))
+    end_time = time.time() + duration
+    ticks = 0
+    try:
+        while time.time() < end_time:
+            batch = ReadingBatch(datetime.now())
+            for device, base, noise in zip(topology.devices, topology.base, topology.noise):
+                batch.add(device, round(base + random.uniform(-noise, noise), 1))
+            publisher.publish_batch(batch)
+            ticks += 1
+            if ticks % 100 == 0:
+                print(f"[MQTT Publisher] {publisher.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+
+    time.sleep(1)
+    print(f"[MQTT Publisher] Ticks: {ticks}, final stats: {publisher.get_stats()}")
+    publisher.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,736 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming Reading Pipeline
+- Sources (simulator, MQTT, file replay) emit ReadingBatch objects
+- Stages (validation, deadband, enrichment, aggregation) transform batches
+- Sinks (latest-value store, database, MQTT, file) consume them
+Every stage and sink has its own bounded queue, worker thread and throughput
+counters. Batches move through once; stages that filter or rewrite readings
+derive new batches instead of mutating shared ones. Deadband and aggregation
+are enabled with PIPELINE_DEADBANDS / PIPELINE_AGGREGATE_WINDOW.
+"""
+
+import os
+import math
+import time
+import queue
+import threading
+from datetime import datetime
+
+from readings import DeviceDescriptor, Reading, ReadingBatch
+from metrics import Histogram, CallbackMetric
+from structured_log import get_logger
+from json_codec import dumps, loads
+
+# Started pipelines, read by the metrics callbacks below
+_PIPELINES = []
+
+log = get_logger('Pipeline')
+
+_STOP = object()
+_TIMER = object()
+
+# Physically plausible ranges per sensor kind (anything outside is dropped by validation)
+VALID_RANGES = {
+    'temperature': (-50.0, 100.0),
+    'humidity': (0.0, 100.0),
+    'co2': (0.0, 10000.0),
+    'light': (0.0, 200000.0),
+    'solar': (0.0, 1.0e7)
+}
+
+# Device-reported fields carried alongside the main value
+EXTRA_FIELDS = ('on', 'powerW', 'voltage', 'current')
+
+# Optional data-reduction stages - can be enabled by environment variables
+PIPELINE_CONFIG = {
+    # kind:band pairs, e.g. 'temperature:0.1,co2:10' (empty = no deadband stage)
+    'deadbands': {kind.strip(): float(band) for kind, band in
+                  (item.split(':') for item in os.getenv('PIPELINE_DEADBANDS', '').split(',') if item.strip())},
+    'deadband_heartbeat': int(os.getenv('PIPELINE_DEADBAND_HEARTBEAT', '300')),  # seconds
+    'aggregate_window': int(os.getenv('PIPELINE_AGGREGATE_WINDOW', '0'))  # seconds, 0 = no aggregation stage
+}
+
+
+class Stage:
+    """Pipeline stage with its own input queue, worker thread and counters"""
+
+    def __init__(self, name=None, queue_size=100, overflow='block', timer_interval=None):
+        self.name = name or type(self).__name__
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflow = overflow  # 'block' applies backpressure upstream, 'drop' discards
+        self.timer_interval = timer_interval
+        self.downstream = []
+        self.running = False
+        self._thread = None
+
+        # Counters
+        self.batches_in = 0
+        self.readings_in = 0
+        self.batches_out = 0
+        self.readings_out = 0
+        self.dropped_batches = 0
+        self.error_count = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    def process(self, batch):
+        """Transform one batch; return the batch to pass on, or None"""
+        return batch
+
+    def on_timer(self):
+        """Called every timer_interval seconds; may return a batch to pass on"""
+        return None
+
+    def on_stop(self):
+        """Called once after the queue is drained on shutdown; may return a batch"""
+        return None
+
+    def put(self, batch):
+        if self.overflow == 'drop':
+            try:
+                self.queue.put_nowait(batch)
+            except queue.Full:
+                self.dropped_batches += 1
+        else:
+            self.queue.put(batch)
+
+    def emit(self, batch):
+        if batch is None or not len(batch):
+            return
+        self.batches_out += 1
+        self.readings_out += len(batch)
+        for stage in self.downstream:
+            stage.put(batch)
+
+    def start(self):
+        self.running = True
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f'pipeline-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Drain the queue, run on_stop and wait for the worker thread"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self.running = False
+
+    def _call(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            self.emit(fn(*args))
+        except Exception as e:
+            self.error_count += 1
+            log.error('pipeline.stage_error', "{stage} error: {error}", stage=self.name, error=e)
+        self.busy_seconds += time.perf_counter() - started
+
+    def _run(self):
+        interval = self.timer_interval
+        next_timer = time.time() + interval if interval else None
+
+        while True:
+            timeout = max(0.0, next_timer - time.time()) if next_timer else None
+            try:
+                batch = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                batch = _TIMER
+
+            if batch is _STOP:
+                self._call(self.on_stop)
+                break
+            if batch is not _TIMER:
+                self.batches_in += 1
+                self.readings_in += len(batch)
+                self._call(self.process, batch)
+            if next_timer and time.time() >= next_timer:
+                self._call(self.on_timer)
+                next_timer = time.time() + interval
+
+    def get_stats(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return {
+            'name': self.name,
+            'running': self.running,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'batches_in': self.batches_in,
+            'readings_in': self.readings_in,
+            'batches_out': self.batches_out,
+            'readings_out': self.readings_out,
+            'dropped_batches': self.dropped_batches,
+            'errors': self.error_count,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'readings_per_second': round(self.readings_in / elapsed, 1) if elapsed > 0 else 0
+        }
+
+
+class Sink(Stage):
+    """Terminal stage: consumes batches and passes nothing on"""
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def process(self, batch):
+        self.write(batch)
+        return None
+
+
+class Source:
+    """Produces batches on its own thread and hands them to the pipeline"""
+
+    def __init__(self, name=None):
+        self.name = name or type(self).__name__
+        self.running = False
+        self.batches_out = 0
+        self.readings_out = 0
+        self._emit = None
+        self._thread = None
+
+    def emit(self, batch):
+        if batch is None or not len(batch):
+            return
+        self.batches_out += 1
+        self.readings_out += len(batch)
+        self._emit(batch)
+
+    def run(self):
+        """Produce batches by calling self.emit() until stopped"""
+        raise NotImplementedError
+
+    def start(self, emit):
+        self._emit = emit
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f'source-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.run()
+        except Exception as e:
+            log.error('pipeline.source_error', "Source {source} error: {error}", source=self.name, error=e)
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        return {
+            'name': self.name,
+            'running': self.running,
+            'batches_out': self.batches_out,
+            'readings_out': self.readings_out
+        }
+
+
+def _stage_samples(stat):
+    """Metrics callback: (pipeline, stage) label pairs with one get_stats() field of every stage and sink"""
+    def callback():
+        for pipeline in list(_PIPELINES):
+            for stage in pipeline.stages + pipeline.sinks:
+                yield (pipeline.name, stage.name), stage.get_stats()[stat]
+    return callback
+
+
+CallbackMetric('pipeline_queue_depth', 'Batches waiting in a stage or sink queue', 'gauge',
+               _stage_samples('queue_depth'), labels=('pipeline', 'stage'))
+CallbackMetric('pipeline_readings_total', 'Readings consumed by a stage or sink', 'counter',
+               _stage_samples('readings_in'), labels=('pipeline', 'stage'))
+CallbackMetric('pipeline_dropped_batches_total', 'Batches dropped on a full queue', 'counter',
+               _stage_samples('dropped_batches'), labels=('pipeline', 'stage'))
+CallbackMetric('pipeline_errors_total', 'Errors raised while processing batches', 'counter',
+               _stage_samples('errors'), labels=('pipeline', 'stage'))
+CallbackMetric('pipeline_busy_seconds_total', 'Time spent processing batches', 'counter',
+               _stage_samples('busy_seconds'), labels=('pipeline', 'stage'))
+
+DB_FLUSH_SECONDS = Histogram('db_flush_duration_seconds', 'Duration of one batched database save',
+                             labels=('sink',))
+DB_FLUSH_ROWS = Histogram('db_flush_rows', 'Rows in one batched database save', labels=('sink',),
+                          buckets=(1, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000))
+
+
+class Pipeline:
+    """Sources -> stages (in order) -> fan-out to sinks"""
+
+    def __init__(self, sources=(), stages=(), sinks=(), name='pipeline'):
+        self.name = name
+        self.sources = list(sources)
+        self.stages = list(stages)
+        self.sinks = list(sinks)
+        self.running = False
+        self.pushed_batches = 0
+
+    def add_source(self, source):
+        self.sources.append(source)
+        if self.running:
+            source.start(self.push)
+
+    def add_stage(self, stage):
+        if self.running:
+            raise RuntimeError("Stages must be added before the pipeline starts")
+        self.stages.append(stage)
+
+    def add_sink(self, sink):
+        if self.running:
+            raise RuntimeError("Sinks must be added before the pipeline starts")
+        self.sinks.append(sink)
+
+    def start(self):
+        # Link stages in order; the last one fans out to every sink
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.downstream = [next_stage]
+        if self.stages:
+            self.stages[-1].downstream = list(self.sinks)
+
+        for sink in self.sinks:
+            sink.start()
+        for stage in reversed(self.stages):
+            stage.start()
+        self.running = True
+        if self not in _PIPELINES:
+            _PIPELINES.append(self)
+        for source in self.sources:
+            source.start(self.push)
+        log.info('pipeline.started', "{pipeline} started: {sources} sources, {stages} stages, {sinks} sinks",
+                 pipeline=self.name, sources=len(self.sources), stages=len(self.stages), sinks=len(self.sinks))
+
+    def push(self, batch):
+        """Entry point for sources (and anything else producing batches)"""
+        if batch is None or not len(batch):
+            return
+        self.pushed_batches += 1
+        if self.stages:
+            self.stages[0].put(batch)
+        else:
+            for sink in self.sinks:
+                sink.put(batch)
+
+    def stop(self):
+        """Stop sources, then drain stages and sinks in order"""
+        for source in self.sources:
+            source.stop()
+        for stage in self.stages:
+            stage.stop()
+        for sink in self.sinks:
+            sink.stop()
+        self.running = False
+        log.info('pipeline.stopped', "{pipeline} stopped", pipeline=self.name)
+
+    def get_stats(self):
+        return {
+            'name': self.name,
+            'running': self.running,
+            'pushed_batches': self.pushed_batches,
+            'sources': [source.get_stats() for source in self.sources],
+            'stages': [stage.get_stats() for stage in self.stages],
+            'sinks': [sink.get_stats() for sink in self.sinks]
+        }
+
+
+# ---------------------------------------------------------------------------
+# Message decoding (MQTT / file payloads -> ReadingBatch)
+# ---------------------------------------------------------------------------
+
+class MessageDecoder:
+    """Turns normalized message dicts into ReadingBatch objects grouped by timestamp"""
+
+    def __init__(self, topology=None):
+        self.topology = topology
+        self._descriptors = {}
+
+    def descriptor(self, message):
+        device_id = message['deviceId']
+        device = self._descriptors.get(device_id)
+        if device is None:
+            if self.topology is not None:
+                device = self.topology.get_device(device_id)
+            if device is None:
+                device = DeviceDescriptor(device_id, message.get('kind', ''), message.get('unit') or '',
+                                          message.get('roomId'), index=-1)
+            self._descriptors[device_id] = device
+        return device
+
+    def batches(self, messages):
+        batches = {}
+        for message in messages:
+            ts = message['ts']
+            batch = batches.get(ts)
+            if batch is None:
+                batch = batches[ts] = ReadingBatch(datetime.fromtimestamp(ts / 1000))
+            value = message.get('value')
+            if value is None:
+                value = message.get('powerW')
+            extra = {field: message[field] for field in EXTRA_FIELDS if message.get(field) is not None}
+            batch.add(self.descriptor(message), value, extra=extra or None)
+        return list(batches.values())
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+class SimulatorSource(Source):
+    """Runs a simulator whose run() loop calls simulator.emit(batch) every tick"""
+
+    def __init__(self, simulator, name='simulator'):
+        super().__init__(name)
+        self.simulator = simulator
+        simulator.emit = self.emit
+
+    def run(self):
+        self.simulator.run()
+
+    def stop(self):
+        super().stop()
+        self.simulator.stop()
+
+
+class MQTTSource(Source):
+    """Subscribes to sensor topics through the ingestion service's worker pool"""
+
+    def __init__(self, topology=None, name='mqtt', **ingest_options):
+        super().__init__(name)
+        self.decoder = MessageDecoder(topology)
+        self.ingest_options = ingest_options
+        self.service = None
+
+    def _write_rows(self, rows):
+        for batch in self.decoder.batches(rows):
+            self.emit(batch)
+        return len(rows)
+
+    def start(self, emit):
+        from mqtt_ingest import MQTTIngestService
+        self._emit = emit
+        self.running = True
+        self.service = MQTTIngestService(None, writer=self._write_rows, **self.ingest_options)
+        self.service.start()
+
+    def stop(self):
+        if self.service and self.running:
+            self.service.stop()
+        self.running = False
+
+    def get_stats(self):
+        stats = super().get_stats()
+        if self.service:
+            stats['ingest'] = self.service.get_stats()
+        return stats
+
+
+class FileReplaySource(Source):
+    """Replays a JSON-lines file of messages (as written by FileSink)
+
+    speed=0 replays as fast as possible, speed=1.0 in real time, 10.0 ten times faster.
+    """
+
+    def __init__(self, path, speed=0.0, loop=False, topology=None, name='file-replay'):
+        super().__init__(name)
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.decoder = MessageDecoder(topology)
+
+    def run(self):
+        from mqtt_ingest import normalize_message
+
+        while self.running:
+            last_ts = None
+            pending = []
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not self.running:
+                        return
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        message = normalize_message(loads(line))
+                    except (ValueError, TypeError):
+                        continue
+                    if last_ts is not None and message['ts'] != last_ts:
+                        self._replay(pending, message['ts'] - last_ts)
+                        pending = []
+                    last_ts = message['ts']
+                    pending.append(message)
+            self._replay(pending, 0)
+            if not self.loop:
+                break
+
+    def _replay(self, messages, gap_ms):
+        for batch in self.decoder.batches(messages):
+            self.emit(batch)
+        if self.speed > 0 and gap_ms > 0:
+            time.sleep(gap_ms / 1000.0 / self.speed)
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+class ValidationStage(Stage):
+    """Drops readings without a finite value or outside the plausible range for their kind;
+    passes the rest on with float values"""
+
+    def __init__(self, ranges=None, **kwargs):
+        super().__init__(**kwargs)
+        self.ranges = dict(VALID_RANGES)
+        if ranges:
+            self.ranges.update(ranges)
+        self.invalid_count = 0
+
+    def _value(self, reading):
+        """The reading's value as a float, or None if it is invalid"""
+        value = reading.value
+        if value is None or isinstance(value, bool):
+            return None
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(value):
+            return None
+        bounds = self.ranges.get(reading.device.kind)
+        return value if bounds is None or bounds[0] <= value <= bounds[1] else None
+
+    def process(self, batch):
+        valid = []
+        converted = False
+        for reading in batch.readings:
+            value = self._value(reading)
+            if value is None:
+                continue
+            if not isinstance(reading.value, float):
+                # Numeric strings / ints from MQTT or files: later stages and sinks do float math
+                reading = Reading(reading.device, value, reading.major_change, reading.extra, reading.anomaly)
+                converted = True
+            valid.append(reading)
+        if len(valid) == len(batch) and not converted:
+            return batch
+        self.invalid_count += len(batch) - len(valid)
+        return batch.derive(valid)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['invalid_readings'] = self.invalid_count
+        return stats
+
+
+class DeadbandStage(Stage):
+    """Forwards a reading only if it moved more than the kind's deadband, or on heartbeat"""
+
+    def __init__(self, deadbands=None, default=0.0, heartbeat=300, **kwargs):
+        super().__init__(**kwargs)
+        self.deadbands = deadbands or {}
+        self.default = default
+        self.heartbeat = heartbeat
+        self._last = {}  # device_id -> (value, epoch seconds)
+        self.suppressed_count = 0
+
+    def process(self, batch):
+        now = batch.timestamp.timestamp()
+        last = self._last
+        passed = []
+        for reading in batch.readings:
+            device = reading.device
+            previous = last.get(device.device_id)
+            if previous is not None:
+                band = self.deadbands.get(device.kind, self.default)
+                if abs(reading.value - previous[0]) < band and now - previous[1] < self.heartbeat:
+                    continue
+            last[device.device_id] = (reading.value, now)
+            passed.append(reading)
+
+        self.suppressed_count += len(batch) - len(passed)
+        return batch if len(passed) == len(batch) else batch.derive(passed)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['suppressed_readings'] = self.suppressed_count
+        return stats
+
+
+class EnrichmentStage(Stage):
+    """Replaces ad-hoc descriptors with topology descriptors (fills unit, room, index)"""
+
+    def __init__(self, topology, **kwargs):
+        super().__init__(**kwargs)
+        self.topology = topology
+
+    def process(self, batch):
+        get_device = self.topology.get_device
+        readings = None
+        for position, reading in enumerate(batch.readings):
+            if reading.device.index >= 0:
+                continue
+            device = get_device(reading.device.device_id)
+            if device is None:
+                continue
+            # Enriched copies; the incoming batch is left untouched
+            if readings is None:
+                readings = list(batch.readings)
+            readings[position] = Reading(device, reading.value, reading.major_change, reading.extra, reading.anomaly)
+        return batch if readings is None else batch.derive(readings)
+
+
+class AggregationStage(Stage):
+    """Averages readings per device over a fixed window and emits one batch per window"""
+
+    def __init__(self, window=60, decimals=3, **kwargs):
+        kwargs.setdefault('timer_interval', window)
+        super().__init__(**kwargs)
+        self.window = window
+        self.decimals = decimals
+        self._sums = {}  # device_id -> [descriptor, sum, count, major_change]
+
+    def process(self, batch):
+        sums = self._sums
+        for reading in batch.readings:
+            entry = sums.get(reading.device.device_id)
+            if entry is None:
+                sums[reading.device.device_id] = [reading.device, reading.value, 1, reading.major_change]
+            else:
+                entry[1] += reading.value
+                entry[2] += 1
+                if reading.major_change:
+                    entry[3] = True
+        return None
+
+    def on_timer(self):
+        if not self._sums:
+            return None
+        batch = ReadingBatch(datetime.now())
+        for device, total, count, major_change in self._sums.values():
+            batch.add(device, round(total / count, self.decimals), major_change)
+        self._sums = {}
+        return batch
+
+    def on_stop(self):
+        return self.on_timer()
+
+
+def reduction_stages(config=None):
+    """Deadband / aggregation stages enabled in PIPELINE_CONFIG, in pipeline order"""
+    config = config or PIPELINE_CONFIG
+    stages = []
+    if config['deadbands']:
+        stages.append(DeadbandStage(config['deadbands'], heartbeat=config['deadband_heartbeat'], name='Deadband'))
+    if config['aggregate_window'] > 0:
+        stages.append(AggregationStage(config['aggregate_window'], name='Aggregation'))
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+class LatestValueSink(Sink):
+    """Keeps the latest reading per device in a LatestValueStore"""
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def write(self, batch):
+        self.store.update(batch)
+
+
+class DatabaseSink(Sink):
+    """Writes readings with batched inserts
+
+    interval=0 writes every batch as it arrives; interval>0 keeps the latest reading
+    per device and saves them all once per interval (the dashboard's 5-minute snapshot).
+    """
+
+    def __init__(self, db_manager, interval=0, **kwargs):
+        if interval:
+            kwargs.setdefault('timer_interval', interval)
+        super().__init__(**kwargs)
+        self.db_manager = db_manager
+        self.interval = interval
+        self._pending = {}  # device_id -> (Reading, ts in ms)
+        self.log = get_logger(self.name)
+        self.save_count = 0
+        self.saved_rows = 0
+
+    def write(self, batch):
+        if self.interval:
+            ts_ms = batch.ts_ms
+            for reading in batch.readings:
+                self._pending[reading.device.device_id] = (reading, ts_ms)
+        else:
+            ts_ms = batch.ts_ms
+            self._save([reading.to_message(ts_ms) for reading in batch.readings])
+
+    def on_timer(self):
+        if not self._pending:
+            self.log.debug('db.save_skipped', "No new readings, skipping save")
+            return None
+        rows = [reading.to_message(ts_ms) for reading, ts_ms in self._pending.values()]
+        self._pending = {}
+        self._save(rows)
+        self.log.info('db.scheduled_save', "Save #{save}: {devices} devices saved to specific sensor tables",
+                      save=self.save_count, devices=len(rows))
+        return None
+
+    def _save(self, rows):
+        started = time.perf_counter()
+        saved = self.db_manager.save_sensor_data_batch(rows)
+        DB_FLUSH_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+        DB_FLUSH_ROWS.labels(self.name).observe(len(rows))
+        self.save_count += 1
+        if saved:
+            self.saved_rows += saved
+        else:
+            self.error_count += 1
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({'interval': self.interval, 'saves': self.save_count, 'saved_rows': self.saved_rows})
+        return stats
+
+
+class MQTTSink(Sink):
+    """Publishes batches through an MQTTPublisher"""
+
+    def __init__(self, publisher, **kwargs):
+        super().__init__(**kwargs)
+        self.publisher = publisher
+
+    def write(self, batch):
+        self.publisher.publish_batch(batch)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['publisher'] = self.publisher.get_stats()
+        return stats
+
+
+class FileSink(Sink):
+    """Appends readings as JSON lines in the MQTT message schema (replayable by FileReplaySource)"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._file = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        super().start()
+
+    def write(self, batch):
+        ts_ms = batch.ts_ms
+        self._file.write(''.join(dumps(reading.to_message(ts_ms)) + '\n' for reading in batch.readings))
+        self._file.flush()
+
+    def on_stop(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        return None
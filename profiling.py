@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Slow-query log and opt-in request profiling
+- SlowQueryLog keeps the most recent database statements slower than
+  SLOW_QUERY_MS (statement, parameters, duration, row count, DatabaseManager method)
+- RequestProfiler profiles one request at a time when it carries ?profile= and the
+  DEBUG_SECRET: 'sample' takes stack samples and returns folded stacks for
+  flamegraph.pl / speedscope; any other value runs cProfile and returns a pstats
+  report (profile_format=pstats returns the binary dump for pstats / snakeviz)
+Profiling is disabled unless DEBUG_SECRET is set.
+"""
+
+import os
+import sys
+import time
+import hmac
+import io
+import marshal
+import cProfile
+import pstats
+import threading
+from collections import deque, Counter
+from datetime import datetime
+
+# Profiling configuration - can be overridden by environment variables
+PROFILING_CONFIG = {
+    'slow_query_ms': float(os.getenv('SLOW_QUERY_MS', '200')),
+    'slow_query_log': int(os.getenv('SLOW_QUERY_LOG', '100')),  # statements kept
+    'secret': os.getenv('DEBUG_SECRET') or None,
+    'sample_interval': float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.001')),  # seconds between stack samples
+    'report_lines': int(os.getenv('PROFILE_LINES', '60'))
+}
+
+MAX_STATEMENT_CHARS = 2000
+MAX_PARAMETER_CHARS = 500
+
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit] + f'... ({len(text)} chars)'
+
+
+class SlowQueryLog:
+    """Bounded log of statements slower than the threshold"""
+
+    def __init__(self, threshold_ms=None, size=None):
+        self.threshold = (PROFILING_CONFIG['slow_query_ms'] if threshold_ms is None else threshold_ms) / 1000.0
+        self._entries = deque(maxlen=size or PROFILING_CONFIG['slow_query_log'])
+        self.recorded = 0
+
+    def record(self, statement, parameters, duration, rowcount, operation, executemany=False):
+        """Keep one statement if it took at least the threshold (seconds)"""
+        if duration < self.threshold:
+            return
+        if executemany and isinstance(parameters, (list, tuple)):
+            parameters = f'{len(parameters)} parameter sets, first: {parameters[0] if parameters else None!r}'
+        self._entries.append({
+            'timestamp': datetime.now().isoformat(),
+            'duration_ms': round(duration * 1000.0, 3),
+            'operation': operation,
+            'statement': _truncate(' '.join(statement.split()), MAX_STATEMENT_CHARS),
+            'parameters': _truncate(parameters if isinstance(parameters, str) else repr(parameters),
+                                    MAX_PARAMETER_CHARS),
+            'rowcount': rowcount if rowcount is not None and rowcount >= 0 else None,
+            'executemany': executemany
+        })
+        self.recorded += 1
+
+    def snapshot(self, limit=None):
+        """Logged statements, newest first"""
+        entries = list(self._entries)[::-1]
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self):
+        return {
+            'threshold_ms': self.threshold * 1000.0,
+            'entries': len(self._entries),
+            'max_entries': self._entries.maxlen,
+            'recorded': self.recorded
+        }
+
+
+class _CProfileSession:
+    """Deterministic profile of the request thread"""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def report(self, output_format=None):
+        """(body, mimetype)"""
+        self.profiler.create_stats()
+        if output_format == 'pstats':
+            return marshal.dumps(self.profiler.stats), 'application/octet-stream'
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(PROFILING_CONFIG['report_lines'])
+        return out.getvalue(), 'text/plain'
+
+
+class _SamplingSession:
+    """Stack samples of the request thread, aggregated into folded stacks"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def report(self, output_format=None):
+        """(body, mimetype): one 'frame;frame;frame count' line per distinct stack"""
+        lines = [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n', 'text/plain'
+
+
+class RequestProfiler:
+    """Profiles one request at a time for callers that present the debug secret"""
+
+    def __init__(self, secret=None, sample_interval=None):
+        self.secret = secret if secret is not None else PROFILING_CONFIG['secret']
+        self.sample_interval = sample_interval or PROFILING_CONFIG['sample_interval']
+        self._busy = threading.Lock()
+        self.profiled = 0
+
+    @property
+    def enabled(self):
+        return bool(self.secret)
+
+    def authorized(self, provided):
+        return self.enabled and bool(provided) and hmac.compare_digest(str(provided), self.secret)
+
+    def start(self, mode):
+        """Start profiling the calling thread; None if another request is being profiled"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            session = _SamplingSession(self.sample_interval) if mode == 'sample' else _CProfileSession()
+        except Exception:
+            self._busy.release()
+            raise
+        session.started = time.perf_counter()
+        self.profiled += 1
+        return session
+
+    def finish(self, session):
+        """Stop a session and allow the next profiled request; returns the elapsed seconds"""
+        session.stop()
+        self._busy.release()
+        return time.perf_counter() - session.started
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Query result cache for DatabaseManager reads
+- LRU with a TTL: identical history / room queries within the TTL share one result
+- Single-flight: concurrent misses on the same key wait for one database query
+- Write-aware: every cached result records the scope it read (tables, devices,
+  rooms, time window); committed writes drop exactly the entries they overlap
+
+Cached results are shared between callers and must be treated as read-only.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+# Query cache configuration - can be overridden by environment variables
+QUERY_CACHE_CONFIG = {
+    'max_entries': int(os.getenv('QUERY_CACHE_SIZE', '256')),  # 0 disables the cache
+    'ttl': float(os.getenv('QUERY_CACHE_TTL', '60'))  # seconds
+}
+
+# Committed write scopes kept for other processes to replay (see writes_since)
+WRITE_LOG_SIZE = 16
+
+
+class QueryScope:
+    """Rows a query read or a write touched; None means unrestricted"""
+
+    __slots__ = ('tables', 'device_ids', 'room_ids', 'start', 'end')
+
+    def __init__(self, tables=None, device_ids=None, room_ids=None, start=None, end=None):
+        self.tables = frozenset(tables) if tables is not None else None
+        self.device_ids = frozenset(device_ids) if device_ids is not None else None
+        self.room_ids = frozenset(room_ids) if room_ids is not None else None
+        self.start = start
+        self.end = end
+
+    def overlaps(self, other):
+        for mine, theirs in ((self.tables, other.tables), (self.device_ids, other.device_ids),
+                             (self.room_ids, other.room_ids)):
+            if mine is not None and theirs is not None and not mine & theirs:
+                return False
+        if self.start is not None and other.end is not None and other.end < self.start:
+            return False
+        if self.end is not None and other.start is not None and other.start > self.end:
+            return False
+        return True
+
+
+class _Entry:
+    __slots__ = ('result', 'scope', 'expires')
+
+    def __init__(self, result, scope, expires):
+        self.result = result
+        self.scope = scope
+        self.expires = expires
+
+
+class _Flight:
+    """One in-progress load that concurrent misses on the same key wait for"""
+
+    __slots__ = ('scope', 'done', 'result', 'error', 'stale')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.stale = False  # a write overlapped the scope while loading: do not cache the result
+
+
+class QueryCache:
+    """LRU + TTL cache of query results with single-flight loading and scope invalidation"""
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = QUERY_CACHE_CONFIG['max_entries'] if max_entries is None else max_entries
+        self.ttl = ttl or QUERY_CACHE_CONFIG['ttl']
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self._writes = deque(maxlen=WRITE_LOG_SIZE)  # (sequence, [QueryScope, ...])
+        self.write_seq = 0
+        self.remote_seq = 0  # last replayed sequence of the writing process
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, loader, scope, cacheable=None):
+        """Cached result for key, or loader() run once for all concurrent callers
+
+        cacheable(result) decides whether a result is stored (default: not None, so
+        failed queries are retried).
+        """
+        if not self.max_entries:
+            return loader()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.result
+                del self._entries[key]
+                self.expirations += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(scope)
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                store = flight.error is None and not flight.stale and (
+                    cacheable(flight.result) if cacheable else flight.result is not None)
+                if store:
+                    self._entries[key] = _Entry(flight.result, scope, time.monotonic() + self.ttl)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self, scopes):
+        """Drop entries (and mark in-flight loads) overlapping any of the committed write scopes"""
+        if not scopes:
+            return 0
+        with self._lock:
+            self.write_seq += 1
+            self._writes.append((self.write_seq, scopes))
+            return self._drop(scopes)
+
+    def _drop(self, scopes):
+        stale = [key for key, entry in self._entries.items()
+                 if any(entry.scope.overlaps(scope) for scope in scopes)]
+        for key in stale:
+            del self._entries[key]
+        for flight in self._flights.values():
+            if any(flight.scope.overlaps(scope) for scope in scopes):
+                flight.stale = True
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def writes_since(self, seq):
+        """(current sequence, write scopes committed after seq) for replay in another process"""
+        with self._lock:
+            return self.write_seq, [scopes for write_seq, scopes in self._writes if write_seq > seq]
+
+    def replay(self, seq, writes):
+        """Apply writes committed in another process (see writes_since); clears the cache if some were missed"""
+        with self._lock:
+            if seq <= self.remote_seq:
+                return
+            missed = seq - self.remote_seq > len(writes)
+            self.remote_seq = seq
+            if missed:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                for flight in self._flights.values():
+                    flight.stale = True
+                return
+            for scopes in writes:
+                self._drop(scopes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses + self.collapsed
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'collapsed': self.collapsed,
+            'hit_ratio': round((self.hits + self.collapsed) / lookups, 3) if lookups else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'write_seq': self.write_seq
+        }
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact sensor reading records
+- DeviceDescriptor: static device fields (id, kind, unit, room), built once
+- Reading: one value per device per tick, pointing at its descriptor
+- ReadingBatch: all readings of one tick, sharing a single timestamp
+Dict/JSON forms are only built at the edge, once per batch.
+to_message() gives the MQTT / database field schema (deviceId, kind, roomId, ts, ...).
+"""
+
+
+class DeviceDescriptor:
+    """Static per-device fields, precomputed once at startup"""
+
+    __slots__ = ('device_id', 'kind', 'unit', 'room_id', 'index')
+
+    def __init__(self, device_id, kind, unit, room_id, index=0):
+        self.device_id = device_id
+        self.kind = kind
+        self.unit = unit
+        self.room_id = room_id
+        self.index = index
+
+    def __repr__(self):
+        return f"<DeviceDescriptor(device_id='{self.device_id}', kind='{self.kind}', room_id='{self.room_id}')>"
+
+
+class Reading:
+    """Single sensor value; static fields live on the shared descriptor"""
+
+    __slots__ = ('device', 'value', 'major_change', 'extra', 'anomaly')
+
+    def __init__(self, device, value, major_change=None, extra=None, anomaly=None):
+        self.device = device
+        self.value = value
+        self.major_change = major_change
+        self.extra = extra  # device-reported fields (on, powerW, voltage, current), if any
+        self.anomaly = anomaly  # z-score when the streaming statistics flagged the value
+
+    def to_dict(self, timestamp):
+        """Dashboard/API dict form (timestamp is the batch ISO string)"""
+        device = self.device
+        data = {
+            'device_id': device.device_id,
+            'kind': device.kind,
+            'value': self.value,
+            'unit': device.unit,
+            'room_id': device.room_id,
+            'timestamp': timestamp
+        }
+        if self.major_change is not None:
+            data['major_change'] = self.major_change
+        if self.anomaly is not None:
+            data['anomaly'] = self.anomaly
+        return data
+
+    def power_watts(self):
+        """Instantaneous power in watts (device-reported, or derived for light/solar), else None"""
+        if self.extra and self.extra.get('powerW') is not None:
+            return self.extra['powerW']
+        kind = self.device.kind
+        if kind == 'light':
+            return self.value * 0.1  # Same lux -> watts approximation as to_message()
+        if kind == 'solar':
+            return self.value
+        return None
+
+    def to_message(self, ts_ms):
+        """MQTT / save_sensor_data field schema (deviceId, kind, value, unit, roomId, ts)"""
+        device = self.device
+        value = self.value
+        message = {
+            'deviceId': device.device_id,
+            'kind': device.kind,
+            'value': value,
+            'unit': device.unit,
+            'roomId': device.room_id,
+            'ts': ts_ms
+        }
+        # Add specific fields for different sensor types
+        if device.kind == 'light':
+            message['on'] = value > 500  # Assume light is on if > 500 lux
+            message['powerW'] = value * 0.1  # Convert lux to watts (approximate)
+        elif device.kind == 'solar':
+            message['powerW'] = value
+            message['voltage'] = 12.0  # Assume 12V system
+            message['current'] = value / 12.0
+        if self.extra:
+            message.update(self.extra)
+        return message
+
+    def __repr__(self):
+        return f"<Reading(device_id='{self.device.device_id}', value={self.value})>"
+
+
+class ReadingBatch:
+    """All readings produced in one simulator tick"""
+
+    __slots__ = ('timestamp', 'readings', '_iso', '_dict')
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.readings = []
+        self._iso = None
+        self._dict = None
+
+    def add(self, device, value, major_change=None, extra=None):
+        self.readings.append(Reading(device, value, major_change, extra))
+
+    def derive(self, readings):
+        """New batch with the same timestamp and a different set of readings"""
+        batch = ReadingBatch(self.timestamp)
+        batch.readings = readings
+        batch._iso = self._iso
+        return batch
+
+    @property
+    def iso_timestamp(self):
+        """ISO timestamp, formatted once per tick"""
+        if self._iso is None:
+            self._iso = self.timestamp.isoformat()
+        return self._iso
+
+    @property
+    def ts_ms(self):
+        """Epoch timestamp in milliseconds"""
+        return int(self.timestamp.timestamp() * 1000)
+
+    def as_dict(self):
+        """Device id -> dict form, built once and shared by all readers"""
+        if self._dict is None:
+            iso = self.iso_timestamp
+            self._dict = {r.device.device_id: r.to_dict(iso) for r in self.readings}
+        return self._dict
+
+    def __len__(self):
+        return len(self.readings)
+
+    def __iter__(self):
+        return iter(self.readings)
@@ -15,6 +15,11 @@ import random
 import threading
 from datetime import datetime, timedelta
 import pytz
+from readings import DeviceDescriptor, ReadingBatch
+from structured_log import get_logger
+from pipeline import Pipeline, ValidationStage, reduction_stages, FileSink, MQTTSink
+
+log = get_logger('Realistic Simulator')
 
 class RealisticSensorSimulator:
     """Realistic sensor simulator with gradual temperature changes"""
@@ -46,9 +51,24 @@ class RealisticSensorSimulator:
         # Last major change time for each room
         self.last_major_change = {i: datetime.now(self.timezone) for i in range(1, 6)}
         
-        print(f"[Realistic Simulator] Initialized with {self.room_count} rooms")
-        print(f"[Realistic Simulator] Timezone: {self.timezone}")
-        print(f"[Realistic Simulator] Base temperatures: {self.room_base_temps}")
+        # Device descriptors are built once and shared by every reading
+        self.room_devices = {}
+        for room_id in range(1, self.room_count + 1):
+            room_name = f'room{room_id}'
+            self.room_devices[room_id] = (
+                DeviceDescriptor(f'temp-{room_id}', 'temperature', '°C', room_name),
+                DeviceDescriptor(f'hum-{room_id}', 'humidity', '%', room_name),
+                DeviceDescriptor(f'co2-{room_id}', 'co2', 'ppm', room_name),
+                DeviceDescriptor(f'light-{room_id}', 'light', 'lux', room_name)
+            )
+        self.solar_device = DeviceDescriptor('solar-plant', 'solar', 'W', 'solar-farm')
+        
+        # Called with each tick's ReadingBatch (e.g. Pipeline.push)
+        self.emit = None
+        
+        log.info('simulator.initialized', "Initialized with {rooms} rooms", rooms=self.room_count)
+        log.info('simulator.initialized', "Timezone: {timezone}", timezone=str(self.timezone))
+        log.info('simulator.initialized', "Base temperatures: {temperatures}", temperatures=dict(self.room_base_temps))
         
     def get_current_season(self):
         """Determine current season based on month"""
@@ -133,7 +153,7 @@ class RealisticSensorSimulator:
             self.major_change_active[room_id] = False
             self.room_base_temps[room_id] = target_temp
             self.last_major_change[room_id] = datetime.now(self.timezone)
-            print(f"[Major Change] Room {room_id} completed: {target_temp:.1f}°C")
+            log.info('simulator.major_change_completed', "Room {room} completed: {target:.1f}°C", room=room_id, target=target_temp)
     
     def update_temperature_normal(self, room_id):
         """Update temperature with normal fluctuations"""
@@ -151,15 +171,14 @@ class RealisticSensorSimulator:
     def run(self):
         """Run the realistic simulator"""
         self.running = True
-        print(f"[Realistic Simulator] Started with realistic temperature changes")
+        log.info('simulator.started', "Started with realistic temperature changes")
         
         while self.running:
-            current_time = datetime.now(self.timezone)
+            # One timestamp per tick, shared by all readings
+            batch = ReadingBatch(datetime.now(self.timezone))
             
             # Generate sensor data for all rooms
             for room_id in range(1, self.room_count + 1):
-                room_name = f'room{room_id}'
-                
                 # Check for major change trigger
                 if self.should_trigger_major_change(room_id):
                     target_temp = self.calculate_major_change(room_id)
@@ -169,7 +188,8 @@ class RealisticSensorSimulator:
                     
                     season = self.get_current_season()
                     change_type = "increase" if target_temp > self.current_temps[room_id] else "decrease"
-                    print(f"[Major Change] Room {room_id} started {change_type} to {target_temp:.1f}°C ({season})")
+                    log.info('simulator.major_change_started', "Room {room} started {change} to {target:.1f}°C ({season})",
+                             room=room_id, change=change_type, target=target_temp, season=season)
                 
                 # Update temperature
                 if self.major_change_active[room_id]:
@@ -195,74 +215,39 @@ class RealisticSensorSimulator:
                 light = max(100, min(1200, light))
                 
                 # Store data (this would be sent to your dashboard)
-                sensor_data = {
-                    f'temp-{room_id}': {
-                        'device_id': f'temp-{room_id}',
-                        'kind': 'temperature',
-                        'value': temp,
-                        'unit': '°C',
-                        'room_id': room_name,
-                        'timestamp': current_time.isoformat(),
-                        'major_change': self.major_change_active[room_id]
-                    },
-                    f'hum-{room_id}': {
-                        'device_id': f'hum-{room_id}',
-                        'kind': 'humidity',
-                        'value': humidity,
-                        'unit': '%',
-                        'room_id': room_name,
-                        'timestamp': current_time.isoformat()
-                    },
-                    f'co2-{room_id}': {
-                        'device_id': f'co2-{room_id}',
-                        'kind': 'co2',
-                        'value': co2,
-                        'unit': 'ppm',
-                        'room_id': room_name,
-                        'timestamp': current_time.isoformat()
-                    },
-                    f'light-{room_id}': {
-                        'device_id': f'light-{room_id}',
-                        'kind': 'light',
-                        'value': light,
-                        'unit': 'lux',
-                        'room_id': room_name,
-                        'timestamp': current_time.isoformat()
-                    }
-                }
+                temp_dev, hum_dev, co2_dev, light_dev = self.room_devices[room_id]
+                batch.add(temp_dev, temp, self.major_change_active[room_id])
+                batch.add(hum_dev, humidity)
+                batch.add(co2_dev, co2)
+                batch.add(light_dev, light)
                 
                 # Print temperature changes for monitoring
                 if self.major_change_active[room_id]:
                     elapsed = time.time() - self.major_change_start_time[room_id]
                     remaining = self.major_change_duration - elapsed
-                    print(f"[Room {room_id}] Major change: {temp:.1f}°C (remaining: {remaining:.0f}s)")
+                    log.info('simulator.major_change_progress', "Room {room} major change: {temperature:.1f}°C (remaining: {remaining:.0f}s)",
+                             room=room_id, temperature=temp, remaining=remaining)
             
             # Solar Panel (independent)
             solar_power = round(120 + random.uniform(-20, 20), 1)
-            solar_data = {
-                'solar-plant': {
-                    'device_id': 'solar-plant',
-                    'kind': 'solar',
-                    'value': solar_power,
-                    'unit': 'W',
-                    'room_id': 'solar-farm',
-                    'timestamp': current_time.isoformat()
-                }
-            }
+            batch.add(self.solar_device, solar_power)
+            if self.emit:
+                self.emit(batch)
             
             total_devices = self.room_count * self.devices_per_room + self.solar_devices
             active_major_changes = sum(1 for active in self.major_change_active.values() if active)
             
             if active_major_changes > 0:
-                print(f"[Simulator] Updated {total_devices} devices, {active_major_changes} major changes active")
+                log.info('simulator.tick', "Updated {devices} devices, {major_changes} major changes active",
+                         devices=total_devices, major_changes=active_major_changes)
             else:
-                print(f"[Simulator] Updated {total_devices} devices (normal mode)")
+                log.info('simulator.tick', "Updated {devices} devices (normal mode)", devices=total_devices)
             
             time.sleep(self.interval)
     
     def stop(self):
         self.running = False
-        print("[Realistic Simulator] Stopped")
+        log.info('simulator.stopped', "Stopped")
 
 def main():
     """Test the realistic simulator"""
@@ -272,11 +257,30 @@ def main():
     
     simulator = RealisticSensorSimulator()
     
+    # Optional sinks: JSON-lines file (SIMULATOR_OUTPUT_FILE) and MQTT (MQTT_PUBLISH=true)
+    sinks = []
+    output_file = os.getenv('SIMULATOR_OUTPUT_FILE')
+    if output_file:
+        sinks.append(FileSink(output_file))
+    if os.getenv('MQTT_PUBLISH', 'false').lower() == 'true':
+        from mqtt_publisher import MQTTPublisher
+        publisher = MQTTPublisher()
+        publisher.connect()
+        sinks.append(MQTTSink(publisher))
+    
+    pipeline = None
+    if sinks:
+        pipeline = Pipeline(stages=[ValidationStage()] + reduction_stages(), sinks=sinks, name='simulator')
+        pipeline.start()
+        simulator.emit = pipeline.push
+    
     try:
         simulator.run()
     except KeyboardInterrupt:
         print("\n🛑 Stopping simulator...")
         simulator.stop()
+        if pipeline:
+            pipeline.stop()
 
 if __name__ == '__main__':
     main()
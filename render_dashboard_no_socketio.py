@@ -6,28 +6,79 @@ Simple Flask app with basic real-time simulation
 """
 
 import os
+import sys
 import time
 import random
+import signal
 import threading
-from datetime import datetime
-from flask import Flask, render_template_string, jsonify, request, make_response
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template_string, jsonify, request, make_response, g
+from flask.json.provider import JSONProvider
+import json_codec
+from readings import ReadingBatch
+from topology import load_topology
+from latest_store import LatestValueStore
+from response_cache import ResponseCache
+from pipeline import (Pipeline, SimulatorSource, MQTTSource, FileReplaySource, ValidationStage, reduction_stages,
+                      LatestValueSink, DatabaseSink, MQTTSink, FileSink)
+from event_stream import EventBroadcaster
+from history_buffer import RecentHistory, HistorySink
+from device_registry import DeviceRegistry, RegistrySink
+from stream_stats import StreamingStats, StatisticsStage
+from alerts import AlertEngine, AlertSink, ALERT_CONFIG
+from forecast import ForecastModel, ForecastSink, FORECAST_CONFIG, NUMPY_AVAILABLE as FORECAST_AVAILABLE
+from energy import EnergyAccumulator, PERIODS as ENERGY_PERIODS, SCOPES as ENERGY_SCOPES, bucket_start
+from downsampling import downsample_indices, effective_method, METHODS as DOWNSAMPLE_METHODS
+from binary_format import (FORMATS as RESPONSE_FORMATS, ACCEPT as BINARY_ACCEPT, available as format_available,
+                           encode as encode_binary, epoch_ms)
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Histogram, CallbackMetric, render as render_metrics
+from profiling import RequestProfiler
+from structured_log import get_logger, get_stats as log_stats
+from state_backend import STATE_CONFIG, SharedStatePublisher, SharedStateReader, ControlServer, ControlClient
+
+log = get_logger('System')
+db_log = get_logger('Database')
+sim_log = get_logger('Simulator')
 
 # Database imports
 try:
-    from database import DatabaseManager
+    from database import DatabaseManager, slow_queries
     DATABASE_AVAILABLE = True
-    print("[Database] Database module imported successfully")
+    db_log.info('db.import', "Database module imported successfully")
 except ImportError as e:
     DATABASE_AVAILABLE = False
-    print(f"[Database] Database module not available: {e}")
-    print("[Database] Running in simulation mode only")
+    db_log.warning('db.import', "Database module not available: {error} - running in simulation mode only", error=e)
 except Exception as e:
     DATABASE_AVAILABLE = False
-    print(f"[Database] Unexpected error importing database: {e}")
-    print("[Database] Running in simulation mode only")
+    db_log.error('db.import', "Unexpected error importing database: {error} - running in simulation mode only", error=e)
+
+# MQTT publisher / ingestion (optional, enabled with MQTT_PUBLISH=true / MQTT_INGEST=true)
+from mqtt_publisher import MQTTPublisher, MQTT_AVAILABLE
+MQTT_PUBLISH = os.getenv('MQTT_PUBLISH', 'false').lower() == 'true'
+MQTT_INGEST = os.getenv('MQTT_INGEST', 'false').lower() == 'true'
+
+# Optional file replay source and file sink (JSON lines in the MQTT message schema)
+REPLAY_FILE = os.getenv('REPLAY_FILE')
+REPLAY_SPEED = float(os.getenv('REPLAY_SPEED', '1.0'))
+PIPELINE_FILE_SINK = os.getenv('PIPELINE_FILE_SINK')
+
+class FastJSONProvider(JSONProvider):
+    """jsonify / request.get_json through json_codec (orjson when installed, key order preserved)"""
+
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumpb(obj), mimetype='application/json')
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'no-socketio-secret')
 
 # Enable CORS for frontend compatibility
@@ -35,10 +86,65 @@ from flask_cors import CORS
 CORS(app, 
      origins=['*'], 
      methods=['GET', 'POST', 'OPTIONS', 'PUT', 'DELETE'], 
-     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
+     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'If-None-Match', 'Last-Event-ID'],
+     expose_headers=['ETag'],
      supports_credentials=True,
      max_age=3600)
 
+# Request metrics for /metrics (route templates keep the label sets small)
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request handling time', labels=('method', 'route'))
+HTTP_REQUESTS = Counter('http_requests_total', 'Requests served', labels=('method', 'route', 'status'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+    return response
+
+# Opt-in per-request profiling: ?profile=1 (cProfile) or ?profile=sample (folded stacks) with the DEBUG_SECRET
+request_profiler = RequestProfiler()
+
+def debug_authorized():
+    return request_profiler.authorized(request.headers.get('X-Debug-Secret') or request.args.get('secret'))
+
+@app.before_request
+def start_profiling():
+    mode = request.args.get('profile')
+    if not mode or not request_profiler.enabled:
+        return None
+    if not debug_authorized():
+        return jsonify({'success': False, 'error': 'Profiling requires the debug secret'}), 403
+    session = request_profiler.start(mode)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Another request is being profiled'}), 409
+    g.profile_session = session
+
+@app.after_request
+def finish_profiling(response):
+    session = g.pop('profile_session', None)
+    if session is None:
+        return response
+    elapsed = request_profiler.finish(session)
+    body, mimetype = session.report(request.args.get('profile_format'))
+    profile = Response(body, mimetype=mimetype)
+    profile.headers['X-Profiled-Status'] = str(response.status_code)
+    profile.headers['X-Profiled-Seconds'] = f'{elapsed:.6f}'
+    response.close()  # the profiled body is never sent (frees e.g. an SSE stream slot)
+    return profile
+
+@app.teardown_request
+def abandon_profiling(error=None):
+    session = g.pop('profile_session', None)
+    if session is not None:
+        request_profiler.finish(session)
+
 # Additional CORS middleware for better compatibility
 @app.after_request
 def after_request(response):
@@ -46,13 +152,15 @@ def after_request(response):
     if 'Access-Control-Allow-Origin' not in response.headers:
         response.headers.add('Access-Control-Allow-Origin', '*')
     if 'Access-Control-Allow-Headers' not in response.headers:
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With,If-None-Match,Last-Event-ID')
     if 'Access-Control-Allow-Methods' not in response.headers:
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     if 'Access-Control-Allow-Credentials' not in response.headers:
         response.headers.add('Access-Control-Allow-Credentials', 'true')
     if 'Access-Control-Max-Age' not in response.headers:
         response.headers.add('Access-Control-Max-Age', '3600')
+    if 'Access-Control-Expose-Headers' not in response.headers:
+        response.headers.add('Access-Control-Expose-Headers', 'ETag')
     return response
 
 # Handle preflight OPTIONS requests
@@ -61,68 +169,155 @@ def handle_preflight():
     if request.method == "OPTIONS":
         response = make_response()
         response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers['Access-Control-Allow-Headers'] = "Content-Type,Authorization,X-Requested-With"
+        response.headers['Access-Control-Allow-Headers'] = "Content-Type,Authorization,X-Requested-With,If-None-Match,Last-Event-ID"
         response.headers['Access-Control-Allow-Methods'] = "GET,PUT,POST,DELETE,OPTIONS"
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Max-Age'] = '3600'
         return response
 
-# Global storage
-latest_data = {}
+# Global storage - latest reading per device, fed by the pipeline (readers get immutable snapshots)
+latest_store = LatestValueStore()
+
+# Server-Sent Events fan-out for /api/stream; event ids carry this process's epoch
+# (web workers take the owner's from the shared state)
 start_time = time.time()
+stream_epoch = format(int(start_time * 1000), 'x')
+# Each open stream holds a server thread: under gunicorn, leave SSE_RESERVED_THREADS per worker for the API
+if os.getenv('SSE_MAX_CLIENTS'):
+    sse_max_clients = int(os.getenv('SSE_MAX_CLIENTS'))
+elif STATE_CONFIG['backend'] == 'shm':
+    sse_max_clients = max(int(os.getenv('GUNICORN_THREADS', '32')) - int(os.getenv('SSE_RESERVED_THREADS', '8')), 1)
+else:
+    sse_max_clients = 0
+broadcaster = EventBroadcaster(heartbeat=int(os.getenv('SSE_HEARTBEAT', '15')), epoch=stream_epoch,
+                               max_subscribers=sse_max_clients)
+streamed_version = 0  # last store version published to /api/stream
 simulator_running = True
 
+CallbackMetric('sse_subscribers', 'Connected /api/stream clients', 'gauge',
+               lambda: [((), broadcaster.subscribers)])
+CallbackMetric('log_records_dropped_total', 'Log records dropped on a full log queue', 'counter',
+               lambda: [((), log_stats()['dropped'])])
+CallbackMetric('log_records_sampled_out_total', 'Log records skipped by per-event sampling', 'counter',
+               lambda: [((), log_stats()['sampled_out'])])
+
+# Per-device ring buffers serving recent history without database round trips
+recent_history = RecentHistory()
+
+# Online per-device statistics (Welford, EWMA, rolling min/max) and z-score anomaly flags
+streaming_stats = StreamingStats()
+
+# Incremental Holt-Winters forecasting state for every device (needs numpy)
+forecast_model = ForecastModel() if FORECAST_AVAILABLE else None
+
+# Threshold alert rules (ALERT_RULES_FILE or the built-in defaults); events also go to /api/stream
+try:
+    alert_engine = AlertEngine()
+    log.info('alerts.rules', "{rules} alert rules compiled", rules=len(alert_engine.rules))
+except (OSError, ValueError, KeyError) as e:
+    log.error('alerts.rules', "Invalid alert rules, alerts disabled: {error}", error=e)
+    alert_engine = AlertEngine([])
+alert_engine.add_listener(broadcaster.publish_alert)
+
+def stream_store_changes():
+    """Publish the devices changed since the last streamed store version as one 'delta' event"""
+    global streamed_version
+    snapshot = latest_store.current()
+    if snapshot.version == streamed_version:
+        return
+    changed = snapshot.changes_since(streamed_version)
+    streamed_version = snapshot.version
+    if changed:
+        broadcaster.publish_delta(snapshot.version, next(iter(changed.values()))['timestamp'], changed)
+
+latest_store.add_listener(stream_store_changes)
+
+# Data endpoint bodies serialized once per update (see serve_cached)
+response_cache = ResponseCache(latest_store)
+
+# Multi-worker mode (STATE_BACKEND=shm, see gunicorn.conf.py): one owner process runs the
+# simulator and publishes its state to shared memory; web workers mirror it from there
+STATE_ROLE = os.getenv('STATE_ROLE', 'worker')
+state_publisher = None  # owner
+state_reader = None  # worker
+control_client = None  # worker
+published_write_seq = 0  # owner: last query cache write sequence shipped to the workers
+published_alert_seq = 0  # owner: last alert event shipped / worker: last alert event streamed
+publish_lock = threading.Lock()  # owner: serializes publish_shared_state
+# Worker: owner's runtime_status() from the last published state
+shared_status = {'simulator_running': False, 'start_time': start_time, 'scheduler_running': False,
+                 'db_saves': 0, 'db_fails': 0}
+
+def get_latest_data():
+    """Dict form of the latest readings (built once per update, shared by all requests)"""
+    return latest_store.as_dict()
+
 # Database manager
 db_manager = None
 if DATABASE_AVAILABLE:
     try:
-        print("[Database] Initializing database manager...")
+        db_log.info('db.init', "Initializing database manager...")
         db_manager = DatabaseManager()
-        print("[Database] Database manager initialized successfully")
+        db_log.info('db.init', "Database manager initialized successfully")
         
         # Test database connection
-        print("[Database] Testing database connection...")
+        db_log.info('db.init', "Testing database connection...")
         session = db_manager.get_session()
         session.close()
-        print("[Database] Database connection test successful")
+        db_log.info('db.init', "Database connection test successful")
         
     except Exception as e:
-        print(f"[Database] Failed to initialize database manager: {e}")
-        print(f"[Database] Error type: {type(e).__name__}")
-        import traceback
-        print(f"[Database] Traceback: {traceback.format_exc()}")
+        db_log.exception('db.init', "Failed to initialize database manager: {error_type}: {error}",
+                         error_type=type(e).__name__, error=e)
         DATABASE_AVAILABLE = False
         db_manager = None
 
+# Simulator tick timing; lateness is how much longer than the interval the gap between ticks was
+SIMULATOR_TICK_SECONDS = Histogram('simulator_tick_duration_seconds', 'Time to generate and hand off one tick')
+SIMULATOR_TICK_LATENESS = Histogram('simulator_tick_lateness_seconds', 'Delay of a tick past its interval')
+
 class RealisticSimulator:
     """Realistic simulator with gradual temperature changes"""
     
-    def __init__(self):
+    def __init__(self, topology):
         self.running = False
         self.interval = 5  # 5 seconds
-        self.room_count = 5
-        self.devices_per_room = 4  # temp, humidity, co2, light
-        self.solar_devices = 1
+        self.topology = topology
+        self.room_count = topology.room_count
+        self.device_count = topology.device_count
+        
+        # Rooms with a temperature sensor drive the temperature model (indexed by room position)
+        self.temperature_rooms = [i for i, has_temp in enumerate(topology.room_has_temperature) if has_temp]
         
         # Temperature base values for each room
-        self.room_base_temps = {
-            1: 22.0, 2: 21.5, 3: 23.0, 4: 22.5, 5: 21.0
-        }
+        self.room_base_temps = list(topology.room_base_temps)
         
         # Current temperature values
-        self.current_temps = self.room_base_temps.copy()
+        self.current_temps = list(self.room_base_temps)
         
         # Major change tracking
-        self.major_change_active = {i: False for i in range(1, 6)}
-        self.major_change_start_time = {i: None for i in range(1, 6)}
-        self.major_change_target = {i: 0 for i in range(1, 6)}
+        self.major_change_active = [False] * self.room_count
+        self.major_change_start_time = [None] * self.room_count
+        self.major_change_target = [0.0] * self.room_count
         self.major_change_duration = 300  # 5 minutes = 300 seconds
         
         # Last major change time for each room
-        self.last_major_change = {i: datetime.now() for i in range(1, 6)}
+        now = datetime.now()
+        self.last_major_change = [now] * self.room_count
+        
+        # Per-device parameters zipped once from the compiled topology arrays
+        self.temperature_code = topology.kind_codes['temperature']
+        self.device_params = list(zip(
+            topology.devices, topology.device_kind, topology.device_room,
+            topology.base, topology.noise, topology.min_value, topology.max_value,
+            topology.temp_coeff, topology.temp_ref, topology.decimals
+        ))
+        
+        # Called with each tick's ReadingBatch (set by the pipeline's SimulatorSource)
+        self.emit = None
         
-        print(f"[Realistic Simulator] Initialized with {self.room_count} rooms")
-        print(f"[Realistic Simulator] Base temperatures: {self.room_base_temps}")
+        sim_log.info('simulator.initialized', "Initialized with {devices} devices in {rooms} rooms, {controlled} temperature-controlled",
+                     devices=self.device_count, rooms=self.room_count, controlled=len(self.temperature_rooms))
         
     def get_current_season(self):
         """Determine current season based on month"""
@@ -138,9 +333,9 @@ class RealisticSimulator:
         else:  # Fall
             return 'fall'
     
-    def is_major_change_time(self):
+    def is_major_change_time(self, now=None):
         """Check if it's time for major changes (not between 9 PM - 6 AM)"""
-        now = datetime.now()
+        now = now or datetime.now()
         hour = now.hour
         
         # No major changes between 9 PM (21:00) and 6 AM (06:00)
@@ -148,16 +343,17 @@ class RealisticSimulator:
             return False
         return True
     
-    def should_trigger_major_change(self, room_id):
+    def should_trigger_major_change(self, room_id, now=None):
         """Check if a major change should be triggered for this room"""
-        if not self.is_major_change_time():
+        now = now or datetime.now()
+        if not self.is_major_change_time(now):
             return False
             
         if self.major_change_active[room_id]:
             return False
             
         # Check if enough time has passed since last major change (30 minutes)
-        time_since_last = datetime.now() - self.last_major_change[room_id]
+        time_since_last = now - self.last_major_change[room_id]
         if time_since_last.total_seconds() < 1800:  # 30 minutes
             return False
             
@@ -207,7 +403,8 @@ class RealisticSimulator:
             self.major_change_active[room_id] = False
             self.room_base_temps[room_id] = target_temp
             self.last_major_change[room_id] = datetime.now()
-            print(f"[Major Change] Room {room_id} completed: {target_temp:.1f}°C")
+            sim_log.info('simulator.major_change_completed', "Major change in {room} completed: {target:.1f}°C",
+                         room=self.topology.rooms[room_id], target=target_temp)
     
     def update_temperature_normal(self, room_id):
         """Update temperature with normal fluctuations"""
@@ -222,20 +419,40 @@ class RealisticSimulator:
         new_temp = max(15.0, min(30.0, new_temp))
         self.current_temps[room_id] = new_temp
         
+    def generate_readings(self, batch):
+        """Generate one reading per topology device into the batch"""
+        temps = [round(t, 1) for t in self.current_temps]
+        active = self.major_change_active
+        temperature_code = self.temperature_code
+        uniform = random.uniform
+        
+        for device, kind, room, base, noise, low, high, coeff, ref, decimals in self.device_params:
+            if kind == temperature_code:
+                batch.add(device, temps[room], active[room])
+            else:
+                # Other sensors follow the room temperature with realistic variations
+                value = base + coeff * (temps[room] - ref) + uniform(-noise, noise)
+                batch.add(device, round(max(low, min(high, value)), decimals))
+    
     def run(self):
         """Run the realistic simulator"""
         self.running = True
-        print(f"[Realistic Simulator] Started with realistic temperature changes")
+        sim_log.info('simulator.started', "Started with realistic temperature changes")
         
+        previous_tick = None
         while self.running:
-            current_time = datetime.now()
+            tick_started = time.perf_counter()
+            if previous_tick is not None:
+                SIMULATOR_TICK_LATENESS.observe(max(0.0, tick_started - previous_tick - self.interval))
+            previous_tick = tick_started
             
-            # Generate sensor data for all rooms
-            for room_id in range(1, self.room_count + 1):
-                room_name = f'room{room_id}'
-                
+            # One timestamp per tick, shared by all readings
+            batch = ReadingBatch(datetime.now())
+            
+            # Update temperatures for all rooms
+            for room_id in self.temperature_rooms:
                 # Check for major change trigger
-                if self.should_trigger_major_change(room_id):
+                if self.should_trigger_major_change(room_id, batch.timestamp):
                     target_temp = self.calculate_major_change(room_id)
                     self.major_change_active[room_id] = True
                     self.major_change_start_time[room_id] = time.time()
@@ -243,167 +460,66 @@ class RealisticSimulator:
                     
                     season = self.get_current_season()
                     change_type = "increase" if target_temp > self.current_temps[room_id] else "decrease"
-                    print(f"[Major Change] Room {room_id} started {change_type} to {target_temp:.1f}°C ({season})")
+                    sim_log.info('simulator.major_change_started', "Major change in {room} started: {change} to {target:.1f}°C ({season})",
+                                 room=self.topology.rooms[room_id], change=change_type, target=target_temp, season=season)
                 
                 # Update temperature
                 if self.major_change_active[room_id]:
                     self.update_temperature_gradually(room_id)
                 else:
                     self.update_temperature_normal(room_id)
-                
-                # Generate other sensor data with realistic variations
-                temp = round(self.current_temps[room_id], 1)
-                
-                # Humidity: realistic indoor room humidity (30-60%)
-                base_humidity = 45 - (temp - 22) * 1.5  # Base humidity around 45%
-                humidity = round(base_humidity + random.uniform(-0.6, 0.6), 1)
-                humidity = max(30, min(60, humidity))
-                
-                # CO2: slightly higher when temperature is higher (more activity)
-                base_co2 = 400 + (temp - 20) * 10
-                co2 = round(base_co2 + random.uniform(-20, 20), 0)
-                co2 = max(350, min(600, co2))
-                
-                # Light: random but realistic
-                light = round(800 + random.uniform(-200, 200), 0)
-                light = max(100, min(1200, light))
-                
-                # Store data
-                latest_data[f'temp-{room_id}'] = {
-                    'device_id': f'temp-{room_id}',
-                    'kind': 'temperature',
-                    'value': temp,
-                    'unit': '°C',
-                    'room_id': room_name,
-                    'timestamp': current_time.isoformat(),
-                    'major_change': self.major_change_active[room_id]
-                }
-                
-                latest_data[f'hum-{room_id}'] = {
-                    'device_id': f'hum-{room_id}',
-                    'kind': 'humidity',
-                    'value': humidity,
-                    'unit': '%',
-                    'room_id': room_name,
-                    'timestamp': current_time.isoformat()
-                }
-                
-                latest_data[f'co2-{room_id}'] = {
-                    'device_id': f'co2-{room_id}',
-                    'kind': 'co2',
-                    'value': co2,
-                    'unit': 'ppm',
-                    'room_id': room_name,
-                    'timestamp': current_time.isoformat()
-                }
-                
-                latest_data[f'light-{room_id}'] = {
-                    'device_id': f'light-{room_id}',
-                    'kind': 'light',
-                    'value': light,
-                    'unit': 'lux',
-                    'room_id': room_name,
-                    'timestamp': current_time.isoformat()
-                }
             
-            # Solar Panel (independent)
-            solar_power = round(120 + random.uniform(-20, 20), 1)
-            latest_data['solar-plant'] = {
-                'device_id': 'solar-plant',
-                'kind': 'solar',
-                'value': solar_power,
-                'unit': 'W',
-                'room_id': 'solar-farm',
-                'timestamp': current_time.isoformat()
-            }
+            self.generate_readings(batch)
             
-            total_devices = self.room_count * self.devices_per_room + self.solar_devices
-            active_major_changes = sum(1 for active in self.major_change_active.values() if active)
+            # Hand the whole tick to the pipeline
+            if self.emit:
+                self.emit(batch)
+            SIMULATOR_TICK_SECONDS.observe(time.perf_counter() - tick_started)
+            
+            active_major_changes = sum(1 for active in self.major_change_active if active)
             
             if active_major_changes > 0:
-                print(f"[Simulator] Updated {total_devices} devices, {active_major_changes} major changes active")
+                sim_log.info('simulator.tick', "Updated {devices} devices, {major_changes} major changes active",
+                             devices=len(batch), major_changes=active_major_changes)
             else:
-                print(f"[Simulator] Updated {total_devices} devices (normal mode)")
+                sim_log.info('simulator.tick', "Updated {devices} devices (normal mode)", devices=len(batch))
             
             time.sleep(self.interval)
     
     def stop(self):
         self.running = False
 
-class DatabaseScheduler:
-    """Database scheduler to save data every 5 minutes to specific sensor tables"""
-    
-    def __init__(self):
-        self.running = False
-        self.interval = 300  # 5 minutes = 300 seconds
-        self.save_count = 0
-        self.error_count = 0
-        
-    def run(self):
-        """Run the database scheduler"""
-        self.running = True
-        print(f"[Database Scheduler] Started - saving data every {self.interval} seconds (5 minutes)")
-        
-        while self.running:
-            try:
-                if DATABASE_AVAILABLE and db_manager and latest_data:
-                    # Save all current sensor data to database
-                    saved_devices = 0
-                    for key, data in latest_data.items():
-                        try:
-                            # Prepare data for database with correct field names
-                            sensor_data = {
-                                'deviceId': data['device_id'],  # Use deviceId (not device_id)
-                                'kind': data['kind'],
-                                'roomId': data.get('room_id', 'unknown'),  # Use roomId (not room_id)
-                                'value': data['value'],
-                                'unit': data['unit'],
-                                'ts': int(datetime.now().timestamp() * 1000),  # Use timestamp in milliseconds
-                                'raw_data': str(data)
-                            }
-                            
-                            # Add specific fields for different sensor types
-                            if data['kind'] == 'light':
-                                # For light sensors, we need is_on and power_watts
-                                sensor_data['on'] = data['value'] > 500  # Assume light is on if > 500 lux
-                                sensor_data['powerW'] = data['value'] * 0.1  # Convert lux to watts (approximate)
-                            elif data['kind'] == 'solar':
-                                # For solar sensors, we need power, voltage, current
-                                sensor_data['powerW'] = data['value']
-                                sensor_data['voltage'] = 12.0  # Assume 12V system
-                                sensor_data['current'] = data['value'] / 12.0  # Calculate current
-                            
-                            # Save to appropriate table (only specific tables, not sensor_data)
-                            success = db_manager.save_sensor_data(sensor_data)
-                            if success:
-                                saved_devices += 1
-                            else:
-                                self.error_count += 1
-                                
-                        except Exception as e:
-                            print(f"[Database Scheduler] Error saving {key}: {e}")
-                            self.error_count += 1
-                    
-                    self.save_count += 1
-                    print(f"[Database Scheduler] Save #{self.save_count}: {saved_devices} devices saved to specific sensor tables")
-                    
-                else:
-                    print("[Database Scheduler] Database not available, skipping save")
-                    
-            except Exception as e:
-                print(f"[Database Scheduler] Error in save cycle: {e}")
-                self.error_count += 1
-            
-            # Wait for next save cycle
-            time.sleep(self.interval)
-    
-    def stop(self):
-        self.running = False
-        print(f"[Database Scheduler] Stopped - Total saves: {self.save_count}, Errors: {self.error_count}")
+# Load building topology and initialize simulator and database scheduler
+topology = load_topology()
+simulator = RealisticSimulator(topology)
+device_registry = DeviceRegistry(topology)  # kind / room / last-seen indexes for /api/devices filters
+db_scheduler = DatabaseSink(db_manager, interval=300, name='Database Scheduler')  # save every 5 minutes
+energy_accumulator = EnergyAccumulator(db_manager, name='Energy')  # kWh checkpoints for lighting / solar
+mqtt_publisher = None
+mqtt_source = None
 
-# Initialize simulator and database scheduler
-simulator = RealisticSimulator()
-db_scheduler = DatabaseScheduler()
+# Reading pipeline: simulator -> validation -> statistics -> optional deadband / aggregation
+# -> latest-value store (+ optional DB, MQTT, file); statistics see every valid reading
+pipeline = Pipeline(
+    sources=[SimulatorSource(simulator)],
+    stages=[ValidationStage(), StatisticsStage(streaming_stats, name='Statistics')] + reduction_stages(),
+    sinks=[LatestValueSink(latest_store, name='Latest Values'),
+           HistorySink(recent_history, name='Recent History'), RegistrySink(device_registry, name='Device Registry'),
+           AlertSink(alert_engine, name='Alerts')],
+    name='dashboard'
+)
+
+def runtime_status():
+    """Simulator and scheduler state of the process that runs the simulator"""
+    if state_reader:
+        return shared_status
+    return {
+        'simulator_running': simulator.running,
+        'start_time': start_time,
+        'scheduler_running': db_scheduler.running,
+        'db_saves': db_scheduler.save_count,
+        'db_fails': db_scheduler.error_count
+    }
 
 # HTML Template
 NO_SOCKETIO_TEMPLATE = '''
@@ -427,7 +543,7 @@ NO_SOCKETIO_TEMPLATE = '''
     <div class="container">
         <div class="header">
             <h1>DigitalTwin Sensor Dashboard</h1>
-            <p>All 21 devices across 5 rooms + Solar Farm | Realistic temperature simulation | Auto-save every 5 minutes</p>
+            <p>All {{ device_count }} devices across {{ room_count }} rooms | Realistic temperature simulation | Auto-save every 5 minutes</p>
         </div>
         
         <div class="status">
@@ -526,22 +642,29 @@ NO_SOCKETIO_TEMPLATE = '''
                 String(minutes).padStart(2, '0') + ':' + String(seconds).padStart(2, '0');
         }, 1000);
         
-        // Auto refresh every 5 seconds
-        autoRefreshInterval = setInterval(function() {
+        function applyData(devices, timestamp) {
+            updateSensorGrid(devices);
+            if (timestamp) {
+                document.getElementById('lastUpdate').textContent = new Date(timestamp).toLocaleString();
+            }
+            document.getElementById('deviceCount').textContent = Object.keys(devices).length;
+        }
+        
+        function refreshData() {
             fetch('/api/data')
                 .then(response => response.json())
                 .then(data => {
                     if (data.success) {
-                        updateSensorGrid(data.devices);
-                        document.getElementById('lastUpdate').textContent = new Date(data.timestamp).toLocaleString();
-                        document.getElementById('deviceCount').textContent = Object.keys(data.devices).length;
+                        currentDevices = data.devices;
+                        applyData(currentDevices, data.timestamp);
                     }
                 })
                 .catch(error => {
                     console.error('Error:', error);
                 });
-            
-            // Update database status
+        }
+        
+        function refreshDatabaseStatus() {
             fetch('/api/database-status')
                 .then(response => response.json())
                 .then(data => {
@@ -562,43 +685,32 @@ NO_SOCKETIO_TEMPLATE = '''
                     document.getElementById('dbStatus').style.color = 'red';
                     console.error('Database status error:', error);
                 });
-        }, 5000);
-        
-        // Initial load
-        fetch('/api/data')
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    updateSensorGrid(data.devices);
-                    document.getElementById('lastUpdate').textContent = new Date(data.timestamp).toLocaleString();
-                    document.getElementById('deviceCount').textContent = Object.keys(data.devices).length;
-                }
-            })
-            .catch(error => {
-                console.error('Error:', error);
-            });
+        }
         
-        // Initial database status
-        fetch('/api/database-status')
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    document.getElementById('dbStatus').textContent = 'Connected';
-                    document.getElementById('dbStatus').style.color = 'green';
-                    document.getElementById('dbSaves').textContent = data.total_saves;
-                    document.getElementById('dbErrors').textContent = data.total_errors;
-                } else {
-                    document.getElementById('dbStatus').textContent = 'Not Available';
-                    document.getElementById('dbStatus').style.color = 'red';
-                    document.getElementById('dbSaves').textContent = '0';
-                    document.getElementById('dbErrors').textContent = '0';
-                }
-            })
-            .catch(error => {
-                document.getElementById('dbStatus').textContent = 'Error';
-                document.getElementById('dbStatus').style.color = 'red';
-                console.error('Database status error:', error);
+        // Live updates: Server-Sent Events (snapshot + per-tick deltas), polling as fallback
+        var currentDevices = {};
+        if (window.EventSource) {
+            var stream = new EventSource('/api/stream');
+            stream.addEventListener('snapshot', function(event) {
+                var data = JSON.parse(event.data);
+                currentDevices = data.devices;
+                applyData(currentDevices, data.timestamp);
+            });
+            stream.addEventListener('delta', function(event) {
+                var data = JSON.parse(event.data);
+                Object.keys(data.devices).forEach(key => {
+                    currentDevices[key] = data.devices[key];
+                });
+                applyData(currentDevices, data.timestamp);
             });
+        } else {
+            refreshData();
+            autoRefreshInterval = setInterval(refreshData, 5000);
+        }
+        
+        // Database status every 5 seconds
+        refreshDatabaseStatus();
+        setInterval(refreshDatabaseStatus, 5000);
     </script>
 </body>
 </html>
@@ -606,36 +718,158 @@ NO_SOCKETIO_TEMPLATE = '''
 
 @app.route('/')
 def dashboard():
-    return render_template_string(NO_SOCKETIO_TEMPLATE)
+    return render_template_string(NO_SOCKETIO_TEMPLATE,
+                                  device_count=topology.device_count,
+                                  room_count=topology.room_count)
+
+def versioned_devices():
+    """(snapshot, devices, since) for the request, honoring ?since=<version>"""
+    since = request.args.get('since', type=int)
+    snapshot = latest_store.current()
+    return snapshot, snapshot.changes_since(since), since
+
+def data_etag(version, since, *state):
+    """Weak ETag for a data version (plus small state such as simulator on/off)"""
+    parts = [str(version)] + [str(int(value)) for value in state]
+    if since is not None:
+        parts.append(f's{since}')
+    return '-'.join(parts)
+
+def not_modified(etag):
+    """Empty 304 response if the client's If-None-Match already has this ETag"""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def device_list(latest_data):
+    """Device summaries served by /api/devices"""
+    return [{
+        'device_id': device_id,
+        'kind': device_data.get('kind'),
+        'room_id': device_data.get('room_id'),
+        'last_seen': device_data.get('timestamp')
+    } for device_id, device_data in latest_data.items()]
+
+# Static part of each data endpoint body; per-request fields are appended by serve_cached()
+response_cache.register('data', lambda version, devices: {
+    'success': True, 'devices': devices, 'version': version})
+response_cache.register('proxy_data', lambda version, devices: {
+    'success': True, 'devices': devices, 'total_devices': len(devices), 'version': version})
+response_cache.register('devices', lambda version, devices: {
+    'success': True, 'devices': device_list(devices), 'total_count': len(devices), 'version': version})
+
+def serve_cached(key, state, fields):
+    """Pre-serialized body for the current version, or None when ?since= needs a fresh delta"""
+    if 'since' in request.args:
+        return None
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    etag = data_etag(entry.version, None, *state)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    fields['timestamp'] = datetime.now().isoformat()
+    tail = response_cache.tail(fields)
+    if entry.has_gzip and request.accept_encodings['gzip']:
+        response = Response(entry.gzip_body(tail), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(entry.body(tail), mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return with_etag(response, etag)
 
 @app.route('/api/data')
 def api_data():
-    """API endpoint for sensor data"""
-    return jsonify({
+    """API endpoint for sensor data (supports If-None-Match and ?since=<version>)"""
+    status = runtime_status()
+    cached = serve_cached('data', (status['simulator_running'],), {
+        'uptime': int(time.time() - status['start_time']),
+        'simulator_running': status['simulator_running']
+    })
+    if cached:
+        return cached
+    
+    snapshot, latest_data, since = versioned_devices()
+    version = snapshot.version
+    etag = data_etag(version, since, status['simulator_running'])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    payload = {
         'success': True,
         'devices': latest_data,
+        'version': version,
         'timestamp': datetime.now().isoformat(),
-        'uptime': int(time.time() - start_time),
-        'simulator_running': simulator.running
-    })
+        'uptime': int(time.time() - status['start_time']),
+        'simulator_running': status['simulator_running']
+    }
+    if since is not None:
+        payload['since'] = since
+    return with_etag(jsonify(payload), etag)
 
 @app.route('/api/proxy/data')
 def api_proxy_data():
-    """Proxy endpoint for frontend compatibility"""
-    return jsonify({
+    """Proxy endpoint for frontend compatibility (supports If-None-Match and ?since=<version>)"""
+    status = runtime_status()
+    db_saves = status['db_saves']
+    db_fails = status['db_fails']
+    cached = serve_cached('proxy_data', (status['simulator_running'], db_saves, db_fails), {
+        'uptime': int(time.time() - status['start_time']),
+        'simulator_running': status['simulator_running'],
+        'db_saves': db_saves,
+        'db_fails': db_fails
+    })
+    if cached:
+        return cached
+    
+    snapshot, latest_data, since = versioned_devices()
+    version = snapshot.version
+    etag = data_etag(version, since, status['simulator_running'], db_saves, db_fails)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    payload = {
         'success': True,
         'devices': latest_data,
-        'total_devices': len(latest_data),
+        'total_devices': len(snapshot.devices),
+        'version': version,
         'timestamp': datetime.now().isoformat(),
-        'uptime': int(time.time() - start_time),
-        'simulator_running': simulator.running,
-        'db_saves': db_scheduler.save_count if 'db_scheduler' in globals() else 0,
-        'db_fails': db_scheduler.error_count if 'db_scheduler' in globals() else 0
-    })
+        'uptime': int(time.time() - status['start_time']),
+        'simulator_running': status['simulator_running'],
+        'db_saves': db_saves,
+        'db_fails': db_fails
+    }
+    if since is not None:
+        payload['since'] = since
+    return with_etag(jsonify(payload), etag)
 
-@app.route('/api/toggle-simulator', methods=['POST'])
-def toggle_simulator():
-    """Toggle simulator on/off"""
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: 'snapshot' on connect, then per-tick 'delta' events and 'alert' events"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = broadcaster.stream(last_event_id)
+    if events is None:
+        # All stream slots of this worker are taken; clients fall back to polling /api/data
+        response = jsonify({'success': False, 'error': 'Too many open streams, poll /api/data instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    return Response(events,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def toggle_local_simulator():
+    """Toggle the simulator of this process; returns the new on/off state"""
     global simulator_running
     simulator_running = not simulator_running
     
@@ -643,36 +877,50 @@ def toggle_simulator():
         # Start simulator in background thread
         simulator_thread = threading.Thread(target=simulator.run, daemon=True)
         simulator_thread.start()
-        print("[API] Simulator started")
+        sim_log.info('simulator.toggled', "Simulator started")
     elif not simulator_running and simulator.running:
         simulator.stop()
-        print("[API] Simulator stopped")
+        sim_log.info('simulator.toggled', "Simulator stopped")
+    return simulator_running
+
+@app.route('/api/toggle-simulator', methods=['POST'])
+def toggle_simulator():
+    """Toggle simulator on/off"""
+    if control_client:
+        try:
+            running = control_client.call('toggle_simulator')
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'State owner not reachable: {e}'}), 503
+    else:
+        running = toggle_local_simulator()
     
-    return jsonify({'success': True, 'running': simulator_running})
+    return jsonify({'success': True, 'running': running})
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    status = runtime_status()
     return jsonify({
         'status': 'healthy',
-        'uptime': int(time.time() - start_time),
+        'uptime': int(time.time() - status['start_time']),
         'timestamp': datetime.now().isoformat(),
-        'simulator_running': simulator.running,
+        'simulator_running': status['simulator_running'],
         'database_available': DATABASE_AVAILABLE,
-        'db_saves': db_scheduler.save_count if 'db_scheduler' in globals() else 0,
-        'db_errors': db_scheduler.error_count if 'db_scheduler' in globals() else 0
+        'db_saves': status['db_saves'],
+        'db_errors': status['db_fails']
     })
 
 @app.route('/api/health')
 def api_health():
     """API health check endpoint for frontend"""
+    status = runtime_status()
     return jsonify({
         'status': 'ok',
         'database': 'connected' if DATABASE_AVAILABLE else 'disconnected',
         'timestamp': datetime.now().isoformat(),
-        'uptime': int(time.time() - start_time),
-        'simulator_running': simulator.running,
-        'total_devices': len(latest_data)
+        'uptime': int(time.time() - status['start_time']),
+        'simulator_running': status['simulator_running'],
+        'total_devices': len(get_latest_data())
     })
 
 @app.route('/api/database-status')
@@ -697,14 +945,16 @@ def database_status():
     try:
         # Get database statistics
         stats = db_manager.get_table_statistics()
+        status = runtime_status()
         return jsonify({
             'success': True,
             'database_available': True,
             'db_manager': 'Available',
-            'scheduler_running': db_scheduler.running if 'db_scheduler' in globals() else False,
-            'total_saves': db_scheduler.save_count if 'db_scheduler' in globals() else 0,
-            'total_errors': db_scheduler.error_count if 'db_scheduler' in globals() else 0,
-            'table_statistics': stats
+            'scheduler_running': status['scheduler_running'],
+            'total_saves': status['db_saves'],
+            'total_errors': status['db_fails'],
+            'table_statistics': stats,
+            'query_cache': db_manager.query_cache.get_stats()
         })
     except Exception as e:
         return jsonify({
@@ -747,28 +997,177 @@ def debug_database():
     
     return jsonify(debug_info)
 
-@app.route('/api/devices')
-def api_devices():
-    """Get list of all available devices"""
-    devices = []
-    for device_id, device_data in latest_data.items():
-        devices.append({
-            'device_id': device_id,
-            'kind': device_data.get('kind'),
-            'room_id': device_data.get('room_id'),
-            'last_seen': device_data.get('timestamp')
+@app.route('/api/debug-slow-queries', methods=['GET', 'DELETE'])
+def debug_slow_queries():
+    """Statements slower than SLOW_QUERY_MS, newest first (DELETE clears the log)
+    
+    Statements and parameters can hold stored payloads, so this needs the debug secret
+    (X-Debug-Secret header or ?secret=) and is disabled while DEBUG_SECRET is unset.
+    """
+    if not request_profiler.enabled:
+        return jsonify({'success': False, 'error': 'Debug endpoints are disabled (DEBUG_SECRET is not set)'}), 404
+    if not debug_authorized():
+        return jsonify({'success': False, 'error': 'Invalid debug secret'}), 403
+    if not DATABASE_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Database not available'
+        }), 503
+    
+    if request.method == 'DELETE':
+        slow_queries.clear()
+        return jsonify({'success': True, 'cleared': True})
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+    
+    queries = slow_queries.snapshot(limit)
+    if control_client:
+        # The owner runs the scheduler and energy writes; merge its log with this worker's reads
+        queries = [dict(entry, process=f'worker-{os.getpid()}') for entry in queries]
+        try:
+            queries.extend(dict(entry, process='owner') for entry in control_client.call('slow_queries', limit=limit))
+        except Exception as e:
+            log.warning('control.unavailable', "Owner slow-query log not available: {error}", error=e)
+        queries.sort(key=lambda entry: entry['timestamp'], reverse=True)
+        queries = queries[:limit]
+    
+    return jsonify({
+        'success': True,
+        'queries': queries,
+        'count': len(queries),
+        'stats': slow_queries.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/pipeline-status')
+def pipeline_status():
+    """Get per-stage queue depths and throughput of the reading pipeline"""
+    return jsonify({
+        'success': True,
+        'pipeline': shared_status.get('pipeline') if state_reader else pipeline.get_stats(),
+        'stream': broadcaster.get_stats(),
+        'response_cache': response_cache.get_stats(),
+        'state': state_backend_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/mqtt-status')
+def mqtt_status():
+    """Get MQTT publisher throughput and latency"""
+    publisher_stats = shared_status.get('mqtt') if state_reader else (mqtt_publisher.get_stats() if mqtt_publisher else None)
+    if not publisher_stats:
+        return jsonify({
+            'success': False,
+            'error': 'MQTT publisher not enabled',
+            'mqtt_available': MQTT_AVAILABLE,
+            'mqtt_publish': MQTT_PUBLISH
         })
     
     return jsonify({
+        'success': True,
+        'publisher': publisher_stats,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics; web workers add the owner's simulator, pipeline and scheduler metrics"""
+    if not control_client:
+        return Response(render_metrics(REGISTRY.collect()), content_type=METRICS_CONTENT_TYPE)
+    families = [REGISTRY.collect({'process': f'worker-{os.getpid()}'})]
+    try:
+        families.append(control_client.call('metrics'))
+    except Exception as e:
+        log.warning('control.unavailable', "Owner metrics not available: {error}", error=e)
+    return Response(render_metrics(*families), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/topology')
+def api_topology():
+    """Get the configured building topology"""
+    return jsonify({
+        'success': True,
+        'topology': topology.summary(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+DEVICE_FILTERS = ('kind', 'room', 'stale', 'offset', 'limit')
+MAX_DEVICE_PAGE = 10000
+
+@app.route('/api/devices')
+def api_devices():
+    """Get list of all available devices (supports If-None-Match and ?since=<version>)
+    
+    Filters answered from the device registry indexes: kind=co2, room=room3,
+    stale=10m (not seen for that long, least recently seen first), offset= / limit=.
+    """
+    if any(name in request.args for name in DEVICE_FILTERS):
+        return filtered_devices(request.args)
+    
+    cached = serve_cached('devices', (), {})
+    if cached:
+        return cached
+    
+    snapshot, latest_data, since = versioned_devices()
+    version = snapshot.version
+    etag = data_etag(version, since)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    devices = device_list(latest_data)
+    payload = {
         'success': True,
         'devices': devices,
         'total_count': len(devices),
+        'version': version,
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    if since is not None:
+        payload['since'] = since
+    return with_etag(jsonify(payload), etag)
+
+def filtered_devices(params):
+    """Filtered, paginated /api/devices response from the device registry"""
+    try:
+        stale = parse_duration(params['stale']) if params.get('stale') else None
+        offset = max(0, int(params.get('offset', 0)))
+        limit = min(int(params.get('limit', 1000)), MAX_DEVICE_PAGE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameters: {e}'}), 400
+    
+    snapshot, changed, since = versioned_devices()
+    total, devices = device_registry.query(
+        kind=params.get('kind'),
+        room_id=params.get('room'),
+        stale_seconds=stale,
+        device_ids=changed if since is not None else None,
+        offset=offset,
+        limit=limit
+    )
+    payload = {
+        'success': True,
+        'devices': devices,
+        'count': len(devices),
+        'total_count': total,
+        'offset': offset,
+        'limit': limit,
+        'version': snapshot.version,
+        'timestamp': datetime.now().isoformat()
+    }
+    if offset + len(devices) < total:
+        payload['next_offset'] = offset + len(devices)
+    if since is not None:
+        payload['since'] = since
+    return jsonify(payload)
 
 @app.route('/api/devices/<device_id>')
 def api_device_detail(device_id):
     """Get detailed information for a specific device"""
+    latest_data = get_latest_data()
     if device_id in latest_data:
         device_data = latest_data[device_id]
         return jsonify({
@@ -783,77 +1182,754 @@ def api_device_detail(device_id):
             'device_id': device_id
         }), 404
 
-@app.route('/api/history/<sensor_type>/<device_id>')
-def api_sensor_history(sensor_type, device_id):
-    """Get historical data for a specific sensor"""
-    if not DATABASE_AVAILABLE or not db_manager:
+@app.route('/api/stats')
+def api_stats():
+    """Current streaming statistics and anomaly flags for all devices in one response
+    
+    Filters: kind=, room=, anomalies=true (only devices whose last reading was flagged)
+    """
+    params = request.args
+    device_ids = None
+    if params.get('room'):
+        _, records = device_registry.query(room_id=params['room'])
+        device_ids = [record['device_id'] for record in records]
+    options = {'device_ids': device_ids, 'kind': params.get('kind'),
+               'anomalies_only': params.get('anomalies', 'false').lower() == 'true'}
+    try:
+        stats = control_client.call('statistics', **options) if control_client else streaming_stats.snapshot(**options)
+    except Exception as e:
         return jsonify({
             'success': False,
-            'error': 'Database not available'
+            'error': f'Statistics not available: {e}'
         }), 503
     
+    anomalies = [item['device_id'] for item in stats['devices'] if item['anomaly']]
+    return jsonify({
+        'success': True,
+        'devices': stats['devices'],
+        'device_count': len(stats['devices']),
+        'anomalies': anomalies,
+        'anomaly_count': len(anomalies),
+        'recent_anomalies': stats['recent_anomalies'],
+        'zscore_threshold': streaming_stats.zscore,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/alerts')
+def api_alerts():
+    """Active alerts and recent fired / resolved events
+    
+    Filters: severity=, kind=, room=; since=<seq> returns only events after that sequence
+    """
+    params = request.args
     try:
-        # Get hours parameter (default 24)
-        hours = int(request.args.get('hours', 24))
-        
-        # Get historical data from database
-        history_data = db_manager.get_recent_data(device_id=device_id, kind=sensor_type, limit=1000)
-        
-        # Format data for frontend
-        formatted_data = []
-        for record in history_data:
-            if hasattr(record, 'timestamp'):
-                formatted_data.append({
-                    'timestamp': record.timestamp.isoformat(),
-                    'value': getattr(record, f'{sensor_type}_c', None) or 
-                            getattr(record, f'{sensor_type}_percent', None) or
-                            getattr(record, f'{sensor_type}_ppm', None) or
-                            getattr(record, 'power_watts', None) or
-                            getattr(record, 'value', None),
-                    'device_id': record.device_id,
-                    'room_id': getattr(record, 'room_id', None)
-                })
-        
+        since = int(params['since']) if params.get('since') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since must be an integer'}), 400
+    options = {'since': since, 'severity': params.get('severity'), 'kind': params.get('kind'),
+               'room_id': params.get('room')}
+    try:
+        alerts = control_client.call('alerts', **options) if control_client else alert_engine.snapshot(**options)
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': f'Alerts not available: {e}'
+        }), 503
+    
+    return jsonify({
+        'success': True,
+        'active': alerts['active'],
+        'active_count': len(alerts['active']),
+        'events': alerts['events'],
+        'last_seq': alerts['last_seq'],
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/alerts/rules')
+def api_alert_rules():
+    """Compiled alert rules"""
+    return jsonify({
+        'success': True,
+        'rules': [rule.to_dict() for rule in alert_engine.rules],
+        'rule_count': len(alert_engine.rules)
+    })
+
+HISTORY_SHAPES = ('rows', 'columnar')
+
+def negotiated_format(params):
+    """'json', 'msgpack' or 'raw' from format= or else the Accept header"""
+    requested = params.get('format')
+    if requested:
+        if requested not in RESPONSE_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(RESPONSE_FORMATS)}")
+        return requested
+    offers = ['application/json'] + [mimetype for mimetype, fmt in BINARY_ACCEPT.items() if format_available(fmt)]
+    return BINARY_ACCEPT.get(request.accept_mimetypes.best_match(offers), 'json')
+
+def vary_accept(response):
+    response.vary.add('Accept')
+    return response
+
+def binary_response(response_format, document):
+    """msgpack / raw columnar body for a document with a 'series' list of 't' / 'v' arrays"""
+    if not format_available(response_format):
+        return jsonify({'success': False, 'error': f'{response_format} responses require the msgpack package'}), 406
+    body, mimetype = encode_binary(response_format, document)
+    return vary_accept(Response(body, mimetype=mimetype))
+
+def history_window(params):
+    """(hours, limit) for the history endpoints; ValueError unless both are positive"""
+    hours = float(params.get('hours', 24))
+    limit = int(params.get('limit', 1000))
+    if not 0 < hours < float('inf'):
+        raise ValueError('hours must be a positive number')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return hours, limit
+
+def downsample_options(params):
+    """(points, resolution seconds, method) for history downsampling, or None if not requested"""
+    points = params.get('points')
+    resolution = params.get('resolution')
+    points = None if points in (None, '') else int(points)
+    resolution = None if resolution in (None, '') else float(resolution)
+    if points is None and resolution is None:
+        return None
+    if points is not None and points <= 0:
+        raise ValueError('points must be positive')
+    if resolution is not None and not 0 < resolution < float('inf'):
+        raise ValueError('resolution must be a positive number of seconds')
+    method = params.get('downsample', 'lttb')
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    return (points, resolution, method)
+
+def downsample_summary(options, original_count, count):
+    points, resolution, method = options
+    summary = {'method': effective_method(method), 'points': points, 'resolution': resolution,
+               'original_count': original_count, 'count': count}
+    if summary['method'] != method:
+        summary['requested_method'] = method  # numpy missing: evenly spaced points instead
+    return summary
+
+def buffered_history(pairs, start, end, limit):
+    """Ring buffer windows for (kind, device_id) pairs; web workers ask the owner process"""
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    if control_client:
+        try:
+            return control_client.call('recent_history', pairs=pairs, start=start_ts, end=end_ts, limit=limit)
+        except Exception as e:
+            log.warning('control.unavailable', "Recent history not available from the owner: {error}", error=e)
+            return {}
+    return recent_history.windows(pairs, start_ts, end_ts, limit)
+
+def load_history(pairs, start, end, limit, hours=None):
+    """{(kind, device_id): series} from the ring buffers, querying the database only for older windows
+    
+    The database fills in only the points older than a device's buffered range (the whole window
+    when nothing is buffered), so the newest readings not yet saved by the DatabaseSink are kept.
+    hours marks a window that ends now, so the database query cache can key it by its length.
+    Each series has ascending 'timestamps' (datetimes), 'values', 'room_id', 'source'
+    ('memory', 'database' or 'memory+database') and 'complete' (False if the database part was
+    not available, in which case whatever the ring buffer holds is returned).
+    """
+    start_ts = start.timestamp()
+    series = {}
+    older = {}  # covered_from (None = nothing buffered) -> pairs whose earlier points come from the database
+    for pair, (timestamps, values, covered_from) in buffered_history(pairs, start, end, limit).items():
+        series[pair] = {'timestamps': [datetime.fromtimestamp(ts) for ts in timestamps], 'values': values,
+                        'room_id': None, 'source': 'memory', 'complete': True}
+        if len(values) < limit and (covered_from is None or covered_from > start_ts):
+            older.setdefault(covered_from, []).append(pair)
+    for pair in pairs:
+        if pair not in series:
+            series[pair] = {'timestamps': [], 'values': [], 'room_id': None, 'source': 'memory', 'complete': True}
+            older.setdefault(None, []).append(pair)
+    
+    # One query per distinct buffer start (devices fed by the same ticks share it)
+    for covered_from, group in older.items():
+        history = None
+        if DATABASE_AVAILABLE and db_manager:
+            if covered_from is None and hours is not None:
+                history = db_manager.get_history_batch(group, hours=hours, limit_per_device=limit)
+            else:
+                db_end = end if covered_from is None else datetime.fromtimestamp(covered_from)
+                history = db_manager.get_history_batch(group, start=start, end=db_end, limit_per_device=limit)
+        for pair in group:
+            entry = series[pair]
+            if history is None:
+                entry['complete'] = False
+                continue
+            stored = history[pair]
+            timestamps, values = stored['timestamps'], stored['values']
+            if covered_from is not None:
+                # The end bound is inclusive; the buffer already holds that point
+                keep = bisect_left(timestamps, db_end)
+                timestamps, values = timestamps[:keep], values[:keep]
+            keep = max(limit - len(entry['values']), 0)
+            timestamps, values = timestamps[len(timestamps) - keep:], values[len(values) - keep:]
+            if not timestamps:
+                continue
+            entry['timestamps'] = timestamps + entry['timestamps']
+            entry['values'] = values + entry['values']
+            entry['room_id'] = stored['room_id']
+            entry['source'] = 'database' if covered_from is None else 'memory+database'
+    return series
+
+@app.route('/api/forecast', methods=['GET', 'POST'])
+def api_forecast():
+    """Next steps= forecast steps for many devices from the incrementally updated models
+    
+    Select devices like /api/history/batch (devices=kind:id,..., room=, building=, kind=);
+    without a selection every device (optionally of one kind=) is forecast.
+    """
+    if not FORECAST_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Forecasting requires numpy'
+        }), 503
+    
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        steps = int(params.get('steps', 12))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'steps must be an integer'}), 400
+    if not 1 <= steps <= FORECAST_CONFIG['max_steps']:
+        return jsonify({'success': False, 'error': f"steps must be between 1 and {FORECAST_CONFIG['max_steps']}"}), 400
+    
+    options = {'steps': steps, 'device_ids': None, 'kind': None}
+    if params.get('devices') or params.get('room') or params.get('building'):
+        options['device_ids'] = [device_id for _, device_id in history_selection(params)]
+    else:
+        options['kind'] = params.get('kind')
+    try:
+        forecast = control_client.call('forecast', **options) if control_client else forecast_model.forecast(**options)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Forecast not available: {e}'
+        }), 503
+    
+    return jsonify({
+        'success': True,
+        'steps': steps,
+        'step_seconds': forecast_model.step,
+        'timestamps': forecast['timestamps'],
+        'devices': forecast['devices'],
+        'device_count': len(forecast['devices']),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/history/<sensor_type>/<device_id>')
+def api_sensor_history(sensor_type, device_id):
+    """Get historical data for a specific sensor (downsample with points= / resolution=)
+    
+    Windows covered by the in-memory ring buffer never touch the database.
+    shape=columnar returns data as {"t": [...], "v": [...]} instead of one object per point;
+    Accept: application/msgpack (or format=msgpack|raw) returns a binary series.
+    """
+    try:
+        hours, limit = history_window(request.args)
+        downsample = downsample_options(request.args)
+        response_format = negotiated_format(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameters: {e}'}), 400
+    shape = request.args.get('shape', 'rows')
+    if shape not in HISTORY_SHAPES:
+        return jsonify({'success': False, 'error': f"shape must be one of {', '.join(HISTORY_SHAPES)}"}), 400
+    
+    try:
+        end = datetime.now()
+        start = end - timedelta(hours=hours)
+        
+        pair = (sensor_type.lower(), device_id)
+        entry = load_history([pair], start, end, limit, hours=hours)[pair]
+        if not entry['complete'] and not entry['values']:
+            if not DATABASE_AVAILABLE or not db_manager:
+                return jsonify({
+                    'success': False,
+                    'error': 'Database not available'
+                }), 503
+            return jsonify({
+                'success': False,
+                'error': 'Database query failed'
+            }), 500
+        
+        device = topology.get_device(device_id)
+        room_id = entry['room_id'] or (device.room_id if device else None)
+        timestamps, values = entry['timestamps'], entry['values']
+        downsampled = None
+        if downsample:
+            # Downsample in time order
+            keep = downsample_indices(timestamps, values, *downsample)
+            downsampled = downsample_summary(downsample, len(values), len(keep))
+            timestamps = [timestamps[i] for i in keep]
+            values = [values[i] for i in keep]
+        
+        if response_format != 'json':
+            document = {
+                'success': True,
+                'sensor_type': sensor_type,
+                'device_id': device_id,
+                'hours': hours,
+                'source': entry['source'],
+                'complete': entry['complete'],
+                'series': [{'device_id': device_id, 'kind': pair[0], 'room_id': room_id, 'count': len(values),
+                            't': epoch_ms(timestamps), 'v': values}]
+            }
+            if downsampled:
+                document['downsampled'] = downsampled
+            return binary_response(response_format, document)
+        
+        # Format data for frontend (newest first); datetimes are serialized by the JSON provider
+        timestamps, values = timestamps[::-1], values[::-1]
+        if shape == 'columnar':
+            data = {'t': timestamps, 'v': values}
+        else:
+            data = [{
+                'timestamp': timestamp,
+                'value': value,
+                'device_id': device_id,
+                'room_id': room_id
+            } for timestamp, value in zip(timestamps, values)]
+        
+        payload = {
             'success': True,
-            'data': formatted_data,
-            'count': len(formatted_data),
+            'data': data,
+            'count': len(values),
             'sensor_type': sensor_type,
             'device_id': device_id,
-            'hours': hours
-        })
+            'hours': hours,
+            'source': entry['source'],
+            'complete': entry['complete']
+        }
+        if shape == 'columnar':
+            payload['room_id'] = room_id
+        if downsampled:
+            payload['downsampled'] = downsampled
+        return vary_accept(jsonify(payload))
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f'Database query failed: {str(e)}'
+            'error': f'History query failed: {str(e)}'
+        }), 500
+
+def history_selection(params):
+    """(kind, device_id) pairs for a batch history request (explicit list, room or building)"""
+    pairs = []
+    devices = params.get('devices')
+    if isinstance(devices, str):
+        devices = [item.split(':', 1) for item in devices.split(',') if ':' in item]
+    for item in devices or []:
+        if isinstance(item, dict):
+            pairs.append((item.get('kind'), item.get('device_id')))
+        else:
+            pairs.append(tuple(item))
+    
+    descriptors = []
+    if params.get('room'):
+        descriptors.extend(topology.devices_in_room(params['room']))
+    if params.get('building'):
+        descriptors.extend(topology.devices_in_building(params['building']))
+    kinds = params.get('kind')
+    if isinstance(kinds, str):
+        kinds = kinds.split(',')
+    for device in descriptors:
+        if not kinds or device.kind in kinds:
+            pairs.append((device.kind, device.device_id))
+    
+    # Drop malformed and duplicate pairs, keep request order
+    return list(dict.fromkeys((str(kind).lower(), str(device_id)) for kind, device_id in pairs
+                              if kind and device_id))
+
+@app.route('/api/history/batch', methods=['GET', 'POST'])
+def api_history_batch():
+    """Get historical data for many devices with one query per sensor table
+    
+    Select devices with devices=kind:id,kind:id (or a JSON list when POSTing), room=<room_id>
+    or building=<building_id> (optionally narrowed with kind=), over a shared hours= window.
+    points= / resolution= (seconds) downsample each series with downsample=lttb|minmax.
+    Series whose window is covered by the in-memory ring buffers skip the database.
+    Accept: application/msgpack (or format=msgpack|raw) returns 't' (epoch ms) / 'v' arrays in binary.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        hours, limit = history_window(params)
+        downsample = downsample_options(params)
+        response_format = negotiated_format(params)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid parameters: {e}'}), 400
+    
+    pairs = history_selection(params)
+    if not pairs:
+        return jsonify({
+            'success': False,
+            'error': 'No devices selected (use devices=kind:id,..., room= or building=)'
+        }), 400
+    
+    end = datetime.now()
+    start = end - timedelta(hours=hours)
+    history = load_history(pairs, start, end, limit, hours=hours)
+    if not any(entry['complete'] or entry['values'] for entry in history.values()):
+        if not DATABASE_AVAILABLE or not db_manager:
+            return jsonify({
+                'success': False,
+                'error': 'Database not available'
+            }), 503
+        return jsonify({
+            'success': False,
+            'error': 'Database query failed'
+        }), 500
+    
+    series = []
+    for kind, device_id in pairs:
+        entry = history[(kind, device_id)]
+        device = topology.get_device(device_id)
+        timestamps, values = entry['timestamps'], entry['values']
+        item = {
+            'device_id': device_id,
+            'kind': kind,
+            'room_id': entry['room_id'] or (device.room_id if device else None),
+            'unit': device.unit if device else None,
+            'source': entry['source'],
+            'complete': entry['complete']
+        }
+        if downsample:
+            keep = downsample_indices(timestamps, values, *downsample)
+            item['downsampled'] = downsample_summary(downsample, len(values), len(keep))
+            timestamps = [timestamps[i] for i in keep]
+            values = [values[i] for i in keep]
+        item['count'] = len(values)
+        if response_format != 'json':
+            item['t'] = epoch_ms(timestamps)
+            item['v'] = values
+        else:
+            item['timestamps'] = timestamps
+            item['values'] = values
+        series.append(item)
+    
+    if response_format != 'json':
+        return binary_response(response_format, {
+            'success': True,
+            'device_count': len(series),
+            'start': epoch_ms([start])[0],
+            'end': epoch_ms([end])[0],
+            'hours': hours,
+            'series': series
+        })
+    return vary_accept(jsonify({
+        'success': True,
+        'series': series,
+        'device_count': len(series),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'hours': hours
+    }))
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def parse_duration(value):
+    """Whole seconds for '90', '15m', '1h', '1d' or '1w'; ValueError for negative or fractional seconds"""
+    value = str(value).strip().lower()
+    unit = DURATION_UNITS.get(value[-1:])
+    seconds = float(value[:-1]) * unit if unit else float(value)
+    if not 0 <= seconds < float('inf') or seconds != int(seconds):
+        raise ValueError(f"duration '{value}' is not a whole number of seconds >= 0")
+    return int(seconds)
+
+def time_window(params, default_hours=24):
+    """(start, end) from start=/end= ISO timestamps or hours= before now"""
+    end = datetime.fromisoformat(params['end']) if params.get('end') else datetime.now()
+    if params.get('start'):
+        start = datetime.fromisoformat(params['start'])
+    else:
+        start = end - timedelta(hours=float(params.get('hours', default_hours)))
+    return start, end
+
+def split_param(params, name):
+    value = params.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+@app.route('/api/aggregate')
+def api_aggregate():
+    """Grouped statistics computed by the database, e.g. average temperature per room per hour
+    
+    kind=temperature,co2  group_by=device,room,kind  bucket=1h (whole seconds, 0 for the whole window)
+    agg=avg,min,max,count,sum,twa  start=/end= (ISO) or hours=  device= / room= filters
+    """
+    if not DATABASE_AVAILABLE or not db_manager:
+        return jsonify({
+            'success': False,
+            'error': 'Database not available'
+        }), 503
+    
+    params = request.args
+    try:
+        start, end = time_window(params)
+        bucket_seconds = parse_duration(params.get('bucket', '1h'))
+        group_by = split_param(params, 'group_by') if 'group_by' in params else ['room']
+        aggregates = split_param(params, 'agg') or ['avg']
+        result = db_manager.aggregate_sensor_data(
+            kinds=split_param(params, 'kind') or None,
+            group_by=group_by,
+            bucket_seconds=bucket_seconds,
+            aggregates=aggregates,
+            start=start,
+            end=end if params.get('end') else None,  # open-ended windows are not cached
+            device_ids=split_param(params, 'device') or None,
+            room_ids=split_param(params, 'room') or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameters: {e}'}), 400
+    
+    if result is None:
+        return jsonify({
+            'success': False,
+            'error': 'Database query failed'
+        }), 500
+    
+    first = next(iter(result.values()), [])
+    return jsonify({
+        'success': True,
+        'columns': result,
+        'row_count': len(first),
+        'bucket_seconds': bucket_seconds,
+        'start': start.isoformat(),
+        'end': end.isoformat()
+    })
+
+@app.route('/api/energy')
+def api_energy():
+    """Energy (kWh) over a time range, summed from hourly / daily checkpoints
+    
+    scope=device|room|kind (default kind)  id=<ids>  kind=light,solar  period=hour|day
+    start=/end= (ISO) or hours=
+    """
+    if not DATABASE_AVAILABLE or not db_manager:
+        return jsonify({
+            'success': False,
+            'error': 'Database not available'
+        }), 503
+    
+    params = request.args
+    try:
+        start, end = time_window(params)
+        scope = params.get('scope', 'kind')
+        if scope not in ENERGY_SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(ENERGY_SCOPES)}")
+        period = params.get('period') or ('hour' if end - start <= timedelta(hours=48) else 'day')
+        if period not in ENERGY_PERIODS:
+            raise ValueError(f"period must be one of {', '.join(ENERGY_PERIODS)}")
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameters: {e}'}), 400
+    
+    start = bucket_start(start, period)
+    rows = db_manager.get_energy_checkpoints(period, start, end, scope=scope,
+                                             scope_ids=split_param(params, 'id') or None,
+                                             kinds=split_param(params, 'kind') or None)
+    if rows is None:
+        return jsonify({
+            'success': False,
+            'error': 'Database query failed'
         }), 500
+    
+    # One columnar series per (scope id, kind); rows arrive ordered by series and time
+    series = {}
+    for _, scope_id, kind, bucket, energy_wh, cumulative_wh in rows:
+        item = series.get((scope_id, kind))
+        if item is None:
+            item = series[(scope_id, kind)] = {'id': scope_id, 'kind': kind, 'buckets': [], 'energy_kwh': [],
+                                               'total_kwh': 0.0}
+        item['buckets'].append(bucket)
+        item['energy_kwh'].append(round(energy_wh / 1000.0, 6))
+        item['total_kwh'] += energy_wh / 1000.0
+        item['lifetime_kwh'] = round(cumulative_wh / 1000.0, 6)
+    totals = {}
+    for item in series.values():
+        item['total_kwh'] = round(item['total_kwh'], 6)
+        totals[item['kind']] = round(totals.get(item['kind'], 0.0) + item['total_kwh'], 6)
+    
+    return jsonify({
+        'success': True,
+        'scope': scope,
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': list(series.values()),
+        'total_kwh_by_kind': totals
+    })
 
 def start_simulator():
-    """Start the simulator and database scheduler"""
-    global start_time
+    """Start the reading pipeline (simulator, database scheduler and optional MQTT/file endpoints)"""
+    global start_time, mqtt_publisher, mqtt_source
     start_time = time.time()
     
-    # Start simulator in background thread
-    simulator_thread = threading.Thread(target=simulator.run, daemon=True)
-    simulator_thread.start()
-    print("[System] Realistic simulator started")
-    
-    # Start database scheduler in background thread
+    # Database scheduler sink - saves the latest reading per device every 5 minutes
     if DATABASE_AVAILABLE:
-        db_scheduler_thread = threading.Thread(target=db_scheduler.run, daemon=True)
-        db_scheduler_thread.start()
-        print("[System] Database scheduler started - saving data every 5 minutes to specific tables")
+        pipeline.add_sink(db_scheduler)
+        log.info('system.attached', "Database scheduler attached - saving data every 5 minutes to specific tables")
+        pipeline.add_sink(energy_accumulator)
+        log.info('system.attached', "Energy accumulator attached - hourly/daily kWh checkpoints")
     else:
-        print("[System] Database scheduler not started - database not available")
+        log.warning('system.not_started', "Database scheduler not started - database not available")
+    
+    # Forecast models, updated once per forecast step
+    if FORECAST_AVAILABLE:
+        pipeline.add_sink(ForecastSink(forecast_model, name='Forecast'))
+        log.info('system.attached', "Forecast models attached - {step}s steps, daily seasonality", step=forecast_model.step)
+    else:
+        log.warning('system.not_started', "Forecasting not started - numpy not installed")
+    
+    # MQTT publisher sink
+    if MQTT_PUBLISH and MQTT_AVAILABLE:
+        try:
+            mqtt_publisher = MQTTPublisher()
+            mqtt_publisher.connect()
+            pipeline.add_sink(MQTTSink(mqtt_publisher, name='MQTT Publisher'))
+            log.info('system.attached', "MQTT publisher attached to pipeline")
+            if ALERT_CONFIG['mqtt']:
+                alert_engine.add_listener(mqtt_publisher.publish_alert)
+                log.info('system.attached', "Alert events published over MQTT")
+        except Exception as e:
+            log.error('system.not_started', "MQTT publisher not started: {error}", error=e)
+            mqtt_publisher = None
+    elif MQTT_PUBLISH:
+        log.warning('system.not_started', "MQTT publisher not started - paho-mqtt not installed")
+    if ALERT_CONFIG['mqtt'] and not mqtt_publisher:
+        log.warning('system.not_started', "ALERT_MQTT needs the MQTT publisher (MQTT_PUBLISH=true)")
+    
+    # MQTT ingestion source (external devices)
+    if MQTT_INGEST and MQTT_AVAILABLE:
+        mqtt_source = MQTTSource(topology)
+        pipeline.add_source(mqtt_source)
+        log.info('system.attached', "MQTT ingestion source attached to pipeline")
+    elif MQTT_INGEST:
+        log.warning('system.not_started', "MQTT ingestion not started - paho-mqtt not installed")
+    
+    # File replay source and file sink
+    if REPLAY_FILE:
+        pipeline.add_source(FileReplaySource(REPLAY_FILE, speed=REPLAY_SPEED, topology=topology))
+        log.info('system.attached', "Replaying {path} at {speed}x", path=REPLAY_FILE, speed=REPLAY_SPEED)
+    if PIPELINE_FILE_SINK:
+        pipeline.add_sink(FileSink(PIPELINE_FILE_SINK, name='File Sink'))
+        log.info('system.attached', "Writing readings to {path}", path=PIPELINE_FILE_SINK)
+    
+    # Start pipeline threads; the simulator source starts the realistic simulator
+    pipeline.start()
+    log.info('system.started', "Realistic simulator started")
+
+def state_backend_stats():
+    """Shared state backend statistics for this process"""
+    if state_publisher:
+        return state_publisher.get_stats()
+    if state_reader:
+        return state_reader.get_stats()
+    return {'backend': 'local'}
+
+def publish_shared_state():
+    """Owner: publish the latest snapshot and runtime status to the web workers
+    
+    Called from the sink thread and from control threads (simulator toggle); the lock keeps
+    the published sequence numbers and the segment in step.
+    """
+    global published_write_seq, published_alert_seq
+    with publish_lock:
+        status = dict(runtime_status())
+        status['pipeline'] = pipeline.get_stats()
+        status['mqtt'] = mqtt_publisher.get_stats() if mqtt_publisher else None
+        state = {'snapshot': latest_store.current().shareable(), 'status': status, 'epoch': stream_epoch}
+        if db_manager:
+            # Database writes since the last publish, so workers drop the cached queries they overlap
+            write_seq, writes = db_manager.query_cache.writes_since(published_write_seq)
+            state['db_writes'] = (write_seq, writes)
+            published_write_seq = write_seq
+        # Alert events since the last publish, streamed to SSE clients by the workers
+        alert_seq, events = alert_engine.events_since(published_alert_seq)
+        state['alert_events'] = events
+        published_alert_seq = alert_seq
+        state_publisher.publish(state)
+
+def owner_toggle_simulator():
+    running = toggle_local_simulator()
+    publish_shared_state()
+    return running
+
+def run_state_owner():
+    """Run the simulator, pipeline and database scheduler and serve their state to web workers"""
+    global state_publisher
+    print("=" * 60)
+    print("🧭 Starting State Owner (simulator + scheduler, shared memory state)")
+    print("=" * 60)
+    
+    state_publisher = SharedStatePublisher()
+    latest_store.add_listener(publish_shared_state)
+    control = ControlServer({'toggle_simulator': owner_toggle_simulator, 'recent_history': recent_history.windows,
+                             'statistics': streaming_stats.snapshot, 'alerts': alert_engine.snapshot,
+                             'forecast': forecast_model.forecast if forecast_model else None,
+                             'metrics': lambda: REGISTRY.collect({'process': 'owner'}),
+                             'slow_queries': slow_queries.snapshot if DATABASE_AVAILABLE else None})
+    control.start()
+    
+    # gunicorn stops the owner with SIGTERM; exit through the cleanup below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    start_simulator()
+    publish_shared_state()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        control.stop()
+        state_publisher.close()
+
+def apply_shared_state(state):
+    """Worker: install a state published by the owner and stream its changes"""
+    global shared_status, published_alert_seq, streamed_version
+    snapshot = state['snapshot']
+    shared_status = state['status']
+    restarted = state['epoch'] != broadcaster.epoch
+    if restarted:
+        # New owner process: its store versions and alert sequence start over
+        broadcaster.set_epoch(state['epoch'])
+        published_alert_seq = 0
+        streamed_version = 0
+    if db_manager and state.get('db_writes'):
+        db_manager.query_cache.replay(*state['db_writes'])
+    for event in state.get('alert_events', ()):
+        if event['seq'] > published_alert_seq:
+            broadcaster.publish_alert(event)
+            published_alert_seq = event['seq']
+    if restarted or snapshot.version != latest_store.version:
+        # Store listeners stream the delta and rebuild the cached bodies
+        latest_store.install(snapshot)
+        device_registry.sync(snapshot.devices)
+
+def attach_shared_state():
+    """Worker: serve the owner's state instead of running a simulator"""
+    global state_reader, control_client
+    control_client = ControlClient()
+    state_reader = SharedStateReader(apply_shared_state)
+    state_reader.start()
+    log.info('state.worker', "Web worker {pid} reading shared state from the owner process", pid=os.getpid())
+
+if STATE_CONFIG['backend'] == 'shm' and STATE_ROLE == 'worker':
+    attach_shared_state()
 
 if __name__ == '__main__':
+    if STATE_CONFIG['backend'] == 'shm' and STATE_ROLE == 'owner':
+        run_state_owner()
+        sys.exit(0)
+    
     print("=" * 60)
     print("🚀 Starting Sensor Dashboard (No SocketIO)")
     print("=" * 60)
     
-    # Start simulator
-    start_simulator()
+    # Start simulator (web workers in shared-state mode only serve the owner's state)
+    if not state_reader:
+        start_simulator()
     
     # Get port from environment
     port = int(os.getenv('PORT', 5000))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pre-serialized response cache
+Data endpoints return the same device data until the next tick, so their JSON
+bodies are built once per store update (plus a gzip variant) and swapped in
+with a single reference assignment. Requests only append a few per-request
+fields such as timestamp and uptime to the cached prefix.
+
+Gzip variants are compressed up to a sync-flush point; per request the
+compressor state is copied and only the short tail is compressed.
+"""
+
+import os
+import time
+import zlib
+import threading
+
+from json_codec import dumpb
+
+# gzip level for cached bodies (0 disables the gzip variant)
+GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+GZIP_MIN_SIZE = int(os.getenv('RESPONSE_GZIP_MIN_SIZE', '1024'))
+
+
+class CachedBody:
+    """JSON object for one data version, serialized up to (not including) its closing brace"""
+
+    __slots__ = ('version', 'head', 'gzip_head', '_compressor')
+
+    def __init__(self, version, head, gzip_level=GZIP_LEVEL):
+        self.version = version
+        self.head = head
+        self.gzip_head = None
+        self._compressor = None
+        if gzip_level and len(head) >= GZIP_MIN_SIZE:
+            compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+            self.gzip_head = compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._compressor = compressor
+
+    @property
+    def has_gzip(self):
+        return self._compressor is not None
+
+    def body(self, tail):
+        """Complete body; tail is the remaining fields plus the closing brace"""
+        return self.head + tail
+
+    def gzip_body(self, tail):
+        """Complete gzip body, compressing only the tail"""
+        compressor = self._compressor.copy()
+        return self.gzip_head + compressor.compress(tail) + compressor.flush()
+
+
+class ResponseCache:
+    """Per-endpoint CachedBody objects rebuilt after every LatestValueStore update"""
+
+    def __init__(self, store, gzip_level=GZIP_LEVEL):
+        self.store = store
+        self.gzip_level = gzip_level
+        self._builders = {}  # key -> function(version, devices) -> dict of static fields
+        self._entries = {}  # key -> CachedBody, replaced as a whole on every rebuild
+        self._build_lock = threading.Lock()
+        self.build_count = 0
+        self.build_seconds = 0.0
+        store.add_listener(self.rebuild)
+
+    def register(self, key, builder):
+        """Add an endpoint body; builder(version, devices) returns its static fields in order
+
+        A field whose value is the devices dict itself reuses one shared serialization.
+        """
+        self._builders[key] = builder
+
+    def rebuild(self):
+        """Serialize every registered body for the store's current version"""
+        started = time.perf_counter()
+        with self._build_lock:
+            version, devices = self.store.snapshot()
+            devices_json = None
+            entries = {}
+            for key, builder in self._builders.items():
+                parts = []
+                for name, value in builder(version, devices).items():
+                    if value is devices:
+                        if devices_json is None:
+                            devices_json = dumpb(devices)
+                        value_json = devices_json
+                    else:
+                        value_json = dumpb(value)
+                    parts.append(dumpb(name) + b':' + value_json)
+                head = b'{' + b','.join(parts)
+                entries[key] = CachedBody(version, head, self.gzip_level)
+            self._entries = entries
+        self.build_count += 1
+        self.build_seconds += time.perf_counter() - started
+
+    def get(self, key):
+        """Current CachedBody for an endpoint, or None before the first update"""
+        return self._entries.get(key)
+
+    @staticmethod
+    def tail(fields):
+        """Serialize per-request fields as the rest of a cached object"""
+        if not fields:
+            return b'}'
+        return b',' + dumpb(fields)[1:]
+
+    def get_stats(self):
+        entries = self._entries
+        return {
+            'builds': self.build_count,
+            'avg_build_ms': round(self.build_seconds / self.build_count * 1000, 3) if self.build_count else 0,
+            'gzip_level': self.gzip_level,
+            'entries': {key: {'version': entry.version, 'bytes': len(entry.head),
+                              'gzip_bytes': len(entry.gzip_head) if entry.has_gzip else None}
+                        for key, entry in entries.items()}
+        }
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared state backend for multi-worker serving
+- One owner process runs the simulator, pipeline and database scheduler and
+  publishes its state (latest-value snapshot plus status counters) into a
+  shared memory segment after every tick
+- Any number of stateless web workers attach to the segment and serve the API
+  from it; a worker only deserializes when the sequence number changes
+- Commands that change owner state (e.g. toggling the simulator) and queries
+  answered by the owner go over an authenticated local socket; the owner serves
+  each connection from a small thread pool and workers time out their calls
+- Workers re-attach when a restarted owner recreates the segment
+
+Segment layout: [sequence: u64][length: u64][pickled state]. The sequence is
+odd while the owner is writing; readers copy the payload and re-check the
+sequence, retrying on the next poll if it moved (seqlock).
+"""
+
+import os
+import time
+import pickle
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Listener, Client
+
+from structured_log import get_logger
+
+# State backend configuration - can be overridden by environment variables
+STATE_CONFIG = {
+    'backend': os.getenv('STATE_BACKEND', 'local'),  # local (single process) or shm (owner + workers)
+    'shm_name': os.getenv('STATE_SHM_NAME', 'digitaltwin-state'),
+    'shm_size': int(os.getenv('STATE_SHM_SIZE', str(32 * 1024 * 1024))),
+    'control_address': os.getenv('STATE_CONTROL_ADDRESS', '/tmp/digitaltwin-control.sock'),
+    'poll_interval': float(os.getenv('STATE_POLL_INTERVAL', '0.1')),
+    'control_threads': int(os.getenv('STATE_CONTROL_THREADS', '8')),  # owner threads answering workers
+    'control_timeout': float(os.getenv('STATE_CONTROL_TIMEOUT', '5')),  # seconds a worker waits for a reply
+    'authkey': os.getenv('STATE_AUTHKEY')  # gunicorn.conf.py generates one per run
+}
+
+SHM_DIR = '/dev/shm'
+
+log = get_logger('State')
+
+_SEQ = struct.Struct('<Q')
+_LENGTH = struct.Struct('<Q')
+_HEADER_SIZE = _SEQ.size + _LENGTH.size
+
+
+class SharedStatePublisher:
+    """Owner side: writes pickled state into a named shared memory segment"""
+
+    def __init__(self, name=None, size=None):
+        self.name = name or STATE_CONFIG['shm_name']
+        self.size = size or STATE_CONFIG['shm_size']
+        try:
+            # Left over from an owner that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.size)
+        self.seq = 0
+        self.publish_count = 0
+        self.last_size = 0
+        self.error_count = 0
+        self._lock = threading.Lock()
+        _SEQ.pack_into(self.shm.buf, 0, 0)
+        log.info('state.segment_created', "Shared memory segment '{segment}' created ({size} bytes)", segment=self.name, size=self.size)
+
+    def publish(self, state):
+        """Serialize and publish one state dict; returns False if it does not fit"""
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        if _HEADER_SIZE + len(data) > self.size:
+            self.error_count += 1
+            log.error('state.too_large', "State of {bytes} bytes does not fit in {size} bytes (raise STATE_SHM_SIZE)",
+                      bytes=len(data), size=self.size)
+            return False
+        with self._lock:
+            buf = self.shm.buf
+            _SEQ.pack_into(buf, 0, self.seq + 1)  # odd: write in progress
+            buf[_HEADER_SIZE:_HEADER_SIZE + len(data)] = data
+            _LENGTH.pack_into(buf, _SEQ.size, len(data))
+            self.seq += 2
+            _SEQ.pack_into(buf, 0, self.seq)
+            self.publish_count += 1
+            self.last_size = len(data)
+        return True
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+        log.info('state.segment_removed', "Shared memory segment '{segment}' removed", segment=self.name)
+
+    def get_stats(self):
+        return {
+            'backend': 'shm',
+            'role': 'owner',
+            'segment': self.name,
+            'sequence': self.seq,
+            'publishes': self.publish_count,
+            'last_state_bytes': self.last_size,
+            'errors': self.error_count
+        }
+
+
+class SharedStateReader:
+    """Worker side: polls the shared segment and hands new states to a callback"""
+
+    def __init__(self, on_state, name=None, poll_interval=None):
+        self.on_state = on_state
+        self.name = name or STATE_CONFIG['shm_name']
+        self.poll_interval = poll_interval or STATE_CONFIG['poll_interval']
+        self.shm = None
+        self._inode = None
+        self.seq = 0
+        self.update_count = 0
+        self.retry_count = 0
+        self.reattach_count = 0
+        self.running = False
+        self._thread = None
+
+    def _attach(self):
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        # Readers must not unlink the owner's segment when they exit (Python < 3.13 tracks attaches too)
+        try:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception:
+            pass
+        self._inode = self._segment_inode()
+        log.info('state.attached', "Attached to shared memory segment '{segment}'", segment=self.name)
+        return True
+
+    def _segment_inode(self):
+        """Inode of the segment currently registered under the name (None if unknown)"""
+        try:
+            return os.stat(os.path.join(SHM_DIR, self.shm._name.lstrip('/'))).st_ino
+        except OSError:
+            return None
+
+    def _replaced(self):
+        """True once a restarted owner has created a new segment under the same name"""
+        if self._inode is None or not os.path.isdir(SHM_DIR):
+            return False
+        try:
+            return os.stat(os.path.join(SHM_DIR, self.shm._name.lstrip('/'))).st_ino != self._inode
+        except FileNotFoundError:
+            return False  # owner gone: keep the last state until a new segment appears
+
+    def read(self):
+        """New state since the last read, or None"""
+        buf = self.shm.buf
+        seq = _SEQ.unpack_from(buf, 0)[0]
+        if seq == self.seq or seq % 2:
+            return None
+        length = _LENGTH.unpack_from(buf, _SEQ.size)[0]
+        data = bytes(buf[_HEADER_SIZE:_HEADER_SIZE + length])
+        if _SEQ.unpack_from(buf, 0)[0] != seq:
+            self.retry_count += 1
+            return None
+        self.seq = seq
+        return pickle.loads(data)
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='state-reader', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self.running and not self._attach():
+            time.sleep(1)
+        checked = time.monotonic()
+        while self.running:
+            if time.monotonic() - checked >= 1.0:
+                checked = time.monotonic()
+                if self._replaced():
+                    self.shm.close()
+                    while self.running and not self._attach():
+                        time.sleep(1)
+                    self.seq = 0
+                    self.reattach_count += 1
+            try:
+                state = self.read()
+                if state is not None:
+                    self.update_count += 1
+                    self.on_state(state)
+            except Exception as e:
+                log.error('state.read_failed', "Error reading shared state: {error}", error=e)
+            time.sleep(self.poll_interval)
+
+    def stop(self):
+        self.running = False
+        if self.shm:
+            self.shm.close()
+
+    def get_stats(self):
+        return {
+            'backend': 'shm',
+            'role': 'worker',
+            'pid': os.getpid(),
+            'segment': self.name,
+            'attached': self.shm is not None,
+            'sequence': self.seq,
+            'updates': self.update_count,
+            'retries': self.retry_count,
+            'reattaches': self.reattach_count
+        }
+
+
+def _authkey(authkey):
+    key = authkey or STATE_CONFIG['authkey']
+    if not key:
+        raise RuntimeError('STATE_AUTHKEY is not set (gunicorn.conf.py generates one per run)')
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+
+class ControlServer:
+    """Owner side: answers (command, kwargs) requests from workers on a local socket"""
+
+    def __init__(self, handlers, address=None, authkey=None, threads=None, timeout=None):
+        self.handlers = handlers
+        self.address = address or STATE_CONFIG['control_address']
+        self.authkey = _authkey(authkey)
+        self.timeout = timeout or STATE_CONFIG['control_timeout']
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        self._pool = ThreadPoolExecutor(max_workers=threads or STATE_CONFIG['control_threads'],
+                                        thread_name_prefix='state-control')
+        self._thread = threading.Thread(target=self._run, name='state-control-accept', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        log.info('state.control_listening', "Control socket listening on {address}", address=self.address)
+
+    def _run(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break
+            except Exception as e:
+                log.warning('state.control_rejected', "Rejected control connection: {error}", error=e)
+                continue
+            self._pool.submit(self._serve, conn)
+
+    def _serve(self, conn):
+        """Answer one request; a slow call only occupies its own pool thread"""
+        try:
+            try:
+                if not conn.poll(self.timeout):
+                    return
+                command, kwargs = conn.recv()
+                handler = self.handlers.get(command)
+                if handler is None:
+                    conn.send({'success': False, 'error': f'Unknown command: {command}'})
+                else:
+                    conn.send({'success': True, 'result': handler(**kwargs)})
+            except Exception as e:
+                try:
+                    conn.send({'success': False, 'error': str(e)})
+                except Exception:
+                    pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.listener.close()
+        self._pool.shutdown(wait=False)
+
+
+class ControlClient:
+    """Worker side: sends one command per connection to the owner"""
+
+    def __init__(self, address=None, authkey=None, timeout=None):
+        self.address = address or STATE_CONFIG['control_address']
+        self.authkey = _authkey(authkey)
+        self.timeout = timeout or STATE_CONFIG['control_timeout']
+
+    def call(self, command, **kwargs):
+        """Run a command in the owner process; raises RuntimeError on failure or TimeoutError"""
+        with Client(self.address, family='AF_UNIX', authkey=self.authkey) as conn:
+            conn.send((command, kwargs))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"No reply to '{command}' within {self.timeout} s")
+            reply = conn.recv()
+        if not reply['success']:
+            raise RuntimeError(reply['error'])
+        return reply['result']
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming per-device statistics and anomaly scoring
+- Welford running mean / variance and lifetime min / max
+- EWMA with an exponentially weighted variance (adapts to slow drift)
+- Rolling min / max over fixed time windows (monotonic deques, amortized O(1))
+Every reading updates its device in O(1); scalar estimators live in flat
+arrays indexed by device slot. A reading whose z-score against the EWMA
+(before the reading is applied) exceeds the threshold is flagged as an anomaly.
+"""
+
+import os
+import math
+import threading
+from array import array
+from collections import deque
+
+from pipeline import Stage
+from readings import Reading
+
+# Streaming statistics configuration - can be overridden by environment variables
+STATS_CONFIG = {
+    'ewma_alpha': float(os.getenv('STATS_EWMA_ALPHA', '0.05')),
+    'windows': [int(w) for w in os.getenv('STATS_WINDOWS', '300,3600').split(',') if w.strip()],  # seconds
+    'zscore': float(os.getenv('STATS_ZSCORE', '3.0')),
+    'min_samples': int(os.getenv('STATS_MIN_SAMPLES', '30')),  # readings before a device can be flagged
+    'anomaly_log_size': int(os.getenv('STATS_ANOMALY_LOG', '200'))
+}
+
+
+class StreamingStats:
+    """Per-device online estimators in flat arrays (one slot per device)"""
+
+    def __init__(self, alpha=None, windows=None, zscore=None, min_samples=None, anomaly_log_size=None):
+        self.alpha = alpha or STATS_CONFIG['ewma_alpha']
+        self.windows = list(windows or STATS_CONFIG['windows'])
+        self.zscore = zscore or STATS_CONFIG['zscore']
+        self.min_samples = STATS_CONFIG['min_samples'] if min_samples is None else min_samples
+
+        self.slots = {}  # device_id -> slot
+        self.devices = []  # slot -> DeviceDescriptor
+        self.count = array('q')
+        self.mean = array('d')
+        self.m2 = array('d')
+        self.minimum = array('d')
+        self.maximum = array('d')
+        self.ewma = array('d')
+        self.ewvar = array('d')
+        self.last = array('d')
+        self.last_z = array('d')
+        self.last_ts = array('d')
+        self.window_max = [[] for _ in self.windows]  # per window: slot -> deque of (ts, value), decreasing
+        self.window_min = [[] for _ in self.windows]  # per window: slot -> deque of (ts, value), increasing
+
+        self.anomalies = deque(maxlen=anomaly_log_size or STATS_CONFIG['anomaly_log_size'])
+        self.anomaly_count = 0
+        self.update_count = 0
+        self._lock = threading.Lock()  # one batch is applied atomically with respect to readers
+
+    def _slot(self, device):
+        slot = self.slots.get(device.device_id)
+        if slot is None:
+            slot = self.slots[device.device_id] = len(self.devices)
+            self.devices.append(device)
+            self.count.append(0)
+            for values in (self.mean, self.m2, self.ewma, self.ewvar, self.last, self.last_z, self.last_ts):
+                values.append(0.0)
+            self.minimum.append(math.inf)
+            self.maximum.append(-math.inf)
+            for per_window in self.window_max + self.window_min:
+                per_window.append(deque())
+        return slot
+
+    def update(self, slot, value, timestamp):
+        """Apply one reading; returns its z-score against the EWMA (0.0 until min_samples)"""
+        count = self.count[slot] + 1
+        self.count[slot] = count
+
+        # z-score against the state before this reading
+        z = 0.0
+        if count > self.min_samples and self.ewvar[slot] > 0.0:
+            z = (value - self.ewma[slot]) / math.sqrt(self.ewvar[slot])
+
+        # Welford
+        delta = value - self.mean[slot]
+        mean = self.mean[slot] + delta / count
+        self.mean[slot] = mean
+        self.m2[slot] += delta * (value - mean)
+        if value < self.minimum[slot]:
+            self.minimum[slot] = value
+        if value > self.maximum[slot]:
+            self.maximum[slot] = value
+
+        # EWMA and exponentially weighted variance
+        if count == 1:
+            self.ewma[slot] = value
+        else:
+            diff = value - self.ewma[slot]
+            increment = self.alpha * diff
+            self.ewma[slot] += increment
+            self.ewvar[slot] = (1.0 - self.alpha) * (self.ewvar[slot] + diff * increment)
+
+        # Rolling windows
+        for index, window in enumerate(self.windows):
+            cutoff = timestamp - window
+            for queue, keep in ((self.window_max[index][slot], value.__lt__),
+                                (self.window_min[index][slot], value.__gt__)):
+                while queue and not keep(queue[-1][1]):
+                    queue.pop()
+                queue.append((timestamp, value))
+                while queue[0][0] <= cutoff:
+                    queue.popleft()
+
+        self.last[slot] = value
+        self.last_z[slot] = z
+        self.last_ts[slot] = timestamp
+        return z
+
+    def apply(self, batch):
+        """Update every device in a batch; returns {index in batch: z} for anomalous readings"""
+        timestamp = batch.timestamp.timestamp()
+        flagged = {}
+        with self._lock:
+            for position, reading in enumerate(batch.readings):
+                z = self.update(self._slot(reading.device), float(reading.value), timestamp)
+                if abs(z) >= self.zscore:
+                    flagged[position] = z
+                    self.anomalies.append({
+                        'device_id': reading.device.device_id,
+                        'kind': reading.device.kind,
+                        'room_id': reading.device.room_id,
+                        'value': reading.value,
+                        'zscore': round(z, 3),
+                        'timestamp': batch.iso_timestamp
+                    })
+            self.anomaly_count += len(flagged)
+            self.update_count += 1
+        return flagged
+
+    def _device_stats(self, slot):
+        count = self.count[slot]
+        device = self.devices[slot]
+        z = self.last_z[slot]
+        return {
+            'device_id': device.device_id,
+            'kind': device.kind,
+            'room_id': device.room_id,
+            'count': count,
+            'last': self.last[slot],
+            'mean': round(self.mean[slot], 4),
+            'std': round(math.sqrt(self.m2[slot] / (count - 1)), 4) if count > 1 else 0.0,
+            'min': self.minimum[slot],
+            'max': self.maximum[slot],
+            'ewma': round(self.ewma[slot], 4),
+            'ewm_std': round(math.sqrt(self.ewvar[slot]), 4),
+            'windows': {str(window): {'min': self.window_min[index][slot][0][1],
+                                      'max': self.window_max[index][slot][0][1]}
+                        for index, window in enumerate(self.windows)},
+            'zscore': round(z, 3),
+            'anomaly': abs(z) >= self.zscore
+        }
+
+    def snapshot(self, device_ids=None, kind=None, anomalies_only=False):
+        """Current statistics for all (or the selected) devices plus the recent anomaly log"""
+        with self._lock:
+            if device_ids is not None:
+                slots = [self.slots[device_id] for device_id in device_ids if device_id in self.slots]
+            else:
+                slots = range(len(self.devices))
+            devices = [self._device_stats(slot) for slot in slots
+                       if self.count[slot] and (kind is None or self.devices[slot].kind == kind)
+                       and (not anomalies_only or abs(self.last_z[slot]) >= self.zscore)]
+            return {'devices': devices, 'recent_anomalies': list(self.anomalies)}
+
+    def get_stats(self):
+        return {
+            'devices': len(self.devices),
+            'updates': self.update_count,
+            'anomalies': self.anomaly_count,
+            'zscore_threshold': self.zscore,
+            'ewma_alpha': self.alpha,
+            'windows': self.windows
+        }
+
+
+class StatisticsStage(Stage):
+    """Updates StreamingStats and attaches the z-score to anomalous readings"""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def process(self, batch):
+        flagged = self.stats.apply(batch)
+        if not flagged:
+            return batch
+        # Annotated copies of the flagged readings; the incoming batch is left untouched
+        readings = list(batch.readings)
+        for position, z in flagged.items():
+            reading = readings[position]
+            readings[position] = Reading(reading.device, reading.value, reading.major_change, reading.extra,
+                                         anomaly=round(z, 3))
+        return batch.derive(readings)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(self.stats.get_stats())
+        return stats
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured, leveled and sampled logging
+- get_logger(component) returns an EventLogger; every message has a level, a
+  dotted event type (e.g. 'simulator.tick') and optional fields
+- Level checks and per-event sampling (LOG_SAMPLE: emit 1 of every N) happen in
+  the caller before any record is built
+- Records go through a bounded queue to one background thread that formats
+  them (message templates are filled in there) and writes JSON lines or the
+  classic '[Component] message' text to stdout; a full queue drops records
+  instead of blocking the caller
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from datetime import datetime
+
+# Logging configuration - can be overridden by environment variables
+LOG_CONFIG = {
+    'level': os.getenv('LOG_LEVEL', 'INFO').upper(),
+    'format': os.getenv('LOG_FORMAT', 'json').lower(),  # json | text
+    'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    'sample': os.getenv('LOG_SAMPLE', '')  # event=N,...: emit 1 of every N (0 = never)
+}
+
+# Per-tick messages are sampled unless LOG_SAMPLE overrides them (12 ticks = 1 minute at 5 s)
+DEFAULT_SAMPLE = {
+    'simulator.tick': 12,
+    'simulator.major_change_progress': 12
+}
+
+_ROOT = 'digitaltwin'
+
+
+def parse_sample(spec):
+    """'event=N,event=N' -> {event: N}"""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            event, rate = item.split('=', 1)
+            rates[event.strip()] = int(rate)
+    return rates
+
+
+class EventSampler:
+    """Counts occurrences per event type and lets 1 of every N through"""
+
+    def __init__(self, rates=None):
+        self.rates = dict(DEFAULT_SAMPLE, **(rates if rates is not None else parse_sample(LOG_CONFIG['sample'])))
+        self._counts = {}
+        self.suppressed = 0
+
+    def take(self, event):
+        """Sample weight for this occurrence (1 = unsampled event), or 0 to skip it"""
+        rate = self.rates.get(event)
+        if rate is None or rate == 1:
+            return 1
+        count = self._counts.get(event, 0)
+        self._counts[event] = count + 1  # approximate under concurrency, which sampling tolerates
+        if rate > 0 and count % rate == 0:
+            return rate
+        self.suppressed += 1
+        return 0
+
+
+def _message(record):
+    """Fill the message template with the record's fields"""
+    fields = getattr(record, 'fields', None)
+    if not fields:
+        return str(record.msg)
+    try:
+        return record.msg.format(**fields)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        return str(record.msg)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'component': getattr(record, 'component', record.name),
+            'event': getattr(record, 'event', None),
+            'message': _message(record)
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry['fields'] = fields
+        sampled = getattr(record, 'sampled', None)
+        if sampled:
+            entry['sampled'] = sampled  # this line stands for `sampled` occurrences
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The '[Component] message' lines the services always printed"""
+
+    def format(self, record):
+        text = f"[{getattr(record, 'component', record.name)}] {_message(record)}"
+        if record.levelno >= logging.WARNING:
+            text = f"{record.levelname}: {text}"
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread as they are; drops them when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._traceback = logging.Formatter()
+
+    def prepare(self, record):
+        # Formatting is left to the listener; only tracebacks must be rendered while they exist
+        if record.exc_info:
+            record.exc_text = self._traceback.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventLogger:
+    """Logger for one component ('[DB]', '[Pipeline]', ...)"""
+
+    __slots__ = ('component', '_logger')
+
+    def __init__(self, component):
+        self.component = component
+        self._logger = logging.getLogger(f'{_ROOT}.{component}')
+
+    def log(self, level, event, message, exc_info=False, **fields):
+        """Log `message` (a str.format template over `fields`) as event type `event`"""
+        if not self._logger.isEnabledFor(level):
+            return
+        weight = _sampler.take(event)
+        if not weight:
+            return
+        extra = {'component': self.component, 'event': event, 'fields': fields}
+        if weight > 1:
+            extra['sampled'] = weight
+        self._logger.log(level, message, extra=extra, exc_info=exc_info)
+
+    def debug(self, event, message, **fields):
+        self.log(logging.DEBUG, event, message, **fields)
+
+    def info(self, event, message, **fields):
+        self.log(logging.INFO, event, message, **fields)
+
+    def warning(self, event, message, **fields):
+        self.log(logging.WARNING, event, message, **fields)
+
+    def error(self, event, message, **fields):
+        self.log(logging.ERROR, event, message, **fields)
+
+    def exception(self, event, message, **fields):
+        """Error with the current exception's traceback"""
+        self.log(logging.ERROR, event, message, exc_info=True, **fields)
+
+
+_sampler = EventSampler()
+_handler = None
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def configure():
+    """Install the queue handler and start the writer thread (once per process)"""
+    global _handler, _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(TextFormatter() if LOG_CONFIG['format'] == 'text' else JsonFormatter())
+        _handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_CONFIG['queue_size']))
+        root = logging.getLogger(_ROOT)
+        root.setLevel(LOG_CONFIG['level'])
+        root.addHandler(_handler)
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(_handler.queue, stream)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(component):
+    configure()
+    return EventLogger(component)
+
+
+def get_stats():
+    return {
+        'level': LOG_CONFIG['level'],
+        'format': LOG_CONFIG['format'],
+        'queued': _handler.queue.qsize() if _handler else 0,
+        'dropped': _handler.dropped if _handler else 0,
+        'sampled_out': _sampler.suppressed,
+        'sample_rates': _sampler.rates
+    }
@@ -0,0 +1,28 @@
+import math
+
+import pytest
+
+import downsampling
+from downsampling import downsample_indices, effective_method
+
+TIMESTAMPS = list(range(1000))
+VALUES = [math.sin(t / 7) for t in TIMESTAMPS]
+
+
+@pytest.mark.parametrize('numpy_available', [True, False])
+@pytest.mark.parametrize('method', downsampling.METHODS)
+@pytest.mark.parametrize('points', [1, 2, 3, 4, 10, 50, 99, 999])
+def test_never_more_than_points(monkeypatch, numpy_available, method, points):
+    monkeypatch.setattr(downsampling, 'NUMPY_AVAILABLE', numpy_available and downsampling.NUMPY_AVAILABLE)
+    keep = downsample_indices(TIMESTAMPS, VALUES, points=points, method=method)
+    assert 0 < len(keep) <= points
+    assert keep == sorted(set(keep))
+    assert keep[0] == 0
+    if points >= 2:
+        assert keep[-1] == len(VALUES) - 1
+
+
+def test_without_numpy_even_spacing_is_reported(monkeypatch):
+    monkeypatch.setattr(downsampling, 'NUMPY_AVAILABLE', False)
+    assert len(downsample_indices(TIMESTAMPS, VALUES, points=10, method='minmax')) == 10
+    assert effective_method('minmax') == 'even'
@@ -0,0 +1,31 @@
+import gc
+
+from event_stream import EventBroadcaster
+
+
+def test_closing_unstarted_stream_frees_its_slot():
+    broadcaster = EventBroadcaster(max_subscribers=2)
+    first, second = broadcaster.stream(), broadcaster.stream()
+    assert broadcaster.stream() is None
+    assert broadcaster.subscribers == 2
+
+    first.close()
+    second.close()
+    assert broadcaster.subscribers == 0
+    assert broadcaster.stream() is not None
+
+
+def test_dropped_unstarted_stream_frees_its_slot():
+    broadcaster = EventBroadcaster(max_subscribers=1)
+    broadcaster.stream()  # response discarded before the body was sent
+    gc.collect()
+    assert broadcaster.subscribers == 0
+
+
+def test_closing_started_stream_frees_its_slot_once():
+    broadcaster = EventBroadcaster(max_subscribers=1)
+    events = broadcaster.stream()
+    assert b'event: snapshot' in next(events)
+    events.close()
+    events.close()
+    assert broadcaster.subscribers == 0
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from pipeline import DeadbandStage, ValidationStage
+from readings import DeviceDescriptor, ReadingBatch
+
+
+def test_string_values_become_floats_before_deadband():
+    device = DeviceDescriptor('temp-1', 'temperature', '°C', 'room-1', index=-1)
+    validation = ValidationStage()
+    deadband = DeadbandStage({'temperature': 0.5})
+
+    passed = []
+    for value in ('21.5', '21.6', '22.5', 'warm'):
+        batch = ReadingBatch(datetime.now())
+        batch.add(device, value)
+        batch = validation.process(batch)
+        for reading in batch:
+            assert reading.value == float(value) and isinstance(reading.value, float)
+        passed.extend(reading.value for reading in deadband.process(batch))
+
+    assert passed == [21.5, 22.5]
+    assert validation.invalid_count == 1
+
+
+def test_validation_leaves_incoming_batch_untouched():
+    device = DeviceDescriptor('co2-1', 'co2', 'ppm', 'room-1', index=-1)
+    batch = ReadingBatch(datetime.now())
+    batch.add(device, '450')
+    ValidationStage().process(batch)
+    assert batch.readings[0].value == '450'
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Building topology loader
+- Reads buildings -> floors -> rooms -> devices from JSON (or YAML if PyYAML is installed)
+- Per-kind defaults can be overridden per room and per device
+- Compiled once at startup into flat indexed arrays for the simulator, scheduler and API
+"""
+
+import os
+import json
+from array import array
+
+from readings import DeviceDescriptor
+from structured_log import get_logger
+
+log = get_logger('Topology')
+
+# Default topology file - can be overridden by environment variable
+TOPOLOGY_FILE = os.getenv('TOPOLOGY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topology.json'))
+
+# Per-kind simulation defaults (value = base + temp_coeff * (room_temp - temp_ref) +/- noise)
+KIND_DEFAULTS = {
+    'temperature': {'unit': '°C', 'base': 22.0, 'noise': 1.0, 'min': 15.0, 'max': 30.0, 'temp_coeff': 0.0, 'temp_ref': 0.0, 'decimals': 1},
+    'humidity': {'unit': '%', 'base': 45.0, 'noise': 0.6, 'min': 30.0, 'max': 60.0, 'temp_coeff': -1.5, 'temp_ref': 22.0, 'decimals': 1},
+    'co2': {'unit': 'ppm', 'base': 400.0, 'noise': 20.0, 'min': 350.0, 'max': 600.0, 'temp_coeff': 10.0, 'temp_ref': 20.0, 'decimals': 0},
+    'light': {'unit': 'lux', 'base': 800.0, 'noise': 200.0, 'min': 100.0, 'max': 1200.0, 'temp_coeff': 0.0, 'temp_ref': 0.0, 'decimals': 0},
+    'solar': {'unit': 'W', 'base': 120.0, 'noise': 20.0, 'min': 0.0, 'max': 1.0e9, 'temp_coeff': 0.0, 'temp_ref': 0.0, 'decimals': 1}
+}
+
+# Starting point for kinds that only appear in the topology file
+GENERIC_KIND = {'unit': '', 'base': 0.0, 'noise': 0.0, 'min': -1.0e9, 'max': 1.0e9, 'temp_coeff': 0.0, 'temp_ref': 0.0, 'decimals': 2}
+
+PARAM_NAMES = ('base', 'noise', 'min', 'max', 'temp_coeff', 'temp_ref')
+
+
+class Topology:
+    """Compiled topology: flat arrays indexed by device / room position"""
+
+    def __init__(self):
+        # Kinds
+        self.kinds = []                 # kind code -> kind name
+        self.kind_codes = {}            # kind name -> kind code
+
+        # Rooms (index = position in these lists)
+        self.rooms = []                 # room ids
+        self.room_index = {}            # room id -> room index
+        self.room_building = []         # building id per room
+        self.room_floor = []            # floor id per room
+        self.room_base_temps = array('d')
+        self.room_has_temperature = []  # rooms with a temperature device drive the temperature model
+        self.room_devices = []          # list of device indices per room
+
+        # Devices (index = DeviceDescriptor.index)
+        self.devices = []               # DeviceDescriptor per device
+        self.device_index = {}          # device id -> device index
+        self.device_kind = array('b')
+        self.device_room = array('i')
+        self.base = array('d')
+        self.noise = array('d')
+        self.min_value = array('d')
+        self.max_value = array('d')
+        self.temp_coeff = array('d')
+        self.temp_ref = array('d')
+        self.decimals = array('b')
+
+        # Secondary groupings
+        self.kind_devices = {}          # kind name -> list of device indices
+        self.building_rooms = {}        # building id -> list of room indices
+
+    @property
+    def device_count(self):
+        return len(self.devices)
+
+    @property
+    def room_count(self):
+        return len(self.rooms)
+
+    def get_device(self, device_id):
+        """Descriptor for a device id, or None"""
+        index = self.device_index.get(device_id)
+        return self.devices[index] if index is not None else None
+
+    def devices_in_room(self, room_id):
+        index = self.room_index.get(room_id)
+        if index is None:
+            return []
+        return [self.devices[i] for i in self.room_devices[index]]
+
+    def devices_of_kind(self, kind):
+        return [self.devices[i] for i in self.kind_devices.get(kind, ())]
+
+    def devices_in_building(self, building_id):
+        return [self.devices[i]
+                for room in self.building_rooms.get(building_id, ())
+                for i in self.room_devices[room]]
+
+    def summary(self):
+        """Compact description for the API"""
+        buildings = {}
+        for room, room_id in enumerate(self.rooms):
+            floors = buildings.setdefault(self.room_building[room], {})
+            floors.setdefault(self.room_floor[room], []).append({
+                'room_id': room_id,
+                'devices': [self.devices[i].device_id for i in self.room_devices[room]]
+            })
+        return {
+            'total_devices': self.device_count,
+            'total_rooms': self.room_count,
+            'kinds': {kind: len(indices) for kind, indices in self.kind_devices.items()},
+            'buildings': [
+                {'building_id': building, 'floors': [{'floor_id': floor, 'rooms': rooms} for floor, rooms in floors.items()]}
+                for building, floors in buildings.items()
+            ]
+        }
+
+
+def _merge_params(kind_params, room_params, device_spec):
+    params = dict(kind_params)
+    params.update(room_params)
+    params.update(device_spec.get('params', {}))
+    for key in PARAM_NAMES + ('unit', 'decimals'):
+        if key in device_spec:
+            params[key] = device_spec[key]
+    return params
+
+
+def compile_topology(config):
+    """Compile a topology config dict into a Topology"""
+    topo = Topology()
+
+    kind_params = {kind: dict(defaults) for kind, defaults in KIND_DEFAULTS.items()}
+    for kind, overrides in config.get('kinds', {}).items():
+        kind_params.setdefault(kind, dict(GENERIC_KIND)).update(overrides)
+
+    for kind in kind_params:
+        topo.kind_codes[kind] = len(topo.kinds)
+        topo.kinds.append(kind)
+        topo.kind_devices[kind] = []
+
+    for building in config.get('buildings', []):
+        building_id = building['id']
+        building_rooms = topo.building_rooms.setdefault(building_id, [])
+
+        for floor in building.get('floors', []):
+            floor_id = floor.get('id', '')
+
+            for room in floor.get('rooms', []):
+                room_id = room['id']
+                if room_id in topo.room_index:
+                    raise ValueError(f"Duplicate room id in topology: {room_id}")
+                room_idx = len(topo.rooms)
+                topo.room_index[room_id] = room_idx
+                topo.rooms.append(room_id)
+                topo.room_building.append(building_id)
+                topo.room_floor.append(floor_id)
+                topo.room_base_temps.append(float(room.get('base_temperature', KIND_DEFAULTS['temperature']['base'])))
+                topo.room_has_temperature.append(False)
+                topo.room_devices.append([])
+                building_rooms.append(room_idx)
+                room_params = room.get('params', {})
+
+                for spec in room.get('devices', []):
+                    device_id = spec['id']
+                    kind = spec['kind']
+                    if kind not in kind_params:
+                        raise ValueError(f"Unknown sensor kind '{kind}' for device {device_id}")
+                    if device_id in topo.device_index:
+                        raise ValueError(f"Duplicate device id in topology: {device_id}")
+
+                    params = _merge_params(kind_params[kind], room_params, spec)
+                    index = len(topo.devices)
+                    topo.devices.append(DeviceDescriptor(device_id, kind, params['unit'], room_id, index))
+                    topo.device_index[device_id] = index
+                    topo.device_kind.append(topo.kind_codes[kind])
+                    topo.device_room.append(room_idx)
+                    topo.base.append(float(params['base']))
+                    topo.noise.append(float(params['noise']))
+                    topo.min_value.append(float(params['min']))
+                    topo.max_value.append(float(params['max']))
+                    topo.temp_coeff.append(float(params['temp_coeff']))
+                    topo.temp_ref.append(float(params['temp_ref']))
+                    topo.decimals.append(int(params['decimals']))
+                    topo.room_devices[room_idx].append(index)
+                    topo.kind_devices[kind].append(index)
+                    if kind == 'temperature':
+                        topo.room_has_temperature[room_idx] = True
+
+    return topo
+
+
+def default_topology_config(room_count=5):
+    """Built-in layout: N rooms with temp/humidity/co2/light plus one solar plant"""
+    base_temps = [22.0, 21.5, 23.0, 22.5, 21.0]
+    rooms = []
+    for room_id in range(1, room_count + 1):
+        rooms.append({
+            'id': f'room{room_id}',
+            'base_temperature': base_temps[(room_id - 1) % len(base_temps)],
+            'devices': [
+                {'id': f'temp-{room_id}', 'kind': 'temperature'},
+                {'id': f'hum-{room_id}', 'kind': 'humidity'},
+                {'id': f'co2-{room_id}', 'kind': 'co2'},
+                {'id': f'light-{room_id}', 'kind': 'light'}
+            ]
+        })
+    return {
+        'buildings': [
+            {'id': 'main', 'floors': [{'id': 'floor1', 'rooms': rooms}]},
+            {'id': 'site', 'floors': [{'id': 'ground', 'rooms': [
+                {'id': 'solar-farm', 'devices': [{'id': 'solar-plant', 'kind': 'solar'}]}
+            ]}]}
+        ]
+    }
+
+
+def load_topology(path=None):
+    """Load and compile the topology file (falls back to the built-in layout)"""
+    path = path or TOPOLOGY_FILE
+    if not os.path.exists(path):
+        log.info('topology.default', "{path} not found, using built-in layout", path=path)
+        return compile_topology(default_topology_config())
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to load YAML topology files")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    topo = compile_topology(config)
+    log.info('topology.loaded', "Loaded {devices} devices in {rooms} rooms from {path}",
+             devices=topo.device_count, rooms=topo.room_count, path=path)
+    return topo